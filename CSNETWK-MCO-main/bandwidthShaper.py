@@ -0,0 +1,289 @@
+'''
+    Bandwidth Shaper
+    This module contains the rate limiting of file transfers in the File
+    Exchange System server. Token buckets cap the bytes per second of the
+    whole server and of each alias. Under the server-wide limit, transfers
+    take turns in weighted fair order: every grant is tagged with its
+    alias's virtual finish time, so an alias that has sent little recently
+    goes ahead of bulk transfers and aliases with a higher weight get a
+    bigger share of what remains.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import asyncio                      # For waiting in the asyncio engine
+import heapq                        # For the fair queue
+import itertools                    # For breaking ties between equal tags
+import threading                    # For the shaper lock
+import time                         # For refilling the buckets
+
+
+# Global Variables
+BURST_SECONDS       = 0.25          # Seconds of a bucket's rate it may save up while idle
+MIN_BURST           = 256 * 1024    # Smallest bucket, so one step of a transfer always fits
+MIN_POLL            = 0.002         # Shortest wait before a queued grant is tried again
+PRUNE_SIZE          = 1024          # Aliases tracked before idle ones are forgotten
+
+
+class TokenBucket:
+    """
+    Bytes allowed at rate per second, saving up to burst bytes while idle.
+    Takes may overdraw the bucket; the deficit is the wait before the
+    bytes taken may go out.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(MIN_BURST, rate * BURST_SECONDS)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, count, now):
+        """
+        Returns the seconds to wait before count bytes may be sent
+        """
+        self.refill(now)
+        self.tokens -= count
+
+        return max(0.0, -self.tokens / self.rate)
+
+    def getWait(self, now):
+        # Seconds until the bucket is out of debt
+        self.refill(now)
+
+        return max(0.0, -self.tokens / self.rate)
+
+    def isFull(self, now):
+        self.refill(now)
+
+        return self.tokens >= self.burst
+
+
+class Grant:
+    """One step of a transfer waiting in the fair queue."""
+
+    __slots__ = ("tag", "order", "start", "count", "granted", "cancelled")
+
+    def __init__(self, tag, order, start, count):
+        self.tag = tag
+        self.order = order
+        self.start = start
+        self.count = count
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.tag, self.order) < (other.tag, other.order)
+
+
+class BandwidthShaper:
+    """
+    Rate limits for the bytes of transfers, for the whole server and for
+    each alias, with weighted fair queueing under the server-wide limit
+
+    Parameters:
+    - rate: Bytes per second for all transfers together (0 for no limit)
+    - alias_rate: Bytes per second for each alias (0 for no limit)
+    - alias_rates: Dictionary of alias to its own bytes per second, overriding alias_rate
+    - weights: Dictionary of alias to its share of the server-wide limit (default 1)
+    """
+
+    def __init__(self, rate=0, alias_rate=0, alias_rates=None, weights=None):
+        self.rate = rate
+        self.alias_rate = alias_rate
+        self.alias_rates = alias_rates or {}
+        self.weights = weights or {}
+        self._bucket = TokenBucket(rate) if rate > 0 else None
+        self._alias_buckets = {}
+        self._finish = {}           # Virtual finish time of each alias's last grant
+        self._virtual_time = 0.0
+        self._queue = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._granted = threading.Condition(self._lock)
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.shaped_bytes = 0
+
+    # Buckets
+    def _getAliasBucket(self, alias):
+        rate = self.alias_rates.get(alias, self.alias_rate)
+
+        if rate <= 0:
+            return None
+
+        bucket = self._alias_buckets.get(alias)
+
+        if bucket is None:
+            bucket = self._alias_buckets[alias] = TokenBucket(rate)
+
+        return bucket
+
+    def _prune(self, now):
+        # Aliases whose buckets are full and who are not ahead of the queue are like new ones
+        for alias in [alias for alias, bucket in self._alias_buckets.items() if bucket.isFull(now)]:
+            del self._alias_buckets[alias]
+
+        for alias in [alias for alias, finish in self._finish.items() if finish <= self._virtual_time]:
+            del self._finish[alias]
+
+    # Fair queue
+    def _enqueue(self, alias, count):
+        start = max(self._virtual_time, self._finish.get(alias, 0.0))
+        finish = start + count / self.weights.get(alias, 1)
+        self._finish[alias] = finish
+
+        grant = Grant(finish, next(self._order), start, count)
+        heapq.heappush(self._queue, grant)
+
+        return grant
+
+    def _tryGrant(self, grant, now):
+        """
+        Grants the step if it leads the queue and the server-wide bucket is
+        out of debt
+
+        Returns:
+        - 0 if granted, otherwise the seconds to wait before trying again
+        """
+        while self._queue and self._queue[0].cancelled:
+            heapq.heappop(self._queue)
+
+        if self._queue[0] is not grant:
+            return max(MIN_POLL, self._bucket.getWait(now))
+
+        wait = self._bucket.getWait(now)
+
+        if wait > 0:
+            return wait
+
+        heapq.heappop(self._queue)
+        self._bucket.take(grant.count, now)
+        self._virtual_time = max(self._virtual_time, grant.start)
+        grant.granted = True
+
+        return 0
+
+    def _cancel(self, grant):
+        # A waiter that gave up must not hold up the ones behind it
+        if not grant.granted:
+            grant.cancelled = True
+
+    # Throttling
+    def _reserve(self, alias, count, wait):
+        """
+        Charges count bytes to the alias's bucket and, when not waiting, to
+        the server-wide one
+
+        Returns:
+        - A tuple of (seconds to wait for the alias's bucket, whether the
+          bytes must then wait their turn in the fair queue)
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            self.shaped_bytes += count
+
+            if len(self._alias_buckets) + len(self._finish) > PRUNE_SIZE:
+                self._prune(now)
+
+            bucket = self._getAliasBucket(alias)
+            delay = bucket.take(count, now) if bucket is not None else 0.0
+
+            if not wait:
+                if self._bucket is not None:
+                    self._bucket.take(count, now)
+                return 0.0, False
+
+            return delay, self._bucket is not None
+
+    def throttle(self, alias, count, wait=True):
+        """
+        Blocks until count more bytes of a transfer by alias may go out
+
+        Parameters:
+        - alias: Alias the transfer belongs to
+        - count: Bytes about to be (or just) sent or received
+        - wait: False to charge the bytes without waiting, for small transfers
+        """
+        if count <= 0:
+            return
+
+        started = time.monotonic()
+        delay, queued = self._reserve(alias, count, wait)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        # Only bytes the alias's own limit lets through join the fair queue
+        if queued:
+            with self._granted:
+                grant = self._enqueue(alias, count)
+
+                try:
+                    while True:
+                        retry = self._tryGrant(grant, time.monotonic())
+                        if retry == 0:
+                            break
+                        self._granted.wait(retry)
+                finally:
+                    self._cancel(grant)
+
+                # The next grant in the queue may be due now
+                self._granted.notify_all()
+
+        self._recordWait(time.monotonic() - started)
+
+    async def throttleAsync(self, alias, count, wait=True):
+        """
+        Same as throttle, for a coroutine of the asyncio engine
+        """
+        if count <= 0:
+            return
+
+        started = time.monotonic()
+        delay, queued = self._reserve(alias, count, wait)
+
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if queued:
+            with self._lock:
+                grant = self._enqueue(alias, count)
+
+            try:
+                while True:
+                    with self._granted:
+                        retry = self._tryGrant(grant, time.monotonic())
+                        if retry == 0:
+                            self._granted.notify_all()
+                            break
+                    await asyncio.sleep(retry)
+            finally:
+                with self._lock:
+                    self._cancel(grant)
+
+        self._recordWait(time.monotonic() - started)
+
+    def _recordWait(self, seconds):
+        if seconds > MIN_POLL:
+            with self._lock:
+                self.waits += 1
+                self.wait_seconds += seconds
+
+    def getStats(self):
+        """
+        Returns a dictionary of bytes shaped, waits, seconds spent waiting
+        and steps in the fair queue
+        """
+        return {"bytes": self.shaped_bytes, "waits": self.waits, "wait_seconds": self.wait_seconds,
+                "queued": len(self._queue)}
@@ -0,0 +1,151 @@
+'''
+    Buffer Budget
+    This module contains the server-wide limit on the bytes the File
+    Exchange System server holds in memory for transfers in flight. Every
+    chunk read from a client, and every block compressed or queued for a
+    client, is charged to the budget while it is held. Once the budget is
+    spent, transfers wait for it before reading from their sockets again,
+    so TCP flow control slows the senders instead of the server allocating
+    more.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import asyncio                      # For waiting in the asyncio engine
+import threading                    # For the budget lock
+import time                         # For timing waits
+from collections import deque       # For the transfers waiting in line
+from contextlib import contextmanager   # For holding bytes over a block of code
+
+
+# Global Variables
+MIN_POLL            = 0.001         # First wait of a coroutine for the budget, doubled each time
+MAX_POLL            = 0.05          # Longest wait of a coroutine before it checks again
+
+
+class BufferBudget:
+    """
+    Bytes of transfer buffers the server may hold at once, handed out in
+    the order they were asked for so a busy transfer cannot keep taking
+    back what it just released while others wait
+
+    A single request larger than the whole budget is let through once
+    nothing else is held, so it can never wait forever.
+
+    Parameters:
+    - capacity: Bytes that may be held at once
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.used = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self._waiting = deque()     # Byte counts waiting, first in line first
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    def _fits(self, count):
+        return self.used + count <= self.capacity or self.used == 0
+
+    def _takeTurn(self, ticket, started):
+        # Called with the lock held; takes the bytes if the ticket is first in line and they fit
+        if self._waiting[0] is not ticket or not self._fits(ticket[0]):
+            return False
+
+        self._waiting.popleft()
+        self.used += ticket[0]
+        self.waits += 1
+        self.wait_seconds += time.monotonic() - started
+
+        # The next in line may fit as well
+        self._released.notify_all()
+
+        return True
+
+    def _leaveLine(self, ticket):
+        # A waiter that gave up must not hold up the ones behind it; tickets
+        # asking for the same count are equal, so the search is by identity
+        for index, waiting in enumerate(self._waiting):
+            if waiting is ticket:
+                del self._waiting[index]
+                self._released.notify_all()
+                break
+
+    def acquire(self, count):
+        """
+        Blocks until count bytes can be held, then holds them
+        """
+        with self._released:
+            if not self._waiting and self._fits(count):
+                self.used += count
+                return
+
+            started = time.monotonic()
+            ticket = [count]
+            self._waiting.append(ticket)
+
+            try:
+                while not self._takeTurn(ticket, started):
+                    self._released.wait()
+            finally:
+                self._leaveLine(ticket)
+
+    async def acquireAsync(self, count):
+        """
+        Same as acquire, for a coroutine of the asyncio engine
+        """
+        with self._lock:
+            if not self._waiting and self._fits(count):
+                self.used += count
+                return
+
+            started = time.monotonic()
+            ticket = [count]
+            self._waiting.append(ticket)
+
+        # Releases come from executor threads as well as the loop, so the coroutine polls
+        delay = MIN_POLL
+
+        try:
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(MAX_POLL, delay * 2)
+
+                with self._lock:
+                    if self._takeTurn(ticket, started):
+                        return
+        finally:
+            with self._lock:
+                self._leaveLine(ticket)
+
+    def release(self, count):
+        with self._released:
+            self.used -= count
+            self._released.notify_all()
+
+    @contextmanager
+    def hold(self, count):
+        self.acquire(count)
+
+        try:
+            yield
+        finally:
+            self.release(count)
+
+    def getStats(self):
+        """
+        Returns a dictionary of the capacity, bytes held, transfers waiting,
+        waits and seconds spent waiting
+        """
+        return {"capacity": self.capacity, "used": self.used, "waiting": self.waiting, "waits": self.waits,
+                "wait_seconds": self.wait_seconds}
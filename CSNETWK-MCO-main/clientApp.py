@@ -2,7 +2,8 @@
 Client Application
 This script serves as the client application for the File Exchange System. It provides
 a user interface for interacting with the system, connecting to a server, and performing
-various file-related operations.
+various file-related operations. Run with arguments, it performs one command from the
+command line instead, without loading the GUI.
 
 CSNETWK S16 Group
 - ABENOJA, Amelia Joyce L.
@@ -11,17 +12,26 @@ CSNETWK S16 Group
 """
 
 # Imports
+import argparse                     # For command-line options
+import json                         # For showing /stats
 import socket                       # For socket programming
 import os                           # For file-related operations
-import tkinter as tk                # For GUI
+import queue                        # For passing work between the GUI and the network thread
+import sys                          # For command-line arguments and the exit status
+import threading                    # For the network thread
+import time                         # For showing modification times
+
+import protocol                     # For message framing
+import compression                  # For compressed transfers
+from fileExchangeClient import FileExchangeClient, TransferCancelled, hasPattern   # For the protocol
 
 # Global Variables
-BUFFER_SIZE     = 4096      # Size of the message buffer
-is_connected    = False     # Connection status default to False (not connected)
-server_address  = None      # Initialize server address
-server_port     = None      # Initialize server port
 console_width   = 80        # Console width for formatting purposes
-client_socket   = None      # Initialize client socket
+client          = FileExchangeClient()  # Connection driven by the GUI
+command_queue   = queue.Queue() # Commands waiting for the network thread
+output_queue    = queue.Queue() # Messages waiting to be shown by the GUI
+POLL_INTERVAL   = 100       # Milliseconds between GUI checks for output and progress
+
 
 # Function Definitions
 def displayWelcomeMessage():
@@ -37,17 +47,37 @@ def displayCommands():
         "- To disconnect to the server application          : /leave",
         "- To register a unique handle or alias             : /register <handle>",
         "- To send file to server                           : /store <filename>",
+        "- To send several files or patterns (e.g. *.csv)   : /store <filename|pattern> ...",
         "- To request directory file list from a server     : /dir",
         "- To fetch a file from the a server                : /get <filename>",
+        "- To fetch several files or patterns               : /get <filename|pattern> ...",
+        "- To choose the transfer compression codec         : /compress <zlib|lzma|bz2|off> [level]",
+        "- To split each /get across parallel connections   : /segments <count>",
+        "- To show the server's metrics (on its own host)   : /stats",
         "- To request command help to output all"
         "  Input Syntax commands for references             : /?"
     ]
 
     return all_commands
 
-def toServer(txtCommand, txtOutput):
+def showBatchResults(verb, results, stats, txtOutput):
+    for name, header in results:
+        update_output(f"{name}: {header.get('message', '')}", txtOutput)
+
+    succeeded = sum(1 for _, header in results if header.get("status") == "ok")
+    update_output(f"{verb} {succeeded} of {len(results)} files, {stats.summary()}", txtOutput)
+
+def showCancelled(txtOutput):
+    # The client has already replaced the connection the cancelled transfer left unfinished frames on
+    update_output("Transfer cancelled.", txtOutput)
+
+    if not client.connected:
+        update_output("Error: Reconnecting after the cancelled transfer failed. Please /join again.", txtOutput)
+
+def toServer(command, txtOutput):
     """
-    Sends a command to the server
+    Sends a command to the server. Runs on the network thread, never on
+    the GUI thread.
 
     Parameters:
     - command: Command to be sent to the server
@@ -55,14 +85,6 @@ def toServer(txtCommand, txtOutput):
     Returns:
     - None
     """
-    global is_connected
-    global server_address
-    global server_port
-    global client_socket
-
-    # Get the command from the text widget
-    command = txtCommand.get("1.0", tk.END).strip()
-    
     # Check if the command is valid
     if not command.startswith('/'):
         print("Error: Command not found.")
@@ -77,78 +99,63 @@ def toServer(txtCommand, txtOutput):
     print("Parameters: ", params)
 
     if command == "/join":
-        if is_connected:
+        if client.connected:
             # print("Error: Connection to the server is already established.")
             update_output("Error: Connection to the server is already established.", txtOutput)
-        elif not is_connected:
+        elif not client.connected:
             if len(params) != 2:
                 # print("Error: Command parameters do not match or are not allowed.")
                 update_output("Error: Command parameters do not match or are not allowed.", txtOutput)
             else:
                 try:
-                    # Set-up the TCP socket
-                    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
                     # Get server address and port number
                     server_address = params[0]
                     server_port = int(params[1])
 
                     if server_port < 0 or server_port > 65535:
                         raise ValueError
-                    
+
                     # Connect to the server
-                    client_socket.connect((server_address, server_port))
-                    server_response = client_socket.recv(BUFFER_SIZE).decode()
+                    header = client.connect(server_address, server_port)
+                    server_response = header.get("message", "")
 
-                    is_connected = True
                     # print(server_response)
                     update_output(server_response, txtOutput)
-                    
-                except (socket.error, ValueError) as e:
+
+                except (socket.error, ValueError, protocol.ProtocolError) as e:
                     # print("Error: Connection to the Server has failed! Please check IP Address and Port Number")
                     update_output("Error: Connection to the Server has failed! Please check IP Address and Port Number", txtOutput)
 
     elif command == "/leave":
-        if is_connected:
+        if client.connected:
             if len(params) == 0:
                 try:
-                    # Send the '/leave' command to the server
-                    client_socket.send(command.encode())
-
-                    # Receive a message from the server
-                    server_response = client_socket.recv(BUFFER_SIZE).decode()
+                    # Send the '/leave' command to the server and close the socket
+                    header = client.leave()
+                    server_response = header.get("message", "")
                     # print(server_response)
                     update_output(server_response, txtOutput)
 
-                    is_connected = False
-                    client_socket.close()   # close the socket
-
                 except Exception as e:
                     # print("Error: Disconnection failed. Please connect to the server first.")
                     update_output("Error: Disconnection failed. Please connect to the server first.", txtOutput)
             else:
                 # print("Error: Command parameters do not match or are not allowed.")
                 update_output("Error: Command parameters do not match or are not allowed.", txtOutput)
-        elif not is_connected:
+        elif not client.connected:
             # print("Error: Disconnection failed. Please connect to the server first.")
             update_output("Error: Disconnection failed. Please connect to the server first.", txtOutput)
 
     elif command == "/register":
-        if is_connected:
+        if client.connected:
             if len(params) != 1:
                 # print("Error: Command parameters do not match or is not allowed.")
                 update_output("Error: Command parameters do not match or is not allowed.", txtOutput)
             else:
                 try:
-                    # Get the handle or alias
-                    alias = params[0]
-
-                    # Send the command and handle (or alias) to the server
-                    client_socket.send(command.encode())
-                    client_socket.send(alias.encode())
-
-                    # Receive a message from the server
-                    server_response = client_socket.recv(BUFFER_SIZE).decode()
+                    # Send the handle (or alias) to the server, with the last session's token
+                    header = client.register(params[0])
+                    server_response = header.get("message", "")
                     # print(server_response)
                     update_output(server_response, txtOutput)
 
@@ -156,13 +163,13 @@ def toServer(txtCommand, txtOutput):
                     # print("Error: Registration Failed. Please enter a handle or alias!")
                     update_output("Error: Registration Failed. Please enter a handle or alias!", txtOutput)
 
-        elif not is_connected:
+        elif not client.connected:
             # print("Error: Disconnection failed. Please connect to the server first.")
             update_output("Error: Disconnection failed. Please connect to the server first.", txtOutput)
 
     elif command == "/store":
-        if is_connected:
-            if len(params) != 1:
+        if client.connected:
+            if len(params) == 0:
                 # print("Error: Command parameters do not match or is not allowed. /store cmd client")
                 update_output("Error: Command parameters do not match or is not allowed. /store cmd client", txtOutput)
             else:
@@ -170,8 +177,17 @@ def toServer(txtCommand, txtOutput):
                     # Get the filename
                     filename = params[0]
 
+                    # Several files or patterns are uploaded as one pipelined batch
+                    if len(params) > 1 or hasPattern(filename):
+                        results, stats = client.storeMany(params)
+
+                        if not results:
+                            update_output("Error: File does not exist.", txtOutput)
+                        else:
+                            showBatchResults("Stored", results, stats, txtOutput)
+
                     # Check if file exists in local directory
-                    if not os.path.exists(filename):
+                    elif not os.path.exists(filename):
                         # print("Error: File does not exist.")
                         update_output("Error: File does not exist.", txtOutput)
                         # print("Client: ", os.getcwd())
@@ -179,97 +195,125 @@ def toServer(txtCommand, txtOutput):
                         file_path = os.path.join(os.getcwd(), filename)
                         # print("Client File Path: ", file_path)
 
-                        # open the file
-                        f = open(file_path, 'rb')
-                        file_data = f.read()
-                        f.close()
-
-                        # Send the command and filename to the server
-                        client_socket.send(command.encode())
-                        client_socket.send(filename.encode())
-
-                        client_socket.sendall(file_data)
-
-                        # Receive a message from the server
-                        server_response = client_socket.recv(BUFFER_SIZE).decode()
+                        # Send the command, filename and file contents to the server
+                        header = client.store(file_path, os.path.basename(filename))
+                        server_response = header.get("message", "")
                         # print(server_response)
                         update_output(server_response, txtOutput)
 
+                        if header.get("status") == "ok" and client.last_transfer_stats:
+                            update_output("Sent " + client.last_transfer_stats.summary(), txtOutput)
+
+                except TransferCancelled:
+                    showCancelled(txtOutput)
                 except Exception as e:
                     # print("Error: Storing failed. Please enter a filename!")
                     update_output("Error: Storing failed. Please enter a filename!", txtOutput)
 
-        elif not is_connected:
+        elif not client.connected:
             # print("Error: Storing failed. Please connect to the server first.")
             update_output("Error: Storing failed. Please connect to the server first.", txtOutput)
-    
+
     elif command == "/dir":
-        if is_connected:
+        if client.connected:
             if len(params) != 0:
                 # print("Error: Command parameters do not match or are not allowed.")
                 update_output("Error: Command parameters do not match or are not allowed.", txtOutput)
             else:
                 try:
-                    # Send the command to the server
-                    client_socket.send(command.encode())
-
-                    # Receive and print file names until "DONE" is received
+                    header, names = client.dir()
                     # print("Server directory:")
                     update_output("Server directory:", txtOutput)
-                    while True:
-                        file_name = client_socket.recv(BUFFER_SIZE).decode()
-                        if file_name == "DONE":
-                            break
-
-                        # Print each file name in the server directory
-                        # print(file_name)
-                        update_output(file_name, txtOutput)
+                    update_output(header.get("message", "") + "\n" + "\n".join(names), txtOutput)
 
                 except Exception as e:
                     # print("Error: Directory request failed. Please connect to the server first.")
                     update_output("Error: Directory request failed. Please connect to the server first.", txtOutput)
-        
-        elif not is_connected:
+
+        elif not client.connected:
             # print("Error: Directory request failed. Please connect to the server first.")
             update_output("Error: Directory request failed. Please connect to the server first.", txtOutput)
 
+    elif command == "/stats":
+        if client.connected:
+            try:
+                header, stats = client.stats()
+                update_output(header.get("message", ""), txtOutput)
+
+                if stats is not None:
+                    update_output(json.dumps(stats, indent=2), txtOutput)
+            except Exception as e:
+                update_output("Error: Statistics request failed.", txtOutput)
+        else:
+            update_output("Error: Statistics request failed. Please connect to the server first.", txtOutput)
+
     elif command == "/get":
-        if is_connected:
-            if len(params) != 1:
+        if client.connected:
+            if len(params) == 0:
                 # print("Error: Command parameters do not match or is not allowed.")
                 update_output("Error: Command parameters do not match or is not allowed.", txtOutput)
+            elif len(params) > 1 or hasPattern(params[0]):
+                # Several files or patterns are downloaded as one pipelined batch
+                try:
+                    results, stats = client.getMany(params)
+
+                    if not results:
+                        update_output("Error: File not found in the server.", txtOutput)
+                    else:
+                        showBatchResults("Received", results, stats, txtOutput)
+                except TransferCancelled:
+                    showCancelled(txtOutput)
+                except Exception as e:
+                    update_output("Error: Getting files failed.", txtOutput)
             else:
                 try:
                     # Get the filename
                     filename = params[0]
 
-                    # Send the command and filename to the server
-                    client_socket.send(command.encode())
-                    client_socket.send(filename.encode())
+                    # Send the command and filename to the server and save the file it sends back
+                    header, segment_stats = client.get(filename)
 
-                    # Receive a message from the server
-                    server_response = client_socket.recv(BUFFER_SIZE).decode()
+                    server_response = header.get("message", "")
                     # print(server_response)
                     update_output(server_response, txtOutput)
 
-                    # Now, receive the file data from the server
-                    file_data = client_socket.recv(BUFFER_SIZE)
+                    if header.get("status") == "ok":
+                        # print("File received from Server: " + filename)
+                        update_output("File received from Server: " + filename, txtOutput)
 
-                    # Save the received file data to a local file
-                    file_path = os.path.join(os.getcwd(), filename)
-                    with open(file_path, 'wb') as f:
-                        f.write(file_data)
+                        for index, stats in enumerate(segment_stats, 1):
+                            update_output(f"Segment {index}: " + stats.summary(), txtOutput)
 
-                    # print("File received from Server: " + filename)
-                    update_output("File received from Server: " + filename, txtOutput)
+                        update_output("Received " + client.last_transfer_stats.summary(), txtOutput)
+                except TransferCancelled:
+                    showCancelled(txtOutput)
                 except Exception as e:
                         # print("Error: Getting file failed. Please enter a filename!")
                         update_output("Error: Getting file failed. Please enter a filename!", txtOutput)
 
-        elif not is_connected:
+        elif not client.connected:
             # print("Error: Getting file failed. Please connect to the server first.")
             update_output("Error: Getting file failed. Please connect to the server first.", txtOutput)
 
+    elif command == "/compress":
+        # Choose the codec (and level) offered to the server for /store and /get
+        if len(params) not in (1, 2) or (params[0] != "off" and params[0] not in compression.CODECS):
+            update_output("Error: Command parameters do not match or is not allowed.", txtOutput)
+        elif len(params) == 2 and not params[1].isdigit():
+            update_output("Error: Command parameters do not match or is not allowed.", txtOutput)
+        else:
+            client.compression_codec = None if params[0] == "off" else params[0]
+            client.compression_level = int(params[1]) if len(params) == 2 else None
+            update_output(f"Compression: {client.compression_codec or 'off'}", txtOutput)
+
+    elif command == "/segments":
+        # Choose how many connections each /get is split across
+        if len(params) != 1 or not params[0].isdigit() or int(params[0]) < 1:
+            update_output("Error: Command parameters do not match or is not allowed.", txtOutput)
+        else:
+            client.segments = int(params[0])
+            update_output(f"Segments: {client.segments}", txtOutput)
+
     elif command == "/?":
         # displayCommands()
         all_commands = displayCommands()
@@ -285,17 +329,185 @@ def toServer(txtCommand, txtOutput):
 
 
 def update_output(message, txtOutput):
+    # Tk widgets may only be touched by the GUI thread, which shows queued messages when it polls
+    output_queue.put(message)
+
+
+def show_output(message, txtOutput):
+    import tkinter as tk
+
     txtOutput.configure(state=tk.NORMAL)        # Enable editing of the widget
     txtOutput.insert(tk.END, message + '\n')    # Insert the string at the end
     txtOutput.configure(state=tk.DISABLED)      # Disable editing of the widget
     txtOutput.see(tk.END)                       # Scroll to the end of the widget
 
 
-def main():
+def processCommands(txtOutput):
+    """
+    Runs commands entered in the GUI one at a time on the network thread,
+    so connecting, sending and receiving never block the window
+    """
+    while True:
+        command = command_queue.get()
+
+        try:
+            toServer(command, txtOutput)
+        except Exception as e:
+            update_output(f"Error: {str(e)}", txtOutput)
+
+
+def formatProgress(progress):
+    done = min(progress.done, progress.total) if progress.total else progress.done
+    text = f"{progress.name}: {done / 1e6:.1f}"
+
+    if progress.total:
+        text += f" of {progress.total / 1e6:.1f}"
+
+    text += f" MB at {progress.rate() / 1e6:.2f} MB/s"
+
+    eta = progress.eta()
+    if eta is not None:
+        text += f", ETA {int(eta) // 60}:{int(eta) % 60:02d}"
+
+    return text
+
+
+def formatEntry(entry):
+    # Entries from servers without the index only have a name
+    if "size" not in entry:
+        return entry["name"]
+
+    modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["mtime"]))
+    digest = (entry.get("hash") or "-")[:12]
+
+    return (f"{entry['size']:>12}  {modified}  {entry['downloads']:>6}  {entry.get('uploader') or '-':<12}  "
+            f"{digest:<12}  {entry['name']}")
+
+
+def printResponse(header):
+    print(header.get("message", ""))
+
+    return header.get("status") == "ok"
+
+
+def runCommandLine(argv):
+    """
+    Connects, registers, runs one command and leaves, printing what the
+    server says. Tkinter is never imported on this path.
+
+    Parameters:
+    - argv: Command-line arguments after the script name
+
+    Returns:
+    - The exit status: 0 if every step succeeded, otherwise 1
+    """
+    parser = argparse.ArgumentParser(description="File Exchange System client (runs the GUI when given no arguments)")
+    parser.add_argument("ip")
+    parser.add_argument("port", type=int)
+    parser.add_argument("--alias", required=True,
+                        help="handle to register before running the command")
+    parser.add_argument("--compress", choices=list(compression.CODECS) + ["off"], default="zlib",
+                        help="codec offered for store and get (default zlib)")
+    parser.add_argument("--level", type=int,
+                        help="codec level (default: the codec's own)")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="connections a single get is split across")
+    parser.add_argument("--no-delta", action="store_true",
+                        help="always upload whole files, even ones the server has an older version of")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dir_command = commands.add_parser("dir", help="list the server directory")
+    dir_command.add_argument("--pattern", help="only filenames matching this glob")
+    dir_command.add_argument("--prefix", help="only filenames starting with this")
+    dir_command.add_argument("--sort", choices=("name", "size", "mtime", "downloads"),
+                             help="order of the listing (default name)")
+    dir_command.add_argument("--desc", action="store_true", help="largest values first")
+    dir_command.add_argument("--limit", type=int, help="files in one page of the listing")
+    dir_command.add_argument("--cursor", help="cursor printed with the previous page")
+    dir_command.add_argument("--long", action="store_true",
+                             help="show each file's size, time, downloads, uploader and hash")
+    commands.add_parser("stats", help="show the server's metrics (only on the server's host)")
+    commands.add_parser("store", help="send files or patterns to the server").add_argument("files", nargs="+")
+    commands.add_parser("get", help="fetch files or patterns from the server").add_argument("files", nargs="+")
+    args = parser.parse_args(argv)
+
+    cli_client = FileExchangeClient(codec=None if args.compress == "off" else args.compress, level=args.level,
+                                    segments=max(1, args.segments), delta=not args.no_delta)
+
+    try:
+        if not printResponse(cli_client.connect(args.ip, args.port)):
+            return 1
+
+        try:
+            if not printResponse(cli_client.register(args.alias)):
+                return 1
+
+            if args.command == "dir" and (args.long or args.pattern or args.prefix or args.sort or args.desc
+                                          or args.limit is not None or args.cursor):
+                header, entries = cli_client.listFiles(args.pattern, args.prefix, args.sort or "name", args.desc,
+                                                       args.limit, args.cursor)
+                ok = printResponse(header)
+                for entry in entries:
+                    print(formatEntry(entry) if args.long else entry["name"])
+                if header.get("cursor"):
+                    print(f"{len(entries)} of {header.get('total')} files, next page: --cursor {header['cursor']}")
+
+            elif args.command == "dir":
+                header, names = cli_client.dir()
+                ok = printResponse(header)
+                for name in names:
+                    print(name)
+
+            elif args.command == "stats":
+                header, stats = cli_client.stats()
+                ok = printResponse(header)
+                if stats is not None:
+                    print(json.dumps(stats, indent=2))
+
+            elif len(args.files) == 1 and not hasPattern(args.files[0]):
+                # A single plain filename uses the resumable transfer
+                if args.command == "store":
+                    ok = printResponse(cli_client.store(args.files[0]))
+                else:
+                    header, segment_stats = cli_client.get(args.files[0])
+                    ok = printResponse(header)
+                    for index, stats in enumerate(segment_stats, 1):
+                        print(f"Segment {index}: " + stats.summary())
+
+                if ok and cli_client.last_transfer_stats:
+                    print(cli_client.last_transfer_stats.summary())
+
+            else:
+                if args.command == "store":
+                    results, stats = cli_client.storeMany(args.files)
+                else:
+                    results, stats = cli_client.getMany(args.files)
+
+                for name, header in results:
+                    print(f"{name}: {header.get('message', '')}")
+
+                succeeded = sum(1 for _, header in results if header.get("status") == "ok")
+                ok = bool(results) and succeeded == len(results)
+                print(f"{succeeded} of {len(results)} files, {stats.summary()}")
+
+        finally:
+            if cli_client.connected:
+                cli_client.leave()
+
+        return 0 if ok else 1
+
+    except (OSError, protocol.ProtocolError) as e:
+        print(f"Error: {e}")
+        return 1
+
+
+def runWindow():
+    # Tkinter is only loaded for the GUI, so command-line runs start quickly
+    import tkinter as tk
+    from tkinter import ttk
 
     # Create the main window
     ROOT = tk.Tk()
-    ROOT.geometry("500x500")
+    ROOT.geometry("500x580")
     ROOT.title("File Exchange System")
 
     # Make the window non-resizable
@@ -308,8 +520,8 @@ def main():
     # Label for Input Command
     lblCommand = tk.Label(ROOT, text="Input Command (Type '/?' for help):", font=("Arial", 12))
     lblCommand.pack(pady=10, padx=10, anchor="w")
-    
-    
+
+
     # Entry widget for Input Command
     txtCommand = tk.Text(ROOT, height=1.3, width=43, font=("Arial", 15))
     txtCommand.pack(pady=0, padx=10, anchor="w")
@@ -326,12 +538,16 @@ def main():
     txtCommand.bind("<Button-1>", clearText)
 
     # Button for Enter beside the textbox
-    btnEnter = tk.Button(ROOT, width=10, text="Enter", font=("Arial", 12), command=lambda: toServer(txtCommand, txtOutput))
+    # Commands are handed to the network thread so the window stays responsive
+    def submitCommand():
+        command_queue.put(txtCommand.get("1.0", tk.END).strip())
+
+    btnEnter = tk.Button(ROOT, width=10, text="Enter", font=("Arial", 12), command=submitCommand)
     btnEnter.pack(pady=5, padx=10, anchor="center")  # Pack on the right side
 
     # Everytime the user presses the Enter key, the command will be sent to the server and the text will be cleared
     def enterKey(event):
-        toServer(txtCommand, txtOutput)
+        submitCommand()
         txtCommand.delete(1.0, tk.END)
         txtCommand.config(fg="black")
 
@@ -349,9 +565,55 @@ def main():
     # User cannot edit the textbox
     txtOutput.config(state=tk.DISABLED)
 
+    # Progress of the transfer in flight, with a button to cancel it
+    frmProgress = tk.Frame(ROOT)
+    frmProgress.pack(pady=5, padx=10, fill="x")
+
+    barProgress = ttk.Progressbar(frmProgress, length=370, mode="determinate")
+    barProgress.pack(side="left")
+
+    btnCancel = tk.Button(frmProgress, width=8, text="Cancel", font=("Arial", 10), command=client.cancel,
+                          state=tk.DISABLED)
+    btnCancel.pack(side="right")
+
+    lblProgress = tk.Label(ROOT, text="", font=("Arial", 10))
+    lblProgress.pack(padx=10, anchor="w")
+
+    # Show what the network thread queued and refresh the progress, then check again shortly
+    def poll():
+        while True:
+            try:
+                show_output(output_queue.get_nowait(), txtOutput)
+            except queue.Empty:
+                break
+
+        transfer = client.transfer
+
+        if transfer is None:
+            barProgress.config(value=0)
+            btnCancel.config(state=tk.DISABLED)
+            lblProgress.config(text="")
+        else:
+            barProgress.config(maximum=transfer.total or 1, value=min(transfer.done, transfer.total or 0))
+            btnCancel.config(state=tk.DISABLED if transfer.cancelled.is_set() else tk.NORMAL)
+            lblProgress.config(text=formatProgress(transfer))
+
+        ROOT.after(POLL_INTERVAL, poll)
+
+    threading.Thread(target=processCommands, args=(txtOutput,), daemon=True).start()
+    poll()
+
     # Run the main loop
     ROOT.mainloop()
 
 
+def main():
+    # With arguments the client runs one command from the command line; without, it opens the window
+    if len(sys.argv) > 1:
+        sys.exit(runCommandLine(sys.argv[1:]))
+
+    runWindow()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,257 @@
+'''
+    Client Registry
+    This module keeps track of the registered clients of the File Exchange
+    System server. Clients can be looked up by alias or by connection in
+    constant time, and registration and removal are atomic so concurrent
+    client threads never see an alias without its connection (or the
+    other way around). A client may attach further connections to its
+    alias with the session token it was given at registration, and the
+    alias stays taken until the last of them is gone. A session whose
+    connections all dropped without /leave is kept for a while, so the
+    client can reclaim its alias with the token after reconnecting.
+
+    Running this module directly benchmarks lookups at increasing numbers
+    of registered clients:
+        python clientRegistry.py
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import secrets                      # For session tokens
+import threading                    # For the registry lock
+import time                         # For registration timestamps and the benchmark
+
+
+class ClientSession:
+    """
+    A registered client: its alias, the connection it registered on, the
+    connections attached since, and when it registered
+    """
+
+    __slots__ = ("alias", "connection", "address", "registered_at", "token", "connections", "detached_at")
+
+    def __init__(self, alias, connection, address=None):
+        self.alias = alias
+        self.connection = connection
+        self.address = address
+        self.registered_at = time.time()
+        self.token = secrets.token_hex(16)
+        self.connections = {connection}
+        self.detached_at = None     # When the last connection dropped, while awaiting a resume
+
+    def __repr__(self):
+        return f"ClientSession({self.alias!r}, {self.address!r})"
+
+
+class ClientRegistry:
+    """
+    Registered clients indexed by alias and by connection
+
+    Writes take a lock so both indexes change together. Reads are single
+    dictionary lookups, which are atomic, so they do not take the lock.
+
+    Parameters:
+    - session_ttl: Seconds a detached session keeps its alias reserved
+    """
+
+    def __init__(self, session_ttl=60):
+        self._lock = threading.Lock()
+        self._by_alias = {}
+        self._by_connection = {}
+        self.session_ttl = session_ttl
+
+    def _isExpired(self, session, now):
+        return session.detached_at is not None and now - session.detached_at >= self.session_ttl
+
+    def register(self, alias, connection, address=None):
+        """
+        Registers a connection under an alias
+
+        Returns:
+        - The new ClientSession, or None if the alias is taken or the
+          connection is already registered
+        """
+        with self._lock:
+            current = self._by_alias.get(alias)
+
+            if current is not None and not self._isExpired(current, time.monotonic()):
+                return None
+
+            if connection in self._by_connection:
+                return None
+
+            session = ClientSession(alias, connection, address)
+            self._by_alias[alias] = session
+            self._by_connection[connection] = session
+
+            return session
+
+    def attach(self, alias, token, connection):
+        """
+        Adds a connection to the session registered under an alias
+
+        Returns:
+        - The ClientSession, or None if the alias is not registered, the
+          token does not match or the connection is already registered
+        """
+        with self._lock:
+            session = self._by_alias.get(alias)
+
+            if (session is None or not isinstance(token, str) or connection in self._by_connection
+                    or not secrets.compare_digest(session.token, token)):
+                return None
+
+            session.connections.add(connection)
+            session.detached_at = None
+            self._by_connection[connection] = session
+
+            return session
+
+    def resume(self, alias, token, connection, address=None):
+        """
+        Moves a session to a new connection, for a client that reconnected
+        with the session token it was given at registration
+
+        Returns:
+        - A tuple of (ClientSession, the connection the session was
+          registered on before, or None if it had dropped already), or
+          None if the alias is not registered, the token does not match or
+          the connection is already registered
+        """
+        with self._lock:
+            session = self._by_alias.get(alias)
+
+            if (session is None or not isinstance(token, str) or connection in self._by_connection
+                    or not secrets.compare_digest(session.token, token)):
+                return None
+
+            # The old connection is usually half-open; dropping it here frees the alias for its owner
+            stale = session.connection if session.connection in session.connections else None
+
+            if stale is not None:
+                session.connections.discard(stale)
+                del self._by_connection[stale]
+
+            session.connection = connection
+            session.address = address
+            session.detached_at = None
+            session.connections.add(connection)
+            self._by_connection[connection] = session
+
+            return session, stale
+
+    def detach(self, connection):
+        """
+        Removes a connection that dropped without /leave. The session stays
+        registered for session_ttl seconds once its last connection is gone.
+
+        Returns:
+        - The ClientSession the connection belonged to, or None if the
+          connection was not registered
+        """
+        with self._lock:
+            session = self._by_connection.pop(connection, None)
+
+            if session is not None:
+                session.connections.discard(connection)
+
+                if not session.connections:
+                    session.detached_at = time.monotonic()
+
+            return session
+
+    def collectDetached(self):
+        """
+        Removes sessions that stayed detached for longer than session_ttl
+
+        Returns:
+        - The number of sessions removed
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            expired = [alias for alias, session in self._by_alias.items() if self._isExpired(session, now)]
+
+            for alias in expired:
+                del self._by_alias[alias]
+
+            return len(expired)
+
+    def unregister(self, connection):
+        """
+        Removes a connection, freeing its alias once no connection of the
+        session is left
+
+        Returns:
+        - The ClientSession the connection belonged to, or None if the
+          connection was not registered
+        """
+        with self._lock:
+            session = self._by_connection.pop(connection, None)
+
+            if session is not None:
+                session.connections.discard(connection)
+
+                if not session.connections:
+                    del self._by_alias[session.alias]
+
+            return session
+
+    def getSession(self, connection):
+        return self._by_connection.get(connection)
+
+    def getAlias(self, connection):
+        session = self._by_connection.get(connection)
+
+        return session.alias if session is not None else None
+
+    def findAlias(self, alias):
+        return self._by_alias.get(alias)
+
+    def hasAlias(self, alias):
+        return alias in self._by_alias
+
+    def aliases(self):
+        return list(self._by_alias)
+
+    def __len__(self):
+        return len(self._by_alias)
+
+
+def benchmarkLookups(sizes=(100, 1_000, 10_000, 100_000), lookups=200_000):
+    """
+    Prints the average cost of alias lookups by connection and alias
+    checks at each registry size
+    """
+    print(f"{'clients':>10} {'getAlias (ns)':>15} {'hasAlias (ns)':>15}")
+
+    for size in sizes:
+        registry = ClientRegistry()
+        connections = [object() for _ in range(size)]
+
+        for index, connection in enumerate(connections):
+            registry.register(f"client{index}", connection)
+
+        probes = [connections[(index * 7919) % size] for index in range(lookups)]
+        aliases = [f"client{(index * 7919) % size}" for index in range(lookups)]
+
+        start = time.perf_counter()
+        for connection in probes:
+            registry.getAlias(connection)
+        alias_cost = (time.perf_counter() - start) / lookups * 1e9
+
+        start = time.perf_counter()
+        for alias in aliases:
+            registry.hasAlias(alias)
+        has_cost = (time.perf_counter() - start) / lookups * 1e9
+
+        print(f"{size:>10} {alias_cost:>15.0f} {has_cost:>15.0f}")
+
+
+if __name__ == "__main__":
+    benchmarkLookups()
@@ -0,0 +1,309 @@
+'''
+    Compression Module
+    This module contains the on-the-wire compression shared by the client
+    and server applications of the File Exchange System. A compressed body
+    is sent as a series of data frames, each carrying whatever the
+    compressor produced for the next chunk of the file, and ends with a
+    data frame whose header is {"end": true}. Only the standard library
+    codecs (zlib, lzma and bz2) are used.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import bz2                          # For the bz2 codec
+import lzma                         # For the lzma codec
+import os                           # For the size of pre-compressed files
+import time                         # For transfer throughput
+import zlib                         # For the zlib codec and compressibility sampling
+
+import protocol                     # For message framing
+
+
+# Global Variables
+CODECS              = ("zlib", "lzma", "bz2")
+DEFAULT_LEVELS      = {"zlib": 6, "lzma": 6, "bz2": 9}
+LEVEL_RANGES        = {"zlib": (0, 9), "lzma": (0, 9), "bz2": (1, 9)}
+SAMPLE_SIZE         = protocol.CHUNK_SIZE
+MIN_SAMPLE_SIZE     = 512           # Bodies smaller than this are never worth compressing
+MIN_SAVINGS         = 0.10          # Fraction a sample must shrink by to compress the body
+MAX_DATA_FRAME      = 4 * protocol.CHUNK_SIZE
+
+
+# Function Definitions
+def clampLevel(codec, level):
+    low, high = LEVEL_RANGES[codec]
+
+    if not isinstance(level, int) or isinstance(level, bool):
+        return DEFAULT_LEVELS[codec]
+
+    return max(low, min(high, level))
+
+
+def chooseCodec(offered, supported=CODECS):
+    """
+    Returns the first codec in offered that is also supported, or None
+    """
+    if not isinstance(offered, list):
+        return None
+
+    for codec in offered:
+        if codec in supported:
+            return codec
+
+    return None
+
+
+def isCompressible(sample):
+    """
+    Estimates from the first block of a body whether compressing it pays off
+
+    Already-compressed content (archives, images, video) barely shrinks
+    under a fast zlib pass over its first block, so it is sent as-is.
+    """
+    if len(sample) < MIN_SAMPLE_SIZE:
+        return False
+
+    return len(zlib.compress(sample, 1)) < len(sample) * (1 - MIN_SAVINGS)
+
+
+def createCompressor(codec, level=None):
+    level = clampLevel(codec, level)
+
+    if codec == "zlib":
+        return zlib.compressobj(level)
+    if codec == "lzma":
+        return lzma.LZMACompressor(preset=level)
+    if codec == "bz2":
+        return bz2.BZ2Compressor(level)
+
+    raise ValueError(f"Unsupported codec {codec}.")
+
+
+def createDecompressor(codec):
+    if codec == "zlib":
+        return zlib.decompressobj()
+    if codec == "lzma":
+        return lzma.LZMADecompressor()
+    if codec == "bz2":
+        return bz2.BZ2Decompressor()
+
+    raise ValueError(f"Unsupported codec {codec}.")
+
+
+def iterDecompress(decompressor, data, max_piece=protocol.CHUNK_SIZE):
+    """
+    Decompresses data in pieces of at most max_piece bytes, so a small
+    frame that expands enormously never has to fit in memory at once
+    """
+    # lzma and bz2 raise EOFError when called again after the end of the stream
+    if not data or decompressor.eof:
+        return
+
+    # zlib keeps unread input in unconsumed_tail; lzma and bz2 buffer it internally
+    if hasattr(decompressor, "unconsumed_tail"):
+        while data:
+            piece = decompressor.decompress(data, max_piece)
+            data = decompressor.unconsumed_tail
+            if piece:
+                yield piece
+    else:
+        piece = decompressor.decompress(data, max_piece)
+        if piece:
+            yield piece
+
+        while not decompressor.needs_input and not decompressor.eof:
+            piece = decompressor.decompress(b"", max_piece)
+            if piece:
+                yield piece
+
+
+class TransferStats:
+    """Bytes before and after compression, and how fast they moved."""
+
+    def __init__(self, codec=None):
+        self.codec = codec
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, raw_bytes, wire_bytes):
+        self.raw_bytes += raw_bytes
+        self.wire_bytes += wire_bytes
+
+    def finish(self):
+        self.finished = time.perf_counter()
+        return self
+
+    def ratio(self):
+        return self.raw_bytes / self.wire_bytes if self.wire_bytes else 1.0
+
+    def throughput(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return self.raw_bytes / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.raw_bytes} bytes as {self.wire_bytes} on the wire "
+                f"({self.codec or 'uncompressed'}, {self.ratio():.2f}x) "
+                f"at {self.throughput() / 1e6:.2f} MB/s")
+
+
+def readBlocks(file, size, block_size=protocol.CHUNK_SIZE):
+    """
+    Yields size bytes of an open file in blocks of at most block_size bytes
+    """
+    remaining = size
+
+    while remaining > 0:
+        block = file.read(min(block_size, remaining))
+        if not block:
+            raise EOFError("File ended before the declared size.")
+        remaining -= len(block)
+
+        yield block
+
+
+def sendCompressed(sock, request_id, file, size, compressor, stats):
+    """
+    Compresses size bytes of an open file into a series of data frames
+
+    Parameters:
+    - file: Binary file object positioned at the first byte to send
+    - compressor: Object returned by createCompressor
+    - stats: TransferStats updated as the frames are sent
+    """
+    sendCompressedBlocks(sock, request_id, readBlocks(file, size), compressor, stats)
+
+
+def sendCompressedBlocks(sock, request_id, blocks, compressor, stats, progress=None):
+    """
+    Compresses a body given as an iterable of bytes-like blocks (such as
+    memoryview slices of a mapped file) into a series of data frames,
+    calling progress, if given, with the compressed bytes of each frame
+    """
+    for block in blocks:
+        data = compressor.compress(block)
+        sendDataFrames(sock, request_id, data, progress=progress)
+        stats.add(len(block), len(data))
+
+    data = compressor.flush()
+    sendDataFrames(sock, request_id, data, True, progress)
+    stats.add(0, len(data))
+
+
+def sendDataFrames(sock, request_id, data, end=False, progress=None):
+    """
+    Sends compressed bytes as data frames of at most MAX_DATA_FRAME bytes,
+    since bz2 and lzma can return far more than that from one call
+
+    Parameters:
+    - end: Whether the last frame ends the body; an empty body then still
+      sends one empty frame
+    - progress: Called with the bytes of each frame's body after it is sent, if given
+    """
+    view = memoryview(data)
+
+    for offset in range(0, len(view), MAX_DATA_FRAME):
+        piece = view[offset:offset + MAX_DATA_FRAME]
+        last = offset + MAX_DATA_FRAME >= len(view)
+        protocol.sendFrame(sock, protocol.FRAME_DATA, request_id, {"end": True} if end and last else None, piece)
+
+        if progress is not None:
+            progress(len(piece))
+
+    if end and not view:
+        protocol.sendFrame(sock, protocol.FRAME_DATA, request_id, {"end": True}, b"")
+
+
+def sendPrecompressed(sock, request_id, file, raw_size, stats, progress=None):
+    """
+    Sends an already compressed file as a series of data frames, letting
+    the kernel copy each frame's body to the socket
+
+    Parameters:
+    - file: Binary file object holding the whole compressed body
+    - raw_size: Size of the body once decompressed
+    - progress: Called with the bytes of each frame's body after it is sent, if given
+    """
+    remaining = os.fstat(file.fileno()).st_size
+    file.seek(0)
+
+    stats.add(raw_size, remaining)
+
+    # The last frame carries the end of the body, as with sendCompressedBlocks
+    while True:
+        length = min(MAX_DATA_FRAME, remaining)
+        remaining -= length
+        header = {"end": True} if remaining == 0 else None
+        protocol.sendFileFrame(sock, protocol.FRAME_DATA, request_id, header, file, length)
+
+        if progress is not None and length:
+            progress(length)
+
+        if remaining == 0:
+            break
+
+
+def recvCompressed(sock, decompressor, size, stats, budget=None):
+    """
+    Receives a series of data frames and yields the decompressed body
+
+    Parameters:
+    - budget: BufferBudget each frame and the piece decompressed from it are
+      held against while in memory, if given
+
+    Raises ProtocolError if the body would be larger than size bytes.
+    """
+    produced = 0
+
+    while True:
+        frame_type, _, header, payload_length = protocol.recvFrameHead(sock)
+
+        if frame_type != protocol.FRAME_DATA or payload_length > MAX_DATA_FRAME:
+            raise protocol.ProtocolError("Malformed compressed body.")
+
+        held = payload_length + protocol.CHUNK_SIZE
+
+        if budget is not None:
+            budget.acquire(held)
+
+        try:
+            payload = protocol.recvExactly(sock, payload_length)
+            stats.add(0, payload_length)
+
+            for piece in iterDecompress(decompressor, payload):
+                produced += len(piece)
+                if produced > size:
+                    raise protocol.ProtocolError("Decompressed body is larger than its declared size.")
+                stats.add(len(piece), 0)
+                yield piece
+        finally:
+            if budget is not None:
+                budget.release(held)
+
+        if header.get("end"):
+            break
+
+    if produced != size:
+        raise protocol.ProtocolError("Decompressed body is smaller than its declared size.")
+
+
+def discardCompressed(sock):
+    """
+    Reads and drops a series of data frames so the next frame can be decoded
+    """
+    while True:
+        frame_type, _, header, payload_length = protocol.recvFrameHead(sock)
+
+        if frame_type != protocol.FRAME_DATA:
+            raise protocol.ProtocolError("Malformed compressed body.")
+
+        protocol.discardPayload(sock, payload_length)
+
+        if header.get("end"):
+            break
@@ -0,0 +1,145 @@
+'''
+    Content Store
+    This module implements the optional content-addressed storage mode of
+    the File Exchange System server. Every distinct file body is kept once
+    under its SHA-256 digest in a hidden objects directory, and the names
+    in Server Directory are hard links to those objects. Storing a file
+    whose contents the server already has only adds a link, and since the
+    names are ordinary files, /dir and /get serve them unchanged.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import hashlib                      # For content digests
+import mmap                         # For hashing files without reading them onto the heap
+import os                           # For file-related operations
+import secrets                      # For unique temporary link names
+import string                       # For validating digests
+
+
+# Global Variables
+HASH_NAME       = "sha256"
+HASH_LENGTH     = 64                # Hex digits in a digest
+
+
+# Function Definitions
+def hashFile(file_path):
+    """
+    Returns the hex digest of a file's contents
+    """
+    digest = hashlib.new(HASH_NAME)
+
+    # The file is hashed straight from the page cache; empty files cannot be mapped
+    with open(file_path, "rb") as current_file:
+        if os.fstat(current_file.fileno()).st_size > 0:
+            with mmap.mmap(current_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+
+    return digest.hexdigest()
+
+
+def isValidDigest(digest):
+    return (isinstance(digest, str) and len(digest) == HASH_LENGTH
+            and all(c in string.hexdigits for c in digest))
+
+
+class ContentStore:
+    """
+    File bodies stored once by digest, with names linked to them
+
+    Parameters:
+    - save_dir: Directory holding the named files
+    - objects_dir_name: Hidden subdirectory of save_dir holding the objects
+    """
+
+    def __init__(self, save_dir, objects_dir_name=".objects"):
+        self.save_dir = save_dir
+        self.objects_dir = os.path.join(save_dir, objects_dir_name)
+
+    def getObjectPath(self, digest):
+        return os.path.join(self.objects_dir, digest.lower())
+
+    def has(self, digest):
+        return isValidDigest(digest) and os.path.exists(self.getObjectPath(digest))
+
+    def _linkName(self, object_path, dir_path):
+        # Link under a temporary name first so the name is replaced atomically
+        temp_link = os.path.join(self.save_dir, "." + secrets.token_hex(16) + ".link")
+        os.link(object_path, temp_link)
+
+        try:
+            os.replace(temp_link, dir_path)
+        finally:
+            # rename() leaves both names in place when dir_path is already this object
+            if os.path.lexists(temp_link):
+                os.remove(temp_link)
+
+    def commit(self, temp_path, dir_path, digest=None):
+        """
+        Stores a finished upload as an object and links dir_path to it
+
+        An upload whose contents already exist is discarded in favour of
+        the existing object.
+
+        Parameters:
+        - digest: Digest of temp_path if the caller already computed it
+
+        Returns:
+        - The digest of the stored contents
+        """
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        digest = digest or hashFile(temp_path)
+        object_path = self.getObjectPath(digest)
+
+        if os.path.exists(object_path):
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, object_path)
+
+        self._linkName(object_path, dir_path)
+
+        return digest
+
+    def link(self, digest, dir_path):
+        """
+        Links dir_path to an existing object
+
+        Returns:
+        - True if the object exists and was linked, False otherwise
+        """
+        if not self.has(digest):
+            return False
+
+        try:
+            self._linkName(self.getObjectPath(digest), dir_path)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def collectGarbage(self):
+        """
+        Removes objects no longer linked from any name
+
+        Returns:
+        - The number of objects removed
+        """
+        if not os.path.isdir(self.objects_dir):
+            return 0
+
+        removed = 0
+
+        for digest in os.listdir(self.objects_dir):
+            object_path = os.path.join(self.objects_dir, digest)
+
+            if os.stat(object_path).st_nlink <= 1:
+                os.remove(object_path)
+                removed += 1
+
+        return removed
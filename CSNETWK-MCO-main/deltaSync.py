@@ -0,0 +1,287 @@
+'''
+    Delta Sync
+    This module contains the rsync-style delta transfer used when a client
+    stores a new version of a file the server already has. The server
+    describes its copy as a list of block signatures, each a weak Adler-32
+    checksum and a strong hash. The client slides a window over its file
+    with a rolling checksum to find the blocks the server already holds,
+    and sends copy instructions for them with only the bytes in between.
+    The server rebuilds the new version from its old copy and those bytes.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import hashlib                      # For the strong block hashes and the rebuilt file's digest
+import math                         # For sizing blocks
+import struct                       # For the signature and instruction encodings
+import zlib                         # For the weak Adler-32 checksums
+
+import protocol                     # For reading instructions off the socket
+from contentStore import HASH_NAME  # For checking the rebuilt file against the client's digest
+
+
+# Global Variables
+MIN_BLOCK_SIZE      = 4 * 1024
+MAX_BLOCK_SIZE      = 1024 * 1024
+ADLER_MODULUS       = 65521
+STRONG_HASH_SIZE    = 16            # Bytes of BLAKE2b digest per block
+MAX_LITERAL_SIZE    = 1024 * 1024   # Largest run of new bytes sent as one instruction
+
+SIGNATURE           = struct.Struct(f"!I{STRONG_HASH_SIZE}s")  # Weak checksum and strong hash of one block
+OP_COPY             = b"C"          # Followed by COPY_ARGS: first block and number of blocks of the old copy
+OP_LITERAL          = b"L"          # Followed by LITERAL_ARGS: length of the new bytes that follow
+COPY_ARGS           = struct.Struct("!II")
+LITERAL_ARGS        = struct.Struct("!I")
+
+
+class DeltaError(Exception):
+    """Raised when delta instructions cannot be applied to the server's copy."""
+
+
+# Function Definitions
+def chooseBlockSize(file_size):
+    """
+    Returns a block size near the square root of the file size, as rsync
+    does, so both the signatures and the bytes re-sent around a change
+    stay small, rounded up to a power of two
+    """
+    block_size = 1 << max(0, math.ceil(math.log2(max(1, math.isqrt(file_size)))))
+
+    return min(MAX_BLOCK_SIZE, max(MIN_BLOCK_SIZE, block_size))
+
+
+def strongHash(block):
+    return hashlib.blake2b(block, digest_size=STRONG_HASH_SIZE).digest()
+
+
+def computeSignatures(file, block_size):
+    """
+    Returns the signatures of every full block of an open binary file,
+    packed one after another; a shorter last block has no signature and is
+    always sent again
+    """
+    signatures = bytearray()
+
+    for block in iter(lambda: file.read(block_size), b""):
+        if len(block) == block_size:
+            signatures += SIGNATURE.pack(zlib.adler32(block), strongHash(block))
+
+    return bytes(signatures)
+
+
+def parseSignatures(payload):
+    """
+    Returns a dictionary mapping each weak checksum to a dictionary of
+    strong hash to the first block with both
+    """
+    blocks = {}
+
+    for index, (weak, strong) in enumerate(SIGNATURE.iter_unpack(payload)):
+        blocks.setdefault(weak, {}).setdefault(strong, index)
+
+    return blocks
+
+
+def rollWindow(view, blocks, block_size, position, end, a, b):
+    """
+    Slides the window one byte at a time from position until its weak
+    checksum matches a block of the server's copy or it starts at end
+
+    Returns:
+    - A tuple of (position, a, b) where the window stopped, with the two
+      halves of its checksum
+    """
+    for old, new in zip(view[position:end], view[position + block_size:end + block_size]):
+        a = (a - old + new) % ADLER_MODULUS
+        b = (b - block_size * old + a - 1) % ADLER_MODULUS
+        position += 1
+
+        if (b << 16) | a in blocks:
+            break
+
+    return position, a, b
+
+
+def computeDelta(view, blocks, block_size, max_literal):
+    """
+    Finds the parts of a new version of a file that match blocks of the
+    server's copy, checking every byte offset with a rolling checksum
+
+    Parameters:
+    - view: Contents of the new version (bytes or mmap)
+    - blocks: Signatures of the server's copy, from parseSignatures
+    - block_size: Block size the signatures were computed with
+    - max_literal: New bytes allowed before the delta is abandoned
+
+    Returns:
+    - A list of [OP_COPY, first block, count] and [OP_LITERAL, start, end]
+      instructions, where start and end are offsets into view, or None
+      if more than max_literal bytes match no block
+    """
+    size = len(view)
+    ops = []
+    literal_start = 0
+    literal_total = 0
+    position = 0
+    a = b = None
+
+    with memoryview(view) as contents:
+        while position + block_size <= size:
+            if a is None:
+                weak = zlib.adler32(contents[position:position + block_size])
+                a, b = weak & 0xFFFF, weak >> 16
+
+            candidates = blocks.get((b << 16) | a)
+            index = candidates and candidates.get(strongHash(contents[position:position + block_size]))
+
+            if index is not None:
+                if literal_start < position:
+                    ops.append([OP_LITERAL, literal_start, position])
+                    literal_total += position - literal_start
+
+                # Runs of consecutive blocks become one instruction
+                if ops and ops[-1][0] == OP_COPY and ops[-1][1] + ops[-1][2] == index:
+                    ops[-1][2] += 1
+                else:
+                    ops.append([OP_COPY, index, 1])
+
+                position += block_size
+                literal_start = position
+                a = None
+                continue
+
+            # Stop once the window has passed more new bytes than the delta may carry
+            end = min(size - block_size, literal_start + max_literal - literal_total)
+
+            if position >= end:
+                if end < size - block_size:
+                    return None
+                break
+
+            position, a, b = rollWindow(contents, blocks, block_size, position, end, a, b)
+
+    if literal_start < size:
+        if literal_total + size - literal_start > max_literal:
+            return None
+        ops.append([OP_LITERAL, literal_start, size])
+
+    return ops
+
+
+def iterDelta(view, ops, block_size):
+    """
+    Yields the encoded instructions of a delta, with the new bytes as
+    slices of view, as (data, bytes of the file it stands for) pairs
+    """
+    for op in ops:
+        if op[0] == OP_COPY:
+            yield OP_COPY + COPY_ARGS.pack(op[1], op[2]), op[2] * block_size
+            continue
+
+        for start in range(op[1], op[2], MAX_LITERAL_SIZE):
+            end = min(start + MAX_LITERAL_SIZE, op[2])
+            yield OP_LITERAL + LITERAL_ARGS.pack(end - start), 0
+            yield view[start:end], end - start
+
+
+def getDeltaLength(ops):
+    """
+    Returns the number of bytes iterDelta encodes a delta in
+    """
+    length = 0
+
+    for op in ops:
+        if op[0] == OP_COPY:
+            length += 1 + COPY_ARGS.size
+        else:
+            literal = op[2] - op[1]
+            length += literal + math.ceil(literal / MAX_LITERAL_SIZE) * (1 + LITERAL_ARGS.size)
+
+    return length
+
+
+def applyDelta(sock, length, base, output, block_size, size, budget=None):
+    """
+    Rebuilds a file from delta instructions read off a socket, copying
+    blocks from the open old copy and writing everything to output, with
+    every block and new chunk held against budget (a BufferBudget) if given
+
+    A delta that refers to blocks the old copy lacks, or that would rebuild
+    more than the declared size bytes, raises DeltaError after the rest of
+    its length has been read so the connection stays usable.
+
+    Returns:
+    - A tuple of (hex digest of the rebuilt file, bytes copied from the
+      old copy, bytes received as new data)
+    """
+    base.seek(0, 2)
+    base_size = base.tell()
+    digest = hashlib.new(HASH_NAME)
+    remaining = length
+    copied = 0
+    received = 0
+
+    def fail(message):
+        protocol.discardPayload(sock, remaining)
+        raise DeltaError(message)
+
+    while remaining > 0:
+        op = protocol.recvExactly(sock, 1)
+        remaining -= 1
+
+        if op == OP_COPY and remaining >= COPY_ARGS.size:
+            first, count = COPY_ARGS.unpack(protocol.recvExactly(sock, COPY_ARGS.size))
+            remaining -= COPY_ARGS.size
+
+            start, end = first * block_size, (first + count) * block_size
+            if count == 0 or end > base_size:
+                fail("Error: Delta refers to blocks the server's copy does not have.")
+
+            # A few bytes of instructions can copy the whole old copy, so the size is checked before writing
+            if copied + received + end - start > size:
+                fail("Error: Delta rebuilds more than the declared file size.")
+
+            base.seek(start)
+            while base.tell() < end:
+                length = min(protocol.CHUNK_SIZE, end - base.tell())
+
+                if budget is not None:
+                    budget.acquire(length)
+
+                try:
+                    block = base.read(length)
+                    if not block:
+                        break
+                    digest.update(block)
+                    output.write(block)
+                finally:
+                    if budget is not None:
+                        budget.release(length)
+
+            copied += end - start
+
+        elif op == OP_LITERAL and remaining >= LITERAL_ARGS.size:
+            (literal,) = LITERAL_ARGS.unpack(protocol.recvExactly(sock, LITERAL_ARGS.size))
+            remaining -= LITERAL_ARGS.size
+
+            if literal > remaining:
+                fail("Error: Delta is longer than its declared size.")
+            if copied + received + literal > size:
+                fail("Error: Delta rebuilds more than the declared file size.")
+
+            for chunk in protocol.recvChunks(sock, literal, budget=budget):
+                digest.update(chunk)
+                output.write(chunk)
+
+            remaining -= literal
+            received += literal
+
+        else:
+            fail("Error: Malformed delta.")
+
+    return digest.hexdigest(), copied, received
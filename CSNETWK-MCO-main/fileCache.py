@@ -0,0 +1,98 @@
+'''
+    File Cache
+    This module contains the in-memory cache the File Exchange System
+    server uses for frequently downloaded files. Entries are keyed by
+    filename, modification time and size, so a file replaced on disk can
+    never be served from a stale entry, and the least recently used
+    entries are evicted once the cache would exceed its byte budget.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import threading                    # For the cache lock
+from collections import OrderedDict # For least recently used ordering
+
+
+class FileCache:
+    """
+    File contents kept in memory up to a byte budget, evicting the least
+    recently used entries first
+
+    Parameters:
+    - max_bytes: Total size of the contents the cache may hold
+    - max_entry_bytes: Largest file admitted (defaults to a quarter of the budget)
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._keys = {}             # Name to the key of its one cached version
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def admits(self, size):
+        return size <= self.max_entry_bytes
+
+    def get(self, name, mtime_ns, size):
+        """
+        Returns the cached contents of a file version, or None on a miss
+        """
+        key = (name, mtime_ns, size)
+
+        with self._lock:
+            data = self._entries.get(key)
+
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+            return data
+
+    def put(self, name, mtime_ns, size, data):
+        if not self.admits(len(data)):
+            return
+
+        key = (name, mtime_ns, size)
+
+        with self._lock:
+            if key in self._entries:
+                return
+
+            # Older versions of the same file can never be hit again
+            self._discard(name)
+
+            self._entries[key] = data
+            self._keys[name] = key
+            self._size += len(data)
+
+            while self._size > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                del self._keys[evicted_key[0]]
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, name):
+        with self._lock:
+            self._discard(name)
+
+    def _discard(self, name):
+        key = self._keys.pop(name, None)
+
+        if key is not None:
+            self._size -= len(self._entries.pop(key))
+
+    def getStats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._size, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,1171 @@
+'''
+    File Exchange Client
+    This module contains the client side of the File Exchange System
+    protocol as a class that scripts can import, with no GUI involved.
+    FileExchangeClient holds one connection to the server and offers
+    connect, register, store, get, dir and leave, including the resumable,
+    segmented, compressed and batched transfers. AsyncFileExchangeClient
+    offers the same calls as coroutines for asyncio programs.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import asyncio                      # For the asyncio client
+import fnmatch                      # For /get filename patterns
+import functools                    # For calls handed to the asyncio client's thread
+import glob                         # For /store filename patterns
+import json                         # For /stats and /dir query responses
+import mmap                         # For scanning files for delta uploads
+import os                           # For file-related operations
+import random                       # For reconnect backoff jitter
+import secrets                      # For upload resume tokens
+import socket                       # For socket programming
+import threading                    # For transfer cancellation
+import time                         # For waiting between reconnect attempts
+from collections import deque       # For the requests in flight in a batch
+from concurrent.futures import ThreadPoolExecutor   # For segmented downloads and the asyncio client
+
+import protocol                     # For message framing
+import compression                  # For compressed transfers
+import deltaSync                    # For delta uploads
+from contentStore import hashFile   # For deduplicated and delta uploads
+
+
+# Global Variables
+MAX_RESUME_ATTEMPTS = 5             # Reconnects tried before an interrupted request is abandoned
+RESUME_DELAY        = 0.5           # Seconds to wait before the first reconnect, doubled for each one after
+MAX_RESUME_DELAY    = 8.0           # Longest wait between reconnects
+MIN_SEGMENT_SIZE    = 1024 * 1024   # Smallest byte range worth its own connection
+PIPELINE_WINDOW     = 8             # Batch requests sent ahead of their responses
+MIN_DELTA_SIZE      = 1024 * 1024   # Smaller files are uploaded whole rather than diffed against the server's copy
+MAX_DELTA_LITERAL   = 4 * 1024 * 1024   # New bytes after which a delta is abandoned for a whole upload
+
+
+# Class Definitions
+class TransferCancelled(Exception):
+    """Raised in the thread running a transfer when the transfer is cancelled."""
+
+
+class TransferProgress:
+    """
+    Bytes moved so far by a transfer, shared between the thread that
+    updates it and any thread that displays or cancels it
+
+    Parameters:
+    - name: File being transferred
+    - total: Size of the file, if already known
+    """
+
+    def __init__(self, name, total=None):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._sockets = set()
+
+    def add(self, count):
+        with self._lock:
+            self.done += count
+
+        self.check()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise TransferCancelled()
+
+    def watch(self, sock):
+        # Sockets of extra connections, shut down on cancel to unblock their reads
+        with self._lock:
+            self._sockets.add(sock)
+
+    def unwatch(self, sock):
+        with self._lock:
+            self._sockets.discard(sock)
+
+    def cancel(self):
+        self.cancelled.set()
+
+        with self._lock:
+            sockets = list(self._sockets)
+
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def eta(self):
+        rate = self.rate()
+        if not self.total or rate <= 0:
+            return None
+        return max(0.0, (self.total - self.done) / rate)
+
+
+# Function Definitions
+def getBackoffDelay(attempt):
+    """
+    Returns the seconds to wait before reconnect number attempt + 1,
+    doubling each time with jitter so clients dropped together do not all
+    reconnect at once
+    """
+    delay = min(MAX_RESUME_DELAY, RESUME_DELAY * 2 ** attempt)
+
+    return delay * random.uniform(0.5, 1.0)
+
+
+def openSocket(address, port):
+    sock = socket.create_connection((address, port))
+
+    # A frame's head and a payload sent by sendfile are separate writes; without this the second waits for an ACK
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    return sock
+
+
+def hasPattern(name):
+    return any(c in name for c in "*?[")
+
+
+def expandLocalPatterns(patterns):
+    """
+    Returns the local files named by a list of filenames and glob
+    patterns, in the order given and without duplicates
+    """
+    paths = []
+    seen = set()
+
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) if hasPattern(pattern) else [pattern]:
+            if os.path.isfile(path) and path not in seen:
+                seen.add(path)
+                paths.append(path)
+
+    return paths
+
+
+class FileExchangeClient:
+    """
+    One client of the File Exchange System. Calls block until the server
+    answers and must be made one at a time; cancel may be called from any
+    thread while a transfer runs.
+
+    Parameters:
+    - codec: Codec offered for /store and /get when the server supports it (None for off)
+    - level: Codec level (None for the codec's default)
+    - segments: Connections a single /get is split across
+    - window: Batch requests sent ahead of their responses
+    - delta: Whether a file the server already has is sent as a delta against its copy
+
+    Attributes:
+    - connected: Whether the main connection is open
+    - alias: Alias registered on the connection
+    - transfer: TransferProgress of the /store or /get in flight, or None
+    - last_transfer_stats: TransferStats of the most recent /store or /get
+    """
+
+    def __init__(self, codec="zlib", level=None, segments=1, window=PIPELINE_WINDOW, delta=True):
+        self.address = None
+        self.port = None
+        self.sock = None
+        self.connected = False
+        self.request_counter = 0
+        self.alias = None
+        self.session = None         # Session token for resuming or attaching more connections to the alias
+        self.features = []          # Optional features the server advertised in its greeting
+        self.codecs = []            # Compression codecs the server advertised in its greeting
+        self.compression_codec = codec
+        self.compression_level = level
+        self.segments = segments
+        self.window = window
+        self.delta = delta
+        self.transfer = None
+        self.last_transfer_stats = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Commands
+    def connect(self, address, port):
+        """
+        Opens the main connection and reads the server's greeting
+
+        Returns:
+        - The header of the greeting (an error if the server is busy)
+        """
+        self.address = address
+        self.port = port
+
+        header = self._openConnection()
+        self.connected = header.get("status") == "ok"
+
+        # The session of an earlier connection is kept so register can reclaim its alias
+        if self.connected:
+            self.alias = None
+
+        return header
+
+    def register(self, alias):
+        """
+        Registers an alias on the connection, reclaiming the alias's last
+        session if it is still held for this client
+
+        Returns:
+        - The header of the server's response
+        """
+        self._sendRequest({"command": "/register", "alias": alias, "session": self.session})
+        header, _ = self._recvResponse()
+
+        # Remembered so an interrupted transfer can register again after reconnecting
+        if header.get("status") == "ok":
+            self.alias = alias
+            self.session = header.get("session")
+
+        return header
+
+    def leave(self):
+        """
+        Tells the server the client is leaving and closes the connection
+
+        Returns:
+        - The header of the server's response
+        """
+        try:
+            self._sendRequest({"command": "/leave"})
+            header, _ = self._recvResponse()
+        finally:
+            self.close()
+            self.session = None
+
+        return header
+
+    def close(self):
+        """
+        Closes the connection without /leave, so the server keeps the
+        alias for the client to resume within the session TTL
+        """
+        if self.sock is not None:
+            self.sock.close()
+
+        self.connected = False
+        self.alias = None
+
+    def dir(self):
+        """
+        Returns:
+        - A tuple of (header of the server's response, list of filenames)
+        """
+        # The whole listing arrives as a single response, asked for again after a reconnect
+        header, listing = self._sendAndReceive({"command": "/dir"})
+        names = listing.decode().splitlines() if header.get("status") == "ok" else []
+
+        return header, names
+
+    def listFiles(self, pattern=None, prefix=None, sort="name", descending=False, limit=None, cursor=None):
+        """
+        Asks the server for one page of its file index
+
+        Parameters:
+        - pattern: Glob the filenames must match
+        - prefix: Start the filenames must have
+        - sort: "name", "size", "mtime" or "downloads"
+        - descending: Whether the largest values come first
+        - limit: Entries in the page (the server caps it)
+        - cursor: The cursor of the previous page's response, for the next page
+
+        Returns:
+        - A tuple of (header of the server's response, with the total
+          matching and the next page's cursor, list of entries with name,
+          size, mtime, hash, uploader and downloads)
+        """
+        request = {"command": "/dir", "pattern": pattern, "prefix": prefix, "sort": sort,
+                   "desc": descending or None, "limit": limit, "cursor": cursor}
+        header, payload = self._sendAndReceive({key: value for key, value in request.items() if value is not None})
+
+        # Servers without the index ignore the query and send plain names
+        if header.get("status") != "ok":
+            return header, []
+        if "total" not in header:
+            return header, [{"name": name} for name in payload.decode().splitlines()]
+
+        return header, json.loads(payload)
+
+    def stats(self):
+        """
+        Asks for the server's metrics, which it only reports to clients on
+        its own host
+
+        Returns:
+        - A tuple of (header of the server's response, dictionary of metrics
+          or None)
+        """
+        header, payload = self._sendAndReceive({"command": "/stats"})
+        stats = json.loads(payload) if header.get("status") == "ok" else None
+
+        return header, stats
+
+    def store(self, file_path, filename=None):
+        """
+        Uploads a file, by reference when the server already holds its
+        contents and as a delta when it holds an older version, resuming
+        from the last byte the server confirmed whenever the connection
+        drops
+
+        Parameters:
+        - file_path: Local file to upload
+        - filename: Name to store it under (defaults to the file's own name)
+
+        Returns:
+        - The header of the server's final response
+        """
+        filename = filename or os.path.basename(file_path)
+
+        return self._runTransfer(filename, os.path.getsize(file_path), self._uploadFile, file_path, filename)
+
+    def get(self, filename, file_path=None):
+        """
+        Downloads a file, split across self.segments connections when
+        there is more than one and a registered session to attach them to
+
+        Parameters:
+        - filename: File to fetch from the server
+        - file_path: Where to save it (defaults to the current directory)
+
+        Returns:
+        - A tuple of (header of the server's response, list of TransferStats
+          per segment, empty unless the download was split)
+        """
+        if file_path is None:
+            file_path = os.path.join(os.getcwd(), os.path.basename(filename))
+
+        if self.segments > 1 and self.alias and self.session:
+            return self._runTransfer(filename, None, self._downloadSegmented, filename, file_path, self.segments)
+
+        return self._runTransfer(filename, None, self._downloadFile, filename, file_path), []
+
+    def storeMany(self, patterns):
+        """
+        Uploads the local files named by a list of filenames and glob
+        patterns, pipelining the /store requests over the main connection
+
+        Returns:
+        - A tuple of (list of (path, response header) per file, TransferStats
+          of the whole batch); the list is empty if nothing matched
+        """
+        paths = expandLocalPatterns(patterns)
+
+        if not paths:
+            return [], compression.TransferStats().finish()
+
+        return self._runTransfer(f"{len(paths)} files", sum(os.path.getsize(path) for path in paths),
+                                 self._storeFiles, paths)
+
+    def getMany(self, patterns, directory=None):
+        """
+        Downloads the server files named by a list of filenames and glob
+        patterns, pipelining the /get requests over the main connection
+
+        Parameters:
+        - directory: Where to save the files (defaults to the current directory)
+
+        Returns:
+        - A tuple of (list of (filename, response header) per file,
+          TransferStats of the whole batch); the list is empty if nothing
+          matched
+        """
+        names = self.expandRemotePatterns(patterns)
+
+        if not names:
+            return [], compression.TransferStats().finish()
+
+        return self._runTransfer(f"{len(names)} files", None, self._getFiles, names, directory or os.getcwd())
+
+    def expandRemotePatterns(self, patterns):
+        """
+        Returns the server files named by a list of filenames and glob
+        patterns, matching the patterns against a /dir listing
+        """
+        listing = None
+        names = []
+
+        for pattern in patterns:
+            if not hasPattern(pattern):
+                matches = [pattern]
+            else:
+                if listing is None:
+                    _, listing = self.dir()
+                matches = fnmatch.filter(listing, pattern)
+
+            names.extend(name for name in matches if name not in names)
+
+        return names
+
+    def cancel(self):
+        """
+        Cancels the transfer in flight, shutting down its sockets so even a
+        stalled server cannot hold it. The call running the transfer raises
+        TransferCancelled once the client has reconnected.
+
+        Returns:
+        - Whether there was a transfer to cancel
+        """
+        transfer = self.transfer
+        if transfer is None:
+            return False
+
+        transfer.cancel()
+
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, AttributeError):
+            pass
+
+        return True
+
+    # Connection
+    def _sendRequest(self, header, payload=b""):
+        """
+        Sends a request frame to the server
+
+        Parameters:
+        - header: Dictionary describing the request (must include "command")
+        - payload: Raw bytes sent along with the request
+
+        Returns:
+        - The request id assigned to the request
+        """
+        self.request_counter = self.request_counter % protocol.MAX_REQUEST_ID + 1
+        protocol.sendFrame(self.sock, protocol.FRAME_REQUEST, self.request_counter, header, payload)
+
+        return self.request_counter
+
+    def _sendRequestFile(self, header, file, size, progress=None):
+        """
+        Sends a request frame whose payload is streamed from an open file
+
+        Parameters:
+        - header: Dictionary describing the request (must include "command")
+        - file: Binary file object positioned at the first byte to send
+        - size: Number of bytes to send from the file
+        - progress: Called with the number of bytes sent after each step, if given
+
+        Returns:
+        - The request id assigned to the request
+        """
+        self.request_counter = self.request_counter % protocol.MAX_REQUEST_ID + 1
+        protocol.sendFileFrame(self.sock, protocol.FRAME_REQUEST, self.request_counter, header, file, size,
+                               progress=progress)
+
+        return self.request_counter
+
+    def _sendRequestChunks(self, header, chunks, size):
+        """
+        Sends a request frame whose payload of size bytes is made of the
+        data in a sequence of (data, progress) pairs, reporting progress
+        bytes for each
+
+        Returns:
+        - The request id assigned to the request
+        """
+        self.request_counter = self.request_counter % protocol.MAX_REQUEST_ID + 1
+        self.sock.sendall(protocol.encodeFrameHead(protocol.FRAME_REQUEST, self.request_counter, header, size))
+
+        for data, progress in chunks:
+            self.sock.sendall(data)
+            self._trackProgress(progress)
+
+        return self.request_counter
+
+    def _recvResponse(self):
+        """
+        Receives the next response frame from the server
+
+        Returns:
+        - A tuple of (header, payload)
+        """
+        _, _, header, payload = protocol.recvFrame(self.sock)
+
+        return header, payload
+
+    def _openConnection(self):
+        """
+        Opens a connection to the server and reads the greeting
+
+        Returns:
+        - The header of the greeting (an error if the server is busy)
+        """
+        self.sock = openSocket(self.address, self.port)
+        header, _ = self._recvResponse()
+        self.features = header.get("features", [])
+        self.codecs = header.get("codecs", [])
+
+        # The server rejects new connections while all its workers are busy
+        if header.get("status") != "ok":
+            self.sock.close()
+
+        return header
+
+    def reconnect(self):
+        """
+        Replaces a dropped connection and reclaims the alias on it with the
+        session token, so the server hands over the same session
+        """
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+        header = self._openConnection()
+        if header.get("status") != "ok":
+            raise ConnectionError(header.get("message", ""))
+
+        if self.alias:
+            self._sendRequest({"command": "/register", "alias": self.alias, "session": self.session})
+            header, _ = self._recvResponse()
+            if header.get("status") != "ok":
+                raise ConnectionError(header.get("message", ""))
+            self.session = header.get("session")
+
+    def _sendAndReceive(self, header):
+        """
+        Sends a request and returns the server's response, reconnecting with
+        backoff and sending the request again if the connection drops
+
+        Returns:
+        - A tuple of (header, payload)
+        """
+        for attempt in range(MAX_RESUME_ATTEMPTS + 1):
+            try:
+                if attempt > 0:
+                    self.reconnect()
+
+                self._sendRequest(header)
+                return self._recvResponse()
+
+            except OSError:
+                self._checkCancelled()
+                if attempt == MAX_RESUME_ATTEMPTS:
+                    raise
+                time.sleep(getBackoffDelay(attempt))
+
+    # Transfers
+    def _runTransfer(self, name, total, transfer, *args):
+        """
+        Runs a transfer with its progress in self.transfer. A cancelled
+        transfer leaves unfinished frames on the main connection, so it is
+        replaced before TransferCancelled is raised.
+        """
+        self.transfer = TransferProgress(name, total)
+
+        try:
+            return transfer(*args)
+        except TransferCancelled:
+            self.transfer = None
+
+            try:
+                self.reconnect()
+            except (OSError, protocol.ProtocolError):
+                self.connected = False
+
+            raise
+        finally:
+            self.transfer = None
+
+    def _trackProgress(self, count):
+        """
+        Adds bytes moved to the transfer in flight, raising TransferCancelled
+        if it was cancelled
+        """
+        if self.transfer is not None:
+            self.transfer.add(count)
+
+    def _checkCancelled(self):
+        if self.transfer is not None:
+            self.transfer.check()
+
+    def _trackBlocks(self, blocks):
+        for block in blocks:
+            yield block
+            self._trackProgress(len(block))
+
+    def _sendStoreRequest(self, request, f, offset, file_size):
+        """
+        Sends a /store request with the contents of an open file from offset,
+        compressed if the server supports the codec and a sample of the file
+        shrinks
+
+        Returns:
+        - The TransferStats of the body
+        """
+        codec = self.compression_codec if self.compression_codec in self.codecs else None
+        f.seek(offset)
+
+        if codec and not compression.isCompressible(f.read(compression.SAMPLE_SIZE)):
+            codec = None
+
+        f.seek(offset)
+        stats = compression.TransferStats(codec)
+
+        if codec is None:
+            # Stream the contents from disk with the size declared up front
+            self._sendRequestFile(request, f, file_size - offset, self._trackProgress)
+            stats.add(file_size - offset, file_size - offset)
+        else:
+            request["encoding"] = codec
+            request_id = self._sendRequest(request)
+            compressor = compression.createCompressor(codec, self.compression_level)
+            compression.sendCompressedBlocks(self.sock, request_id,
+                                             self._trackBlocks(compression.readBlocks(f, file_size - offset)),
+                                             compressor, stats)
+
+        return stats
+
+    def _buildGetRequest(self, filename, offset=0, end=None):
+        request = {"command": "/get", "filename": filename, "offset": offset}
+
+        if end is not None:
+            request["end"] = end
+
+        if self.compression_codec in self.codecs:
+            request["accept_encoding"] = [self.compression_codec]
+            request["level"] = self.compression_level
+
+        return request
+
+    def _iterBody(self, sock, header, length, stats):
+        """
+        Yields the file contents carried by a /get response, decompressing
+        them if the server compressed them, and counts them in stats
+        """
+        encoding = header.get("encoding")
+        stats.codec = encoding
+
+        if encoding is None:
+            for chunk in protocol.recvChunks(sock, length):
+                stats.add(len(chunk), len(chunk))
+                yield chunk
+        else:
+            yield from compression.recvCompressed(sock, compression.createDecompressor(encoding),
+                                                  header["end"] - header["offset"], stats)
+
+    def _uploadFile(self, file_path, filename):
+        self.last_transfer_stats = None
+        token = secrets.token_hex(16)
+        digest = None
+
+        # A server with deduplicating storage can store the file by reference if it already has the contents
+        if "dedup" in self.features:
+            digest = hashFile(file_path)
+            header, _ = self._sendAndReceive({"command": "/link", "filename": filename, "hash": digest})
+
+            if header.get("linked"):
+                return header
+
+        # A server holding an older version only needs the blocks that changed
+        if self.delta and "delta" in self.features and os.path.getsize(file_path) >= MIN_DELTA_SIZE:
+            digest = digest or hashFile(file_path)
+            header = self._uploadDelta(file_path, filename, digest)
+
+            if header is not None:
+                return header
+
+        with open(file_path, 'rb') as f:
+            file_size = os.fstat(f.fileno()).st_size
+            offset = 0
+
+            for attempt in range(MAX_RESUME_ATTEMPTS + 1):
+                try:
+                    if attempt > 0:
+                        self.reconnect()
+
+                        # Ask the server how much of the upload it already wrote
+                        self._sendRequest({"command": "/resume", "token": token})
+                        header, _ = self._recvResponse()
+                        if header.get("status") != "ok":
+                            return header
+                        offset = header["offset"]
+
+                    request = {"command": "/store", "filename": filename, "size": file_size,
+                               "token": token, "offset": offset}
+                    if digest:
+                        request["hash"] = digest
+
+                    stats = self._sendStoreRequest(request, f, offset, file_size)
+                    header, _ = self._recvResponse()
+                    self.last_transfer_stats = stats.finish()
+                    return header
+
+                except OSError:
+                    # A cancelled transfer fails with the socket shut down under it; it must not resume
+                    self._checkCancelled()
+                    if attempt == MAX_RESUME_ATTEMPTS:
+                        raise
+                    time.sleep(getBackoffDelay(attempt))
+
+    def _uploadDelta(self, file_path, filename, digest):
+        """
+        Uploads a file as copy instructions for the blocks the server's copy
+        already has and the bytes in between
+
+        Returns:
+        - The header of the server's response, or None if the file should be
+          uploaded whole: the server has no copy, too much of the file
+          changed, the server's copy changed meanwhile, or the connection
+          dropped
+        """
+        try:
+            stats = compression.TransferStats("delta")
+            header, signatures = self._sendAndReceive({"command": "/signature", "filename": filename})
+
+            if header.get("status") != "ok":
+                return None
+
+            block_size = header["block_size"]
+
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                file_size = len(view)
+                ops = deltaSync.computeDelta(view, deltaSync.parseSignatures(signatures), block_size,
+                                             min(MAX_DELTA_LITERAL, file_size // 4))
+
+                if ops is None:
+                    return None
+
+                request = {"command": "/store", "filename": filename, "size": file_size, "hash": digest,
+                           "delta": {"block_size": block_size, "base_size": header["base_size"],
+                                     "base_mtime_ns": header["base_mtime_ns"]}}
+                length = deltaSync.getDeltaLength(ops)
+
+                self._sendRequestChunks(request, deltaSync.iterDelta(view, ops, block_size), length)
+                stats.add(file_size, length)
+
+            header, _ = self._recvResponse()
+        except OSError:
+            # Delta uploads do not resume; the whole upload that follows reconnects and does
+            self._checkCancelled()
+            return None
+
+        if header.get("status") != "ok":
+            return None
+
+        self.last_transfer_stats = stats.finish()
+        return header
+
+    def _downloadFile(self, filename, file_path):
+        """
+        Downloads a file, resuming after the bytes already written whenever
+        the connection drops
+
+        Returns:
+        - The header of the server's last response
+        """
+        def requestRange(offset):
+            self._sendRequest(self._buildGetRequest(filename, offset))
+            return protocol.recvFrameHead(self.sock)
+
+        self.last_transfer_stats = None
+        temp_path = os.path.join(os.path.dirname(file_path), "." + os.path.basename(file_path) + ".part")
+        received = 0
+        file_size = None
+
+        try:
+            with open(temp_path, 'wb') as f:
+                for attempt in range(MAX_RESUME_ATTEMPTS + 1):
+                    try:
+                        if attempt > 0:
+                            self.reconnect()
+
+                        _, _, header, length = requestRange(received)
+
+                        if header.get("status") != "ok":
+                            protocol.discardPayload(self.sock, length)
+                            break
+
+                        # Start over if the file changed on the server since the last attempt
+                        if file_size is not None and header.get("size") != file_size:
+                            protocol.discardPayload(self.sock, length)
+                            if header.get("encoding"):
+                                compression.discardCompressed(self.sock)
+
+                            _, _, header, length = requestRange(0)
+                            received = 0
+                            f.seek(0)
+                            f.truncate()
+
+                        file_size = header.get("size")
+
+                        if self.transfer is not None:
+                            self.transfer.total = file_size
+
+                        stats = compression.TransferStats()
+
+                        # Write the file data to the local file as it arrives
+                        for chunk in self._iterBody(self.sock, header, length, stats):
+                            f.write(chunk)
+                            received += len(chunk)
+                            self._trackProgress(len(chunk))
+
+                        self.last_transfer_stats = stats.finish()
+                        break
+
+                    except OSError:
+                        self._checkCancelled()
+                        if attempt == MAX_RESUME_ATTEMPTS:
+                            raise
+                        f.flush()
+                        time.sleep(getBackoffDelay(attempt))
+
+            if header.get("status") == "ok":
+                os.replace(temp_path, file_path)
+
+            return header
+
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _openSegmentConnection(self):
+        """
+        Opens another connection to the server and attaches it to the alias
+        registered on the main connection
+
+        Returns:
+        - The connected socket
+        """
+        sock = openSocket(self.address, self.port)
+
+        try:
+            _, _, header, _ = protocol.recvFrame(sock)
+
+            if header.get("status") == "ok":
+                request = {"command": "/attach", "alias": self.alias, "session": self.session}
+                protocol.sendFrame(sock, protocol.FRAME_REQUEST, 1, request)
+                _, _, header, _ = protocol.recvFrame(sock)
+
+            if header.get("status") != "ok":
+                raise ConnectionError(header.get("message", ""))
+        except BaseException:
+            sock.close()
+            raise
+
+        return sock
+
+    def _fetchSegment(self, filename, temp_path, start, end, file_size):
+        """
+        Downloads bytes [start, end) of a file on a connection of its own into
+        the preallocated temporary file, resuming after the bytes already
+        written whenever the connection drops
+
+        Returns:
+        - A tuple of (header of the server's last response, TransferStats)
+        """
+        received = start
+        stats = compression.TransferStats()
+        transfer = self.transfer
+
+        # Every way out, errors included, ends the segment's timing
+        try:
+            with open(temp_path, 'r+b') as f:
+                for attempt in range(MAX_RESUME_ATTEMPTS + 1):
+                    sock = None
+
+                    try:
+                        self._checkCancelled()
+                        sock = self._openSegmentConnection()
+
+                        if transfer is not None:
+                            transfer.watch(sock)
+
+                        protocol.sendFrame(sock, protocol.FRAME_REQUEST, 2,
+                                           self._buildGetRequest(filename, received, end))
+                        _, _, header, length = protocol.recvFrameHead(sock)
+
+                        if header.get("status") != "ok":
+                            return header, stats
+
+                        if header.get("size") != file_size:
+                            return {"status": "error",
+                                    "message": "Error: File changed on the server during the download."}, stats
+
+                        f.seek(received)
+
+                        for chunk in self._iterBody(sock, header, length, stats):
+                            f.write(chunk)
+                            received += len(chunk)
+                            self._trackProgress(len(chunk))
+
+                        return header, stats
+
+                    except OSError:
+                        self._checkCancelled()
+                        if attempt == MAX_RESUME_ATTEMPTS:
+                            raise
+                        time.sleep(getBackoffDelay(attempt))
+                    finally:
+                        if sock is not None:
+                            if transfer is not None:
+                                transfer.unwatch(sock)
+                            sock.close()
+        finally:
+            stats.finish()
+
+    def _downloadSegmented(self, filename, file_path, segments):
+        """
+        Downloads a file as byte ranges fetched in parallel over several
+        connections, written straight into place in a preallocated file
+
+        Returns:
+        - A tuple of (header of the server's response, list of TransferStats
+          per segment); files too small to split are downloaded over the main
+          connection and have no segment stats
+        """
+        # An empty range tells the client the file's size without sending any of it
+        header, _ = self._sendAndReceive({"command": "/get", "filename": filename, "offset": 0, "end": 0})
+
+        if header.get("status") != "ok":
+            return header, []
+
+        file_size = header["size"]
+        segments = min(segments, file_size // MIN_SEGMENT_SIZE)
+
+        if self.transfer is not None:
+            self.transfer.total = file_size
+
+        if segments <= 1:
+            return self._downloadFile(filename, file_path), []
+
+        self.last_transfer_stats = None
+        temp_path = os.path.join(os.path.dirname(file_path), "." + os.path.basename(file_path) + ".part")
+        total = compression.TransferStats()
+
+        try:
+            # Reserve the whole file up front so segments write into place without fragmenting it
+            with open(temp_path, 'wb') as f:
+                try:
+                    os.posix_fallocate(f.fileno(), 0, file_size)
+                except (AttributeError, OSError):
+                    f.truncate(file_size)
+
+            step = -(-file_size // segments)
+            bounds = [(start, min(start + step, file_size)) for start in range(0, file_size, step)]
+
+            with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+                futures = [executor.submit(self._fetchSegment, filename, temp_path, start, end, file_size)
+                           for start, end in bounds]
+                results = [future.result() for future in futures]
+
+            for segment_header, stats in results:
+                if segment_header.get("status") != "ok":
+                    return segment_header, []
+
+                total.add(stats.raw_bytes, stats.wire_bytes)
+                total.codec = total.codec or stats.codec
+
+            os.replace(temp_path, file_path)
+            self.last_transfer_stats = total.finish()
+
+            return header, [stats for _, stats in results]
+
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _runPipelined(self, count, sendOne, receiveOne):
+        """
+        Sends count requests over the main connection, keeping up to
+        self.window of them ahead of their responses, and collects the
+        responses in order. After a dropped connection the client reconnects
+        and sends every request that was not answered yet again.
+
+        Parameters:
+        - sendOne: Called with an index to send that request; returns a
+          header to record as the result without sending anything, or None
+        - receiveOne: Called with the index of the oldest request in flight to
+          read its response; returns the result to record
+
+        Returns:
+        - The list of results, one per request
+        """
+        results = [None] * count
+
+        for attempt in range(MAX_RESUME_ATTEMPTS + 1):
+            try:
+                if attempt > 0:
+                    self.reconnect()
+
+                in_flight = deque()
+                next_index = 0
+
+                while True:
+                    # Keep the window full, skipping requests already answered before a reconnect
+                    while next_index < count and len(in_flight) < self.window:
+                        if results[next_index] is None:
+                            results[next_index] = sendOne(next_index)
+                            if results[next_index] is None:
+                                in_flight.append(next_index)
+                        next_index += 1
+
+                    if not in_flight:
+                        return results
+
+                    index = in_flight.popleft()
+                    results[index] = receiveOne(index)
+
+            except OSError:
+                self._checkCancelled()
+                if attempt == MAX_RESUME_ATTEMPTS:
+                    raise
+                time.sleep(getBackoffDelay(attempt))
+
+    def _storeFiles(self, paths):
+        total = compression.TransferStats()
+        sent_stats = {}
+
+        def sendOne(index):
+            try:
+                f = open(paths[index], 'rb')
+            except OSError as e:
+                return {"status": "error", "message": f"Error: {e.strerror}."}
+
+            with f:
+                file_size = os.fstat(f.fileno()).st_size
+                request = {"command": "/store", "filename": os.path.basename(paths[index]), "size": file_size}
+                sent_stats[index] = self._sendStoreRequest(request, f, 0, file_size)
+
+            return None
+
+        def receiveOne(index):
+            header, _ = self._recvResponse()
+
+            if header.get("status") == "ok":
+                stats = sent_stats[index]
+                total.add(stats.raw_bytes, stats.wire_bytes)
+                total.codec = total.codec or stats.codec
+
+            return header
+
+        results = self._runPipelined(len(paths), sendOne, receiveOne)
+        self.last_transfer_stats = total.finish()
+
+        return list(zip(paths, results)), self.last_transfer_stats
+
+    def _getFiles(self, names, directory):
+        total = compression.TransferStats()
+
+        def sendOne(index):
+            self._sendRequest(self._buildGetRequest(names[index]))
+            return None
+
+        def receiveOne(index):
+            _, _, header, length = protocol.recvFrameHead(self.sock)
+
+            if header.get("status") != "ok":
+                protocol.discardPayload(self.sock, length)
+                return header
+
+            file_path = os.path.join(directory, os.path.basename(names[index]))
+            temp_path = os.path.join(directory, "." + os.path.basename(names[index]) + ".part")
+            stats = compression.TransferStats()
+
+            try:
+                with open(temp_path, 'wb') as f:
+                    for chunk in self._iterBody(self.sock, header, length, stats):
+                        f.write(chunk)
+                        self._trackProgress(len(chunk))
+
+                os.replace(temp_path, file_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+            total.add(stats.raw_bytes, stats.wire_bytes)
+            total.codec = total.codec or stats.codec
+
+            return header
+
+        results = self._runPipelined(len(names), sendOne, receiveOne)
+        self.last_transfer_stats = total.finish()
+
+        return list(zip(names, results)), self.last_transfer_stats
+
+
+class AsyncFileExchangeClient:
+    """
+    FileExchangeClient for asyncio programs. Every call runs the blocking
+    client on a thread of its own, one call at a time, so the event loop
+    never waits on the network. Cancelling a task awaiting a transfer
+    cancels the transfer.
+
+    Parameters are the same as FileExchangeClient's.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.client = FileExchangeClient(*args, **kwargs)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, functools.partial(method, *args))
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The thread cannot be interrupted, but its transfer can; its TransferCancelled is dropped
+            self.client.cancel()
+            future.add_done_callback(lambda done: done.cancelled() or done.exception())
+            raise
+
+    async def connect(self, address, port):
+        return await self._call(self.client.connect, address, port)
+
+    async def register(self, alias):
+        return await self._call(self.client.register, alias)
+
+    async def leave(self):
+        return await self._call(self.client.leave)
+
+    async def dir(self):
+        return await self._call(self.client.dir)
+
+    async def listFiles(self, pattern=None, prefix=None, sort="name", descending=False, limit=None, cursor=None):
+        return await self._call(self.client.listFiles, pattern, prefix, sort, descending, limit, cursor)
+
+    async def stats(self):
+        return await self._call(self.client.stats)
+
+    async def store(self, file_path, filename=None):
+        return await self._call(self.client.store, file_path, filename)
+
+    async def get(self, filename, file_path=None):
+        return await self._call(self.client.get, filename, file_path)
+
+    async def storeMany(self, patterns):
+        return await self._call(self.client.storeMany, patterns)
+
+    async def getMany(self, patterns, directory=None):
+        return await self._call(self.client.getMany, patterns, directory)
+
+    def cancel(self):
+        return self.client.cancel()
+
+    async def close(self):
+        await self._call(self.client.close)
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,334 @@
+'''
+    File Index
+    This module keeps the metadata of every file in the File Exchange
+    System server's directory in memory: its size, modification time,
+    content hash, the alias that uploaded it and how often it was
+    downloaded. Changes are appended to a journal by a background thread
+    and folded into a snapshot once the journal grows, so the index
+    survives restarts without being written out on every request. /dir
+    listings and queries are answered from the index alone.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import base64                       # For opaque pagination cursors
+import fnmatch                      # For glob filters
+import json                         # For the snapshot, the journal and cursors
+import os                           # For file-related operations
+import queue                        # For files waiting to be hashed
+import threading                    # For the index lock and the background threads
+import time                         # For the journal flush interval
+
+from contentStore import hashFile   # For the content hashes
+from serverLog import log
+
+
+# Global Variables
+SNAPSHOT_NAME       = ".index.json"
+JOURNAL_NAME        = ".index.journal"
+FLUSH_INTERVAL      = 1.0           # Seconds between journal writes
+COMPACT_AFTER       = 10000         # Journal lines before the snapshot is rewritten
+SORT_KEYS           = ("name", "size", "mtime", "downloads")
+MAX_PAGE_SIZE       = 1000          # Entries returned by one query at most
+
+
+class FileIndex:
+    """
+    Metadata of the files in a directory, kept in memory and persisted as
+    a snapshot plus a journal of later changes
+
+    Parameters:
+    - save_dir: Directory holding the files (and the index files)
+    - flush_interval: Seconds between journal writes
+    - compact_after: Journal lines before the snapshot is rewritten
+    """
+
+    def __init__(self, save_dir, flush_interval=FLUSH_INTERVAL, compact_after=COMPACT_AFTER):
+        self.save_dir = save_dir
+        self.snapshot_path = os.path.join(save_dir, SNAPSHOT_NAME)
+        self.journal_path = os.path.join(save_dir, JOURNAL_NAME)
+        self.flush_interval = flush_interval
+        self.compact_after = compact_after
+        self._entries = {}
+        self._pending = []          # Journal lines not yet written
+        self._downloads = {}        # Downloads not yet journaled, by name
+        self._journal_lines = 0
+        self._lock = threading.Lock()
+        self._hashes = queue.Queue()
+
+    # Persistence
+    def load(self):
+        """
+        Reads the snapshot and journal, brings the index in line with the
+        files actually in the directory, and starts the journal writer and
+        the background hasher
+
+        Returns:
+        - A tuple of (files added or changed outside the server, files
+          removed outside the server)
+        """
+        entries = {}
+
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as snapshot:
+                entries = {entry["name"]: entry for entry in json.load(snapshot)}
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        try:
+            with open(self.journal_path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        self._replay(entries, json.loads(line))
+                    except (ValueError, KeyError, TypeError):
+                        # A line cut short by a crash ends the journal
+                        break
+        except OSError:
+            pass
+
+        changed, removed = self._reconcile(entries)
+        self._entries = entries
+        self.compact()
+
+        threading.Thread(target=self._writeJournal, daemon=True).start()
+        threading.Thread(target=self._hashFiles, daemon=True).start()
+
+        return changed, removed
+
+    def _replay(self, entries, change):
+        if change["op"] == "put":
+            entries[change["entry"]["name"]] = change["entry"]
+        elif change["op"] == "remove":
+            entries.pop(change["name"], None)
+        elif change["op"] == "download" and change["name"] in entries:
+            entries[change["name"]]["downloads"] += change["count"]
+
+    def _reconcile(self, entries):
+        # Files added, replaced or deleted while the server was down
+        os.makedirs(self.save_dir, exist_ok=True)
+        on_disk = {}
+        changed = 0
+
+        with os.scandir(self.save_dir) as scan:
+            for item in scan:
+                if not item.name.startswith(".") and item.is_file():
+                    on_disk[item.name] = item.stat()
+
+        missing = [name for name in entries if name not in on_disk]
+
+        for name in missing:
+            del entries[name]
+
+        for name, stat in on_disk.items():
+            entry = entries.get(name)
+
+            if entry is None or (entry["size"], entry["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                entries[name] = {"name": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": None,
+                                 "uploader": None, "downloads": entry["downloads"] if entry else 0}
+                changed += 1
+
+            if entries[name]["hash"] is None:
+                self._hashes.put(name)
+
+        return changed, len(missing)
+
+    def compact(self):
+        """
+        Writes every entry to a new snapshot and empties the journal
+        """
+        with self._lock:
+            self._flushDownloads()
+            entries = [dict(entry) for entry in self._entries.values()]
+            self._pending = []
+            self._journal_lines = 0
+
+        temp_path = self.snapshot_path + ".tmp"
+
+        with open(temp_path, "w", encoding="utf-8") as snapshot:
+            json.dump(entries, snapshot)
+
+        os.replace(temp_path, self.snapshot_path)
+        open(self.journal_path, "w").close()
+
+    def flush(self):
+        """
+        Appends the changes made since the last flush to the journal
+        """
+        with self._lock:
+            self._flushDownloads()
+            lines, self._pending = self._pending, []
+            self._journal_lines += len(lines)
+            compact = self._journal_lines >= self.compact_after
+
+        if compact:
+            self.compact()
+        elif lines:
+            with open(self.journal_path, "a", encoding="utf-8") as journal:
+                journal.write("".join(lines))
+
+    def _flushDownloads(self):
+        # Downloads are counted in memory and journaled as one line per file per flush
+        for name, count in self._downloads.items():
+            self._pending.append(json.dumps({"op": "download", "name": name, "count": count}) + "\n")
+
+        self._downloads = {}
+
+    def _writeJournal(self):
+        while True:
+            time.sleep(self.flush_interval)
+
+            try:
+                self.flush()
+            except OSError as e:
+                log.error("Could not write the file index: %s", e)
+
+    def _hashFiles(self):
+        while True:
+            name = self._hashes.get()
+            path = os.path.join(self.save_dir, name)
+
+            try:
+                before = os.stat(path)
+                digest = hashFile(path)
+                after = os.stat(path)
+            except OSError:
+                continue
+
+            # A file replaced while it was being hashed is hashed again by the put that replaced it
+            if (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns):
+                with self._lock:
+                    entry = self._entries.get(name)
+
+                    if entry is not None and (entry["size"], entry["mtime_ns"]) == (after.st_size, after.st_mtime_ns):
+                        entry["hash"] = digest
+                        self._journal("put", entry=dict(entry))
+
+    def _journal(self, op, **fields):
+        fields["op"] = op
+        self._pending.append(json.dumps(fields) + "\n")
+
+    # Changes
+    def put(self, name, digest=None, uploader=None):
+        """
+        Records a file stored in the directory, reading its size and
+        modification time, and hashes it in the background if digest is None
+        """
+        stat = os.stat(os.path.join(self.save_dir, name))
+
+        with self._lock:
+            previous = self._entries.get(name)
+            entry = {"name": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest,
+                     "uploader": uploader, "downloads": previous["downloads"] if previous else 0}
+            self._entries[name] = entry
+            self._journal("put", entry=dict(entry))
+
+        if digest is None:
+            self._hashes.put(name)
+
+    def remove(self, name):
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self._journal("remove", name=name)
+
+    def recordDownload(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+
+            if entry is not None:
+                entry["downloads"] += 1
+                self._downloads[name] = self._downloads.get(name, 0) + 1
+
+    # Queries
+    def names(self):
+        with self._lock:
+            return sorted(self._entries)
+
+    def query(self, pattern=None, prefix=None, sort="name", descending=False, limit=MAX_PAGE_SIZE, cursor=None):
+        """
+        Lists the entries matching a glob pattern and a name prefix, sorted,
+        one page at a time
+
+        Parameters:
+        - pattern: Glob the names must match, or None
+        - prefix: Start the names must have, or None
+        - sort: One of SORT_KEYS, with ties broken by name
+        - descending: Whether the largest values come first
+        - limit: Entries in the page, at most MAX_PAGE_SIZE
+        - cursor: The cursor returned with the previous page, or None
+
+        Returns:
+        - A tuple of (list of entries, number of entries matching, cursor of
+          the next page or None on the last page)
+
+        Raises ValueError for an unknown sort key, a bad limit or a bad cursor.
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Error: Sort by one of: {', '.join(SORT_KEYS)}.")
+        if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+            raise ValueError("Error: Limit must be a positive number.")
+
+        limit = min(limit, MAX_PAGE_SIZE)
+        after = decodeCursor(cursor, sort, descending) if cursor is not None else None
+
+        with self._lock:
+            entries = [entry for name, entry in self._entries.items()
+                       if (prefix is None or name.startswith(prefix))
+                       and (pattern is None or fnmatch.fnmatchcase(name, pattern))]
+
+        total = len(entries)
+        entries = [(getSortKey(entry, sort), entry) for entry in entries]
+        entries.sort(key=lambda item: item[0], reverse=descending)
+
+        # Pages continue after the last key returned, so files stored between pages do not shift them
+        if after is not None:
+            entries = [item for item in entries if (item[0] < after if descending else item[0] > after)]
+
+        page = entries[:limit]
+        next_cursor = encodeCursor(page[-1][0], sort, descending) if len(entries) > limit else None
+
+        return [describeEntry(entry) for _, entry in page], total, next_cursor
+
+    def getStats(self):
+        """
+        Returns a dictionary of files indexed and files waiting to be hashed
+        """
+        return {"files": len(self._entries), "hashing": self._hashes.qsize()}
+
+
+# Function Definitions
+def getSortKey(entry, sort):
+    value = entry["mtime_ns"] if sort == "mtime" else entry[sort]
+
+    return (value, entry["name"]) if sort != "name" else (value, "")
+
+
+def describeEntry(entry):
+    # Modification times go out in seconds, like os.path.getmtime
+    return {"name": entry["name"], "size": entry["size"], "mtime": entry["mtime_ns"] / 1e9,
+            "hash": entry["hash"], "uploader": entry["uploader"], "downloads": entry["downloads"]}
+
+
+def encodeCursor(key, sort, descending):
+    # The sort and its direction go with the key, so a cursor only continues the listing that issued it
+    return base64.urlsafe_b64encode(json.dumps([sort, descending] + list(key)).encode()).decode()
+
+
+def decodeCursor(cursor, sort, descending):
+    try:
+        cursor_sort, cursor_descending, value, name = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError("Error: Invalid cursor.")
+
+    # Names sort by their text; every other key is a number
+    value_type = str if sort == "name" else int
+
+    if (cursor_sort, cursor_descending) != (sort, descending) or not isinstance(name, str) \
+            or not isinstance(value, value_type) or isinstance(value, bool):
+        raise ValueError("Error: Invalid cursor.")
+
+    return (value, name)
@@ -0,0 +1,530 @@
+'''
+    Load Generator
+    This script benchmarks the File Exchange System server. It starts the
+    server on loopback in a scratch directory (or targets one already
+    running), simulates many clients issuing a weighted mix of /register,
+    /dir, /store and /get with files drawn from a size distribution, and
+    reports throughput, latency percentiles, errors and the server's
+    resident memory. Results are written as JSON so runs of different
+    versions can be compared.
+
+    Each simulated client is a thread with its own connection, issuing its
+    next request as soon as the last one is answered (plus any think time).
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import argparse                     # For command-line options
+import json                         # For the results file
+import os                           # For file-related operations
+import platform                     # For describing the machine in the results
+import random                       # For the request mix and file sizes
+import shlex                        # For extra server options
+import shutil                       # For removing the scratch directory
+import socket                       # For finding a free port
+import subprocess                   # For running the server
+import sys                          # For the Python interpreter and exit status
+import tempfile                     # For the scratch directory
+import threading                    # For the simulated clients and the memory sampler
+import time                         # For latencies and the run duration
+from datetime import datetime       # For the results timestamp
+
+from fileExchangeClient import FileExchangeClient   # For the protocol
+
+
+# Global Variables
+OPERATIONS          = ("register", "dir", "store", "get")
+DEFAULT_MIX         = "register=1,dir=2,store=2,get=5"
+DEFAULT_SIZES       = "1KiB=4,64KiB=3,1MiB=2,16MiB=1"
+SIZE_UNITS          = {"B": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3}
+PERCENTILES         = (50, 90, 99, 99.9)
+SEED_FILES_PER_SIZE = 4             # Server files per size class for /get to fetch
+RSS_SAMPLE_INTERVAL = 0.5           # Seconds between samples of the server's memory
+SERVER_START_TIMEOUT = 10           # Seconds to wait for a started server to accept connections
+SCRIPT_DIR          = os.path.dirname(os.path.abspath(__file__))
+
+
+# Function Definitions
+def parseWeights(text, allowed=None):
+    """
+    Parses "name=weight,..." into a list of (name, weight) pairs
+
+    Raises ValueError for unknown names or weights that are not positive.
+    """
+    weights = []
+
+    for item in text.split(","):
+        name, _, weight = item.strip().partition("=")
+        weight = float(weight) if weight else 1.0
+
+        if (allowed is not None and name not in allowed) or weight <= 0:
+            raise ValueError(f"Invalid weight {item!r}.")
+
+        weights.append((name, weight))
+
+    return weights
+
+
+def parseSize(text):
+    """
+    Parses a size such as 512, 64KiB or 16MiB into bytes
+    """
+    for unit in sorted(SIZE_UNITS, key=len, reverse=True):
+        if text.endswith(unit) and text[:-len(unit)].strip().isdigit():
+            return int(text[:-len(unit)]) * SIZE_UNITS[unit]
+
+    if text.isdigit():
+        return int(text)
+
+    raise ValueError(f"Invalid size {text!r}.")
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+
+    rank = max(1, int(-(-p * len(sorted_values) // 100)))
+
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def makeContents(size, text, rng):
+    if text:
+        line = b"".join(rng.choice([b"alpha,", b"beta,", b"gamma,", b"delta,", b"42,", b"\n"]) for _ in range(64))
+        return (line * (size // len(line) + 1))[:size]
+
+    return rng.randbytes(size)
+
+
+def findFreePort():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def readRss(pid):
+    """
+    Returns the resident memory of a process in KiB, or None where /proc
+    is not available
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return None
+
+
+class RssSampler:
+    """
+    Samples a process's resident memory in the background
+
+    Parameters:
+    - pid: Process to sample
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+        return self.getStats()
+
+    def _sample(self):
+        while True:
+            rss = readRss(self.pid)
+            if rss is not None:
+                self.samples.append(rss)
+
+            if self._stopped.wait(RSS_SAMPLE_INTERVAL):
+                break
+
+    def getStats(self):
+        if not self.samples:
+            return None
+
+        return {"start_kib": self.samples[0], "peak_kib": max(self.samples), "end_kib": self.samples[-1]}
+
+
+def startServer(work_dir, server_args):
+    """
+    Starts serverApp.py on a free loopback port with work_dir as its
+    working directory, and waits until it accepts connections
+
+    Returns:
+    - A tuple of (server process, port)
+    """
+    port = findFreePort()
+    os.makedirs(os.path.join(work_dir, "Server Directory"), exist_ok=True)
+
+    process = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, "serverApp.py"), "127.0.0.1", str(port)]
+                               + server_args, cwd=work_dir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("The server did not start.")
+            time.sleep(0.05)
+
+
+class OperationStats:
+    """Latencies, errors and bytes of one kind of request."""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = {}
+        self.bytes = 0
+
+    def addError(self, message):
+        self.errors[message] = self.errors.get(message, 0) + 1
+
+    def merge(self, other):
+        self.latencies.extend(other.latencies)
+        self.bytes += other.bytes
+
+        for message, count in other.errors.items():
+            self.errors[message] = self.errors.get(message, 0) + count
+
+    def summarize(self, elapsed):
+        latencies = sorted(self.latencies)
+        summary = {"ok": len(latencies), "errors": sum(self.errors.values()),
+                   "ops_per_sec": len(latencies) / elapsed, "bytes": self.bytes,
+                   "mb_per_sec": self.bytes / elapsed / 1e6, "latency_ms": None, "error_messages": self.errors}
+
+        if latencies:
+            summary["latency_ms"] = {"mean": sum(latencies) / len(latencies) * 1000, "max": latencies[-1] * 1000}
+            for p in PERCENTILES:
+                summary["latency_ms"][f"p{p:g}"] = percentile(latencies, p) * 1000
+
+        return summary
+
+
+class SimulatedClient:
+    """
+    One client issuing requests from the mix until the run ends
+
+    Parameters:
+    - index: Number of the client, used in its alias and filenames
+    - options: Parsed command-line options
+    - seeds: Server filenames for /get to fetch
+    - payloads: Local files for /store, one per size class
+    - work_dir: Scratch directory the client downloads into
+    """
+
+    def __init__(self, index, options, seeds, payloads, work_dir):
+        self.index = index
+        self.options = options
+        self.seeds = seeds
+        self.payloads = payloads
+        self.download_path = os.path.join(work_dir, f"client-{index}.bin")
+        self.rng = random.Random(options.seed * 100003 + index)
+        self.stats = {operation: OperationStats() for operation in OPERATIONS}
+        self.client = self.newClient()
+        self.retry_after = 0        # Seconds a busy server asked this client to wait
+
+    def newClient(self):
+        return FileExchangeClient(codec=self.options.codec, segments=self.options.segments)
+
+    def connect(self):
+        # The client keeps its session token, so reconnecting after an error reclaims the alias
+        header = self.client.connect(self.options.ip, self.options.port)
+
+        if header.get("status") == "ok":
+            header = self.client.register(f"load-{self.index}")
+
+        if header.get("status") != "ok":
+            self.client.close()
+            self.retry_after = header.get("retry_after_ms", 0) / 1000
+            raise ConnectionError(header.get("message", ""))
+
+    def run(self, start_event, stop_event):
+        operations = [name for name, _ in self.options.mix]
+        weights = [weight for _, weight in self.options.mix]
+        sizes = [size for size, _ in self.options.sizes]
+        size_weights = [weight for _, weight in self.options.sizes]
+
+        start_event.wait()
+
+        while not stop_event.is_set():
+            operation = self.rng.choices(operations, weights)[0]
+            size = self.rng.choices(sizes, size_weights)[0]
+            stats = self.stats[operation]
+
+            try:
+                if not self.client.connected:
+                    self.connect()
+
+                started = time.perf_counter()
+                ok, message, moved = self.perform(operation, size)
+                elapsed = time.perf_counter() - started
+            except Exception as e:
+                # The connection may be left mid-frame, so it is replaced before the next request
+                ok, message, moved = False, f"{type(e).__name__}: {e}", 0
+                self.client.close()
+
+            if ok:
+                stats.latencies.append(elapsed)
+                stats.bytes += moved
+            else:
+                stats.addError(message)
+
+            if self.retry_after:
+                stop_event.wait(self.retry_after)
+                self.retry_after = 0
+            elif self.options.think_time:
+                stop_event.wait(self.options.think_time / 1000)
+
+        if self.client.connected:
+            self.client.close()
+
+    def perform(self, operation, size):
+        """
+        Issues one request
+
+        Returns:
+        - A tuple of (succeeded, error message, bytes of file data moved)
+        """
+        if operation == "register":
+            # A whole session: connect, register and leave on a connection of its own
+            client = self.newClient()
+            try:
+                header = client.connect(self.options.ip, self.options.port)
+                if header.get("status") == "ok":
+                    header = client.register(f"load-{self.index}-session")
+                if header.get("status") == "ok":
+                    header = client.leave()
+            finally:
+                client.close()
+            return header.get("status") == "ok", header.get("message", ""), 0
+
+        if operation == "dir":
+            header, _ = self.client.dir()
+            return header.get("status") == "ok", header.get("message", ""), 0
+
+        if operation == "store":
+            header = self.client.store(self.payloads[size], f"load-{self.index}-{size}.bin")
+            return header.get("status") == "ok", header.get("message", ""), size
+
+        header, _ = self.client.get(self.rng.choice(self.seeds[size]), self.download_path)
+        return header.get("status") == "ok", header.get("message", ""), header.get("size", 0)
+
+
+def seedServer(options, work_dir):
+    """
+    Writes one local file per size class for /store and uploads
+    SEED_FILES_PER_SIZE files per size class for /get
+
+    Returns:
+    - A tuple of (size to server filenames, size to local path)
+    """
+    rng = random.Random(options.seed)
+    payloads = {}
+    seeds = {}
+    client = FileExchangeClient(codec=options.codec)
+
+    header = client.connect(options.ip, options.port)
+    if header.get("status") == "ok":
+        header = client.register("load-seed")
+    if header.get("status") != "ok":
+        raise RuntimeError(header.get("message", ""))
+
+    try:
+        for size, _ in options.sizes:
+            payloads[size] = os.path.join(work_dir, f"payload-{size}.bin")
+            seeds[size] = []
+
+            for n in range(SEED_FILES_PER_SIZE):
+                with open(payloads[size], "wb") as f:
+                    f.write(makeContents(size, options.text, rng))
+
+                name = f"seed-{size}-{n}.bin"
+                header = client.store(payloads[size], name)
+                if header.get("status") != "ok":
+                    raise RuntimeError(header.get("message", ""))
+
+                seeds[size].append(name)
+    finally:
+        client.leave()
+
+    return seeds, payloads
+
+
+def getRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SCRIPT_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def runLoad(options):
+    """
+    Runs one benchmark
+
+    Returns:
+    - The results as a dictionary ready to be written as JSON
+    """
+    work_dir = tempfile.mkdtemp(prefix="fes-load-")
+    process = None
+    sampler = None
+
+    try:
+        if options.ip is None:
+            process, options.port = startServer(work_dir, shlex.split(options.server_args))
+            options.ip = "127.0.0.1"
+            sampler = RssSampler(process.pid)
+            sampler.start()
+
+        seeds, payloads = seedServer(options, work_dir)
+
+        clients = [SimulatedClient(index, options, seeds, payloads, work_dir) for index in range(options.clients)]
+        start_event = threading.Event()
+        stop_event = threading.Event()
+        threads = [threading.Thread(target=client.run, args=(start_event, stop_event), daemon=True)
+                   for client in clients]
+
+        for thread in threads:
+            thread.start()
+
+        started = time.perf_counter()
+        start_event.set()
+        stop_event.wait(options.duration)
+        stop_event.set()
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - started
+
+        totals = OperationStats()
+        operations = {}
+
+        for operation in OPERATIONS:
+            merged = OperationStats()
+            for client in clients:
+                merged.merge(client.stats[operation])
+            if merged.latencies or merged.errors:
+                operations[operation] = merged.summarize(elapsed)
+            totals.merge(merged)
+
+        return {
+            "label": options.label,
+            "revision": getRevision(),
+            "started": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {"clients": options.clients, "duration": options.duration, "mix": dict(options.mix),
+                       "sizes": {str(size): weight for size, weight in options.sizes},
+                       "codec": options.codec, "segments": options.segments, "text": options.text,
+                       "think_time_ms": options.think_time, "seed": options.seed,
+                       "server_args": options.server_args if process is not None else None},
+            "elapsed": elapsed,
+            "total": totals.summarize(elapsed),
+            "operations": operations,
+            "server_rss": sampler.stop() if sampler is not None else None,
+        }
+
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        if process is not None:
+            process.terminate()
+            process.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def printResults(results):
+    total = results["total"]
+    print(f"{results['config']['clients']} clients for {results['elapsed']:.1f} s: "
+          f"{total['ok']} requests ({total['ops_per_sec']:.1f}/s), {total['errors']} errors, "
+          f"{total['mb_per_sec']:.2f} MB/s of file data")
+
+    for operation, summary in results["operations"].items():
+        line = f"  {operation:<9} {summary['ok']:>8} ok {summary['errors']:>6} errors"
+        if summary["latency_ms"]:
+            latency = summary["latency_ms"]
+            line += (f"  p50 {latency['p50']:.2f} ms  p99 {latency['p99']:.2f} ms"
+                     f"  p99.9 {latency['p99.9']:.2f} ms  max {latency['max']:.2f} ms")
+        print(line)
+
+        for message, count in sorted(summary["error_messages"].items(), key=lambda item: -item[1])[:3]:
+            print(f"            {count} x {message}")
+
+    if results["server_rss"]:
+        rss = results["server_rss"]
+        print(f"  server RSS {rss['start_kib'] / 1024:.1f} MiB at start, {rss['peak_kib'] / 1024:.1f} MiB peak, "
+              f"{rss['end_kib'] / 1024:.1f} MiB at end")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="File Exchange System load generator")
+    parser.add_argument("--clients", type=int, default=10,
+                        help="simulated clients, each with its own connection (default 10)")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds to run (default 10)")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"relative weights of register, dir, store and get (default {DEFAULT_MIX})")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"relative weights of file sizes for store and get (default {DEFAULT_SIZES})")
+    parser.add_argument("--text", action="store_true",
+                        help="use compressible text files instead of random bytes")
+    parser.add_argument("--codec", choices=["zlib", "lzma", "bz2"], default=None,
+                        help="compression codec the clients offer (default off)")
+    parser.add_argument("--segments", type=int, default=1,
+                        help="connections each get is split across")
+    parser.add_argument("--think-time", type=float, default=0,
+                        help="milliseconds each client waits between requests")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="seed for the request mix and file contents")
+    parser.add_argument("--server-args", default="",
+                        help="options for the started server, e.g. \"--engine asyncio --workers 64\"")
+    parser.add_argument("--connect", nargs=2, metavar=("IP", "PORT"),
+                        help="benchmark a server that is already running instead (no memory figures)")
+    parser.add_argument("--label", default=None,
+                        help="name for this run in the results")
+    parser.add_argument("--output", default=None,
+                        help="file to write the results to as JSON")
+    options = parser.parse_args()
+
+    try:
+        options.mix = parseWeights(options.mix, OPERATIONS)
+        options.sizes = [(parseSize(size), weight) for size, weight in parseWeights(options.sizes)]
+    except ValueError as e:
+        parser.error(str(e))
+
+    options.ip, options.port = (options.connect[0], int(options.connect[1])) if options.connect else (None, None)
+
+    results = runLoad(options)
+    printResults(results)
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {options.output}")
+
+
+if __name__ == "__main__":
+    main()
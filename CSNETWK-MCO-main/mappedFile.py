@@ -0,0 +1,104 @@
+'''
+    Mapped Files
+    This module lets the File Exchange System server read files through
+    memory maps. Slices of a mapped file are memoryviews over the page
+    cache, so compressing, hashing or sending a large file never copies it
+    onto the heap, and concurrent readers of the same version of a file
+    share one mapping.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import mmap                         # For memory-mapped files
+import os                           # For file identities
+import threading                    # For the pool lock
+
+
+class MappedFile:
+    """
+    A read-only mapping of a file shared by the readers that acquired it
+
+    Attributes:
+    - view: memoryview over the whole file
+    - size: Size of the mapped file
+    """
+
+    __slots__ = ("key", "size", "view", "_mmap", "_readers")
+
+    def __init__(self, key, file):
+        self.key = key
+        self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.size = len(self._mmap)
+        self.view = memoryview(self._mmap)
+        self._readers = 0
+
+    def close(self):
+        try:
+            self.view.release()
+            self._mmap.close()
+        except BufferError:
+            # A slice is still referenced (say, by a traceback); the mapping closes once it is freed
+            pass
+
+
+class MappingPool:
+    """
+    Mappings of open files keyed by the file's identity and version, so
+    readers of the same file share a mapping and a replaced file is mapped
+    afresh
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mappings = {}
+        self.mapped = 0
+        self.shared = 0
+
+    def acquire(self, file):
+        """
+        Returns the shared mapping of an open binary file, mapping it if no
+        reader holds it yet. Every acquire must be paired with release.
+
+        Raises ValueError for empty files, which cannot be mapped.
+        """
+        stat = os.fstat(file.fileno())
+        key = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            mapping = self._mappings.get(key)
+
+            if mapping is None:
+                mapping = MappedFile(key, file)
+                self._mappings[key] = mapping
+                self.mapped += 1
+            else:
+                self.shared += 1
+
+            mapping._readers += 1
+
+            return mapping
+
+    def release(self, mapping):
+        with self._lock:
+            mapping._readers -= 1
+
+            if mapping._readers == 0:
+                del self._mappings[mapping.key]
+                mapping.close()
+
+    def getStats(self):
+        with self._lock:
+            return {"open": len(self._mappings), "mapped": self.mapped, "shared": self.shared}
+
+
+def iterSlices(view, start, end, chunk_size):
+    """
+    Yields memoryviews of at most chunk_size bytes covering view[start:end]
+    """
+    for offset in range(start, end, chunk_size):
+        yield view[offset:min(offset + chunk_size, end)]
@@ -0,0 +1,320 @@
+'''
+    Protocol Module
+    This module contains the message framing shared by the client and
+    server applications of the File Exchange System. Every message sent
+    over a connection is a single frame, so requests can be sent
+    back-to-back on one connection without the receiver misparsing them.
+
+    Frame layout (network byte order):
+        version         1 byte
+        frame type      1 byte
+        request id      4 bytes
+        header length   4 bytes
+        payload length  8 bytes
+        header          <header length> bytes of UTF-8 JSON
+        payload         <payload length> bytes of raw data
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import asyncio                      # For the asyncio stream helpers
+import json                         # For encoding frame headers
+import os                           # For detecting sendfile support
+import struct                       # For packing the fixed-size frame prefix
+
+
+# Global Variables
+PROTOCOL_VERSION    = 1
+FRAME_PREFIX        = struct.Struct("!BBIIQ")
+FRAME_PREFIX_SIZE   = FRAME_PREFIX.size
+MAX_HEADER_LENGTH   = 64 * 1024         # Largest JSON header accepted from a peer
+MAX_REQUEST_ID      = 0xFFFFFFFF
+CHUNK_SIZE          = 64 * 1024         # Largest piece of a payload held in memory at once
+PROGRESS_STEP       = 1024 * 1024       # Bytes sent per sendfile call when progress is reported
+
+# Frame types
+FRAME_REQUEST       = 1                 # Client to server command
+FRAME_RESPONSE      = 2                 # Server reply to a request (or the greeting)
+FRAME_ERROR         = 3                 # Server reply when a request failed
+FRAME_DATA          = 4                 # One piece of a streamed body whose length is not known up front
+
+
+class ProtocolError(Exception):
+    """Raised when a peer sends a frame that cannot be decoded."""
+
+
+# Function Definitions
+def encodeHeader(header):
+    """
+    Encodes a frame header dictionary as JSON bytes
+
+    The result can be passed in place of the dictionary to the other encode
+    and send functions, so a header sent many times is serialized only once.
+    """
+    return json.dumps(header or {}, separators=(",", ":")).encode()
+
+
+def encodeFrameHead(frame_type, request_id, header, payload_length):
+    """
+    Encodes the prefix and header of a frame whose payload is sent separately
+
+    Returns:
+    - The encoded prefix and header as bytes
+    """
+    header_bytes = header if isinstance(header, bytes) else encodeHeader(header)
+
+    if len(header_bytes) > MAX_HEADER_LENGTH:
+        raise ProtocolError("Frame header is too large.")
+
+    return FRAME_PREFIX.pack(PROTOCOL_VERSION, frame_type, request_id,
+                             len(header_bytes), payload_length) + header_bytes
+
+
+def encodeFrame(frame_type, request_id, header=None, payload=b""):
+    """
+    Encodes a single frame
+
+    Parameters:
+    - frame_type: One of the FRAME_* constants
+    - request_id: Identifier echoed back in the matching response
+    - header: JSON-serializable dictionary describing the message (or its encodeHeader bytes)
+    - payload: Raw bytes carried after the header
+
+    Returns:
+    - The encoded frame as bytes
+    """
+    return encodeFrameHead(frame_type, request_id, header, len(payload)) + bytes(payload)
+
+
+def parseFramePrefix(prefix):
+    """
+    Decodes the fixed-size prefix of a frame
+
+    Parameters:
+    - prefix: The first FRAME_PREFIX_SIZE bytes of a frame
+
+    Returns:
+    - A tuple of (frame_type, request_id, header_length, payload_length)
+    """
+    version, frame_type, request_id, header_length, payload_length = FRAME_PREFIX.unpack(prefix)
+
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}.")
+    if header_length > MAX_HEADER_LENGTH:
+        raise ProtocolError("Frame header is too large.")
+
+    return frame_type, request_id, header_length, payload_length
+
+
+def parseHeader(header_bytes):
+    """
+    Decodes the JSON header of a frame into a dictionary
+    """
+    if not header_bytes:
+        return {}
+
+    try:
+        header = json.loads(header_bytes.decode())
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ProtocolError(f"Malformed frame header: {e}")
+
+    if not isinstance(header, dict):
+        raise ProtocolError("Malformed frame header: expected an object.")
+
+    return header
+
+
+def recvExactly(sock, size):
+    """
+    Receives exactly size bytes from a socket
+
+    Raises ConnectionError if the peer closes the connection first.
+    """
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Connection closed by peer.")
+        received += count
+
+    return bytes(data)
+
+
+def recvFrameHead(sock):
+    """
+    Receives the prefix and header of the next frame, leaving the payload
+    unread on the socket so the caller can consume it as a stream
+
+    Returns:
+    - A tuple of (frame_type, request_id, header, payload_length)
+    """
+    frame_type, request_id, header_length, payload_length = parseFramePrefix(recvExactly(sock, FRAME_PREFIX_SIZE))
+    header = parseHeader(recvExactly(sock, header_length))
+
+    return frame_type, request_id, header, payload_length
+
+
+def recvFrame(sock):
+    """
+    Receives a complete frame, payload included
+
+    Returns:
+    - A tuple of (frame_type, request_id, header, payload)
+    """
+    frame_type, request_id, header, payload_length = recvFrameHead(sock)
+    payload = recvExactly(sock, payload_length)
+
+    return frame_type, request_id, header, payload
+
+
+def recvChunks(sock, size, chunk_size=CHUNK_SIZE, budget=None):
+    """
+    Receives exactly size bytes from a socket as a stream of chunks
+
+    The same buffer is reused for every chunk, so each yielded memoryview is
+    only valid until the next one is requested.
+
+    Parameters:
+    - budget: BufferBudget each chunk is held against from before it is
+      read until the next one is requested, if given
+
+    Raises ConnectionError if the peer closes the connection first.
+    """
+    buffer = bytearray(min(chunk_size, size))
+    view = memoryview(buffer)
+    remaining = size
+
+    while remaining > 0:
+        length = min(chunk_size, remaining)
+
+        if budget is not None:
+            budget.acquire(length)
+
+        try:
+            count = sock.recv_into(view, length)
+            if count == 0:
+                raise ConnectionError("Connection closed by peer.")
+            remaining -= count
+            yield view[:count]
+        finally:
+            if budget is not None:
+                budget.release(length)
+
+
+def discardPayload(sock, size):
+    """
+    Reads and drops a payload so the next frame can be decoded
+    """
+    for _ in recvChunks(sock, size):
+        pass
+
+
+def sendFrame(sock, frame_type, request_id, header=None, payload=b""):
+    """
+    Encodes a frame and sends all of it on a socket
+    """
+    # Large payloads are sent straight from the caller's buffer instead of being copied into the frame
+    if len(payload) > CHUNK_SIZE:
+        sock.sendall(encodeFrameHead(frame_type, request_id, header, len(payload)))
+        sock.sendall(payload)
+    else:
+        sock.sendall(encodeFrame(frame_type, request_id, header, payload))
+
+
+def sendFileFrame(sock, frame_type, request_id, header, file, size, chunk_size=CHUNK_SIZE, progress=None,
+                  progress_step=PROGRESS_STEP):
+    """
+    Sends a frame whose payload is streamed from an open binary file
+
+    The payload is handed to the kernel with sendfile where the platform
+    supports it, so file contents never pass through Python buffers.
+    Elsewhere it is read and sent in chunks.
+
+    Parameters:
+    - file: File object positioned at the first byte to send
+    - size: Number of bytes of the file to send as the payload
+    - progress: Called with the number of bytes sent after each step, if given
+    - progress_step: Bytes sent per sendfile call when progress is given
+    """
+    sock.sendall(encodeFrameHead(frame_type, request_id, header, size))
+
+    if size > 0 and hasattr(os, "sendfile"):
+        # One sendfile call covers the payload unless someone is watching the progress
+        step = size if progress is None else progress_step
+        remaining = size
+
+        while remaining > 0:
+            count = min(step, remaining)
+            if sock.sendfile(file, file.tell(), count) != count:
+                raise EOFError("File ended before the declared payload length.")
+            remaining -= count
+            if progress is not None:
+                progress(count)
+        return
+
+    buffer = bytearray(min(chunk_size, size))
+    view = memoryview(buffer)
+    remaining = size
+
+    while remaining > 0:
+        count = file.readinto(view[:min(chunk_size, remaining)])
+        if not count:
+            raise EOFError("File ended before the declared payload length.")
+        sock.sendall(view[:count])
+        remaining -= count
+        if progress is not None:
+            progress(count)
+
+
+async def recvFrameHeadAsync(reader):
+    """
+    asyncio counterpart of recvFrameHead for an asyncio.StreamReader
+
+    Raises asyncio.IncompleteReadError if the peer closes the connection first.
+    """
+    frame_type, request_id, header_length, payload_length = parseFramePrefix(
+        await reader.readexactly(FRAME_PREFIX_SIZE))
+    header = parseHeader(await reader.readexactly(header_length))
+
+    return frame_type, request_id, header, payload_length
+
+
+async def recvChunksAsync(reader, size, chunk_size=CHUNK_SIZE, budget=None):
+    """
+    asyncio counterpart of recvChunks for an asyncio.StreamReader
+    """
+    remaining = size
+
+    while remaining > 0:
+        length = min(chunk_size, remaining)
+
+        if budget is not None:
+            await budget.acquireAsync(length)
+
+        try:
+            chunk = await reader.read(length)
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", remaining)
+            remaining -= len(chunk)
+            yield chunk
+        finally:
+            if budget is not None:
+                budget.release(length)
+
+
+async def recvFrameAsync(reader):
+    """
+    asyncio counterpart of recvFrame for an asyncio.StreamReader
+    """
+    frame_type, request_id, header, payload_length = await recvFrameHeadAsync(reader)
+    payload = await reader.readexactly(payload_length)
+
+    return frame_type, request_id, header, payload
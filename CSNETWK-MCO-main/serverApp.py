@@ -5,7 +5,7 @@
     accept multiple clients and will be able to handle multiple
     requests from the clients.
 
-    CSNETWK S16 Group 
+    CSNETWK S16 Group
     Name:
         - ABENOJA, Amelia Joyce L.
         - HALLAR, Francine Marie F.
@@ -14,19 +14,95 @@
 
 # Imports
 import socket                       # For socket programming
+import asyncio                      # For the asyncio server engine
+import argparse                     # For command-line options
+import functools                    # For binding transfers to their rate limits
+import ipaddress                    # For restricting /stats to the server's own host
+import json                         # For the /stats payload and /dir queries
+import logging                      # For checking the log level
 import sys                          # For command-line arguments
 import threading                    # For multi-threading
 import os                           # For file-related operations
-import time
+import io                           # For serving cached files like open ones
+import queue                        # For the bounded connection queue
+import secrets                      # For upload resume tokens
+import string                       # For validating resume tokens
+import time                         # For expiring partial uploads
 from datetime import datetime
 
+import protocol                     # For message framing
+import compression                  # For compressed transfers
+import deltaSync                    # For delta uploads
+from bandwidthShaper import BandwidthShaper
+from bufferBudget import BufferBudget
+from clientRegistry import ClientRegistry
+from contentStore import ContentStore, hashFile, isValidDigest
+from fileCache import FileCache
+from fileIndex import MAX_PAGE_SIZE, FileIndex
+from mappedFile import MappingPool, iterSlices
+from serverLog import FORMATS, LEVELS, log, setupLogging, transferFields
+import serverLog                    # For the log statistics
+from serverMetrics import DISK_WRITE_BUCKETS, LATENCY_BUCKETS, MetricsRegistry, startHttpServer
+from variantStore import VariantStore
+
 
 # Global Variables
-BUFFER_SIZE         = 1024      
 console_width       = 80
 server_directory    = "Server Directory"
-clients_socket_list = []
-clients_alias_list  = []
+client_registry     = ClientRegistry()
+session_sweep_interval = 10     # Seconds between sweeps for sessions detached too long
+
+# Half-open connections are detected by TCP keepalive probes after this many seconds idle
+KEEPALIVE_IDLE      = 30
+KEEPALIVE_INTERVAL  = 10
+KEEPALIVE_COUNT     = 3
+
+# /dir responses (header and listing) are encoded once and reused until the directory changes
+directory_cache         = None
+directory_cache_version = 0
+directory_cache_lock    = threading.Lock()
+
+# Metadata of every stored file, kept up to date by uploads and answering /dir without listing the directory
+file_index              = FileIndex(server_directory)
+DIR_QUERY_FIELDS        = ("pattern", "prefix", "sort", "desc", "limit", "cursor")
+
+# Admission control for the threaded engine
+listen_backlog      = 128       # Pending connections the kernel may hold before dropping SYNs
+worker_count        = 32        # Threads serving admitted connections
+queue_size          = 64        # Admitted connections waiting for a free worker
+retry_after_ms      = 500       # Hint sent to clients rejected while the queue is full
+partial_upload_ttl  = 24 * 60 * 60  # Seconds a partial upload is kept for resuming
+content_store       = None      # ContentStore when deduplicating storage is enabled
+file_cache          = FileCache(64 * 1024 * 1024)   # Hot /get files kept in memory (None to disable)
+variant_store       = None      # VariantStore when pre-compressed copies of hot files are kept
+mapped_files        = MappingPool()  # Mappings of files being compressed or sent without sendfile
+connection_queue    = None
+
+# Rate limits for transfer bodies (--rate-limit, --client-rate-limit, --alias-rate, --alias-weight)
+bandwidth_shaper    = None      # BandwidthShaper when any limit is set
+SHAPING_STEP        = 256 * 1024    # Bytes of a rate-limited download sent per turn
+SMALL_TRANSFER      = 256 * 1024    # Smaller bodies count against the limits but are never delayed
+
+# Bytes of transfer buffers held in memory at once; transfers wait for it before reading more (--buffer-budget)
+transfer_budget     = BufferBudget(64 * 1024 * 1024)
+
+# Live metrics, read through /stats and the optional Prometheus endpoint (--metrics-port)
+COMMANDS            = ("/register", "/attach", "/leave", "/store", "/dir", "/get", "/link", "/resume", "/signature",
+                       "/stats", "other")
+metrics             = MetricsRegistry()
+active_connections  = metrics.gauge("fes_connections_active", "Connections being served.")
+connections_total   = metrics.counter("fes_connections_total", "Connections accepted or rejected.",
+                                      "result", ("accepted", "rejected"))
+commands_total      = metrics.counter("fes_commands_total", "Requests received, by command.", "command", COMMANDS)
+command_seconds     = metrics.histogram("fes_command_duration_seconds", "Time to serve a request, by command.",
+                                        LATENCY_BUCKETS, "command", COMMANDS)
+error_responses     = metrics.counter("fes_error_responses_total", "Error responses sent.")
+bytes_received      = metrics.counter("fes_bytes_received_total", "Bytes of /store bodies received on the wire.")
+bytes_sent          = metrics.counter("fes_bytes_sent_total", "Bytes of /get bodies and /dir listings sent on the wire.")
+delta_bytes_copied  = metrics.counter("fes_delta_bytes_copied_total",
+                                      "Bytes of delta uploads copied from the server's existing copy.")
+disk_write_seconds  = metrics.histogram("fes_disk_write_seconds", "Time to write one received chunk to disk.",
+                                        DISK_WRITE_BUCKETS)
 
 
 # Function Definitions
@@ -45,223 +121,1415 @@ def getCurrentDateTime():
 
 
 def getClientAlias(client_socket):
+    client_alias = client_registry.getAlias(client_socket)
+
+    return client_alias if client_alias is not None else False
+
+
+def enableKeepalive(client_socket):
+    # Without probes a client that vanished (no FIN) would hold its worker and alias forever
+    client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    for option, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE), ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL),
+                          ("TCP_KEEPCNT", KEEPALIVE_COUNT)):
+        if hasattr(socket, option):
+            client_socket.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+def closeStaleConnection(connection):
+    # Wakes the worker (or coroutine) still reading from a connection its client abandoned
     try:
-        index = clients_socket_list.index(client_socket)
-        client_alias = clients_alias_list[index]
+        if isinstance(connection, socket.socket):
+            connection.shutdown(socket.SHUT_RDWR)
+        else:
+            connection.transport.abort()
+    except OSError:
+        pass
+
+
+def claimAlias(alias, token, connection, address):
+    """
+    Registers an alias on a connection, or hands it back to the client
+    presenting its session token, closing the connection it had before
+
+    Returns:
+    - A tuple of (ClientSession, whether an existing session was resumed),
+      or (None, False) if the alias is taken
+    """
+    if token is not None:
+        resumed = client_registry.resume(alias, token, connection, address)
 
-        return client_alias
-    except:
+        if resumed is not None:
+            session, stale = resumed
+
+            if stale is not None:
+                closeStaleConnection(stale)
+
+            return session, True
+
+    return client_registry.register(alias, connection, address), False
+
+
+def sweepSessions():
+    while True:
+        time.sleep(session_sweep_interval)
+        removed = client_registry.collectDetached()
+
+        if removed:
+            log.info("Removed %d sessions nobody resumed", removed, extra={"clients": len(client_registry)})
+
+
+def sendResponse(client_socket, request_id, message, payload=b"", **fields):
+    header = {"status": "ok", "message": message}
+    header.update(fields)
+    protocol.sendFrame(client_socket, protocol.FRAME_RESPONSE, request_id, header, payload)
+
+
+def sendError(client_socket, request_id, message):
+    header = {"status": "error", "message": message}
+    protocol.sendFrame(client_socket, protocol.FRAME_ERROR, request_id, header)
+    error_responses.inc()
+
+
+def recordCommand(command, started, connection, address):
+    # Unknown commands share one label so clients cannot grow the metrics
+    label = command if command in COMMANDS else "other"
+    elapsed = time.perf_counter() - started
+    commands_total.inc(label=label)
+    command_seconds.observe(elapsed, label)
+
+    # Skips the alias lookup unless per-request records are wanted
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Served %s", label, extra={"command": label, "alias": client_registry.getAlias(connection),
+                                              "address": address, "duration_ms": round(elapsed * 1000, 3)})
+
+
+def writeChunk(current_file, chunk):
+    started = time.perf_counter()
+    current_file.write(chunk)
+    disk_write_seconds.observe(time.perf_counter() - started)
+
+
+def isLocalAddress(address):
+    try:
+        return ipaddress.ip_address(address[0]).is_loopback
+    except (ValueError, TypeError, IndexError):
         return False
-    
 
 
-def receiveFile(client_socket, file, save_dir):
+def getStatsPayload():
+    return json.dumps(metrics.snapshot()).encode()
+
+
+def collectComponentStats():
+    """
+    Reports what the registry, caches and mappings already count, read
+    only when the metrics are
+    """
+    collected = [("fes_clients_registered", "gauge", "Aliases registered, including detached sessions.",
+                  len(client_registry)),
+                 ("fes_connections_queued", "gauge", "Connections waiting for a worker.",
+                  connection_queue.qsize() if connection_queue else 0)]
+
+    if file_cache is not None:
+        cache = file_cache.getStats()
+        lookups = cache["hits"] + cache["misses"]
+        collected += [("fes_cache_hits_total", "counter", "Downloads served from the file cache.", cache["hits"]),
+                      ("fes_cache_misses_total", "counter", "Downloads the file cache did not hold.", cache["misses"]),
+                      ("fes_cache_hit_ratio", "gauge", "Fraction of file cache lookups that hit.",
+                       cache["hits"] / lookups if lookups else 0.0),
+                      ("fes_cache_evictions_total", "counter", "Files evicted from the file cache.", cache["evictions"]),
+                      ("fes_cache_bytes", "gauge", "Bytes held by the file cache.", cache["bytes"])]
+
+    if variant_store is not None:
+        variants = variant_store.getStats()
+        collected += [("fes_variants_served_total", "counter", "Downloads served from a pre-compressed copy.",
+                       variants["served"]),
+                      ("fes_variants_built_total", "counter", "Pre-compressed copies built.", variants["built"]),
+                      ("fes_variants_pending", "gauge", "Pre-compressed copies waiting to be built.",
+                       variants["pending"])]
+
+    mappings = mapped_files.getStats()
+    collected += [("fes_mappings_open", "gauge", "Files currently memory-mapped.", mappings["open"]),
+                  ("fes_mappings_shared_total", "counter", "Readers that reused an existing mapping.",
+                   mappings["shared"])]
+
+    logged = serverLog.getStats()
+    collected += [("fes_log_records_dropped_total", "counter", "Log records dropped because the queue was full.",
+                   logged["dropped"]),
+                  ("fes_log_records_suppressed_total", "counter", "Warnings and errors held back by rate limiting.",
+                   logged["suppressed"]),
+                  ("fes_log_queue_depth", "gauge", "Log records waiting for the writer.", logged["queued"])]
+
+    indexed = file_index.getStats()
+    collected += [("fes_index_files", "gauge", "Files in the metadata index.", indexed["files"]),
+                  ("fes_index_hashing", "gauge", "Indexed files waiting to be hashed.", indexed["hashing"])]
+
+    if transfer_budget is not None:
+        budget = transfer_budget.getStats()
+        collected += [("fes_buffer_budget_bytes", "gauge", "Bytes of transfer buffers the server may hold.",
+                       budget["capacity"]),
+                      ("fes_buffer_bytes_held", "gauge", "Bytes of transfer buffers held.", budget["used"]),
+                      ("fes_buffer_utilization", "gauge", "Fraction of the buffer budget held.",
+                       budget["used"] / budget["capacity"]),
+                      ("fes_buffer_waiting", "gauge", "Transfers waiting for the buffer budget.", budget["waiting"]),
+                      ("fes_buffer_waits_total", "counter", "Times a transfer waited for the buffer budget.",
+                       budget["waits"]),
+                      ("fes_buffer_wait_seconds_total", "counter", "Time transfers spent waiting for the buffer budget.",
+                       budget["wait_seconds"])]
+
+    if bandwidth_shaper is not None:
+        shaped = bandwidth_shaper.getStats()
+        collected += [("fes_shaped_bytes_total", "counter", "Bytes of transfers counted against rate limits.",
+                       shaped["bytes"]),
+                      ("fes_shaper_waits_total", "counter", "Transfer steps delayed by rate limits.", shaped["waits"]),
+                      ("fes_shaper_wait_seconds_total", "counter", "Time transfers spent delayed by rate limits.",
+                       shaped["wait_seconds"]),
+                      ("fes_shaper_queued", "gauge", "Transfer steps waiting their turn under the server-wide limit.",
+                       shaped["queued"])]
+
+    return collected
+
+
+metrics.addCollector(collectComponentStats)
+
+
+
+class TransferError(Exception):
+    """Raised when a /store or /get request cannot be served as asked."""
+
+
+def isValidOffset(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def isValidToken(token):
+    return isinstance(token, str) and len(token) == 32 and all(c in string.hexdigits for c in token)
+
+
+def getStoredName(filename):
+    """
+    Returns the name a client's filename is stored under in the server
+    directory
+
+    Raises TransferError for names starting with a dot, which the server
+    keeps for itself: partial uploads, the file index, and the content
+    and variant stores.
+    """
+    name = os.path.basename(filename) if isinstance(filename, str) else ""
+
+    if not name or name.startswith("."):
+        raise TransferError("Error: Filenames may not be empty or start with a dot.")
+
+    return name
+
+
+def getTempPath(save_dir, token):
+    # Dot-prefixed so unfinished uploads never show up in /dir
+    return os.path.join(save_dir, "." + token + ".part")
+
+
+def openUpload(save_dir, header, payload_length):
+    """
+    Opens the temporary file a /store payload is written to
+
+    Uploads that carry a resume token keep their partial file under that
+    token until every byte of the declared size has arrived, so a client
+    can reconnect and continue from the last byte the server wrote.
+
+    Returns:
+    - A tuple of (file, temp_path, body_length, completes_upload)
+    """
+    token = header.get("token")
+    offset = header.get("offset", 0)
+
+    if token is None:
+        token = secrets.token_hex(16)
+    elif not isValidToken(token):
+        raise TransferError("Error: Invalid resume token.")
+
+    if not isValidOffset(offset):
+        raise TransferError("Error: Invalid upload offset.")
+
+    temp_path = getTempPath(save_dir, token)
+    received = os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+
+    if offset != received:
+        raise TransferError(f"Error: Upload offset {offset} does not match the {received} bytes already received.")
+
+    total_size = header.get("size", offset + payload_length)
+
+    if not isValidOffset(total_size) or offset > total_size:
+        raise TransferError("Error: Upload is larger than its declared size.")
+
+    # A compressed body arrives in data frames, so its length comes from the declared size
+    if header.get("encoding") is None:
+        body_length = payload_length
+    elif header["encoding"] in compression.CODECS:
+        body_length = total_size - offset
+    else:
+        raise TransferError("Error: Unsupported encoding.")
+
+    if offset + body_length > total_size:
+        raise TransferError("Error: Upload is larger than its declared size.")
+
+    current_file = open(temp_path, "ab" if offset else "wb")
+
+    return current_file, temp_path, body_length, offset + body_length == total_size
+
+
+def getResumeOffset(save_dir, token):
+    if not isValidToken(token):
+        raise TransferError("Error: Invalid resume token.")
+
+    temp_path = getTempPath(save_dir, token)
+
+    return os.path.getsize(temp_path) if os.path.exists(temp_path) else 0
+
+
+def cleanupPartialUploads(save_dir, max_age):
+    # Partial uploads nobody resumed within max_age seconds are abandoned
+    if not os.path.isdir(save_dir):
+        return
+
+    cutoff = time.time() - max_age
+
+    for name in os.listdir(save_dir):
+        temp_path = os.path.join(save_dir, name)
+
+        if name.startswith(".") and name.endswith(".part") and os.path.getmtime(temp_path) < cutoff:
+            os.remove(temp_path)
+
+
+def prepareServerDirectory():
+    cleanupPartialUploads(server_directory, partial_upload_ttl)
+
+    changed, removed = file_index.load()
+    log.info("Indexed %d files, %d changed and %d removed since the last run", len(file_index.names()),
+             changed, removed)
+
+    if content_store is not None:
+        removed = content_store.collectGarbage()
+        log.info("Content-addressed storage enabled, removed %d unreferenced objects", removed)
+
+    if variant_store is not None:
+        removed = variant_store.collectGarbage()
+        log.info("Pre-compressed variants enabled, removed %d outdated variants", removed)
+
+
+def discardBody(client_socket, header, payload_length):
+    # Compressed bodies follow the request as data frames, which must be drained too
+    protocol.discardPayload(client_socket, payload_length)
+
+    if header.get("encoding") is not None:
+        compression.discardCompressed(client_socket)
+
+
+def getServerFeatures(delta=True):
+    # Advertised in the greeting so clients only use what this server supports
+    features = ["resume"]
+
+    if content_store is not None:
+        features.append("dedup")
+
+    if delta:
+        features.append("delta")
+
+    return features
+
+
+def invalidateStoredFile(name):
+    # Copies of the old contents must not outlive a replaced file
+    if file_cache is not None:
+        file_cache.invalidate(name)
+
+    if variant_store is not None:
+        variant_store.invalidate(name)
+
+
+def commitUpload(temp_path, dir_path, header, alias=None, digest=None):
+    """
+    Moves a finished upload into place, through the content store when
+    deduplicating storage is enabled, and records it in the file index
+
+    Parameters:
+    - alias: Client that uploaded the file
+    - digest: Hex digest of the upload already verified, or None to have it
+      hashed in the background (or here, when deduplicating)
+    """
+    name = os.path.basename(dir_path)
+
+    try:
+        if content_store is None:
+            os.replace(temp_path, dir_path)
+        else:
+            # Delta uploads were already hashed while they were rebuilt
+            if digest is None:
+                digest = hashFile(temp_path)
+            expected = header.get("hash")
+
+            if expected is not None and digest != str(expected).lower():
+                os.remove(temp_path)
+                raise TransferError("Error: Uploaded contents do not match the declared hash.")
+
+            content_store.commit(temp_path, dir_path, digest)
+    except OSError as e:
+        # The client gets an error instead of a dropped connection, so it does not upload again
+        if os.path.lexists(temp_path):
+            os.remove(temp_path)
+        log.error("Could not store %s: %s", name, e, extra={"file": name})
+        raise TransferError(f"Error: Could not store {name}.")
+
+    file_index.put(name, digest, alias)
+    invalidateDirectoryCache()
+    invalidateStoredFile(name)
+
+
+def linkStoredFile(header, alias=None):
+    """
+    Stores a file by reference to contents the server already has, for
+    the client with the given alias
+
+    Returns:
+    - True if the name was linked, False if the contents must be uploaded
+    """
+    if content_store is None:
+        raise TransferError("Error: Content-addressed storage is disabled.")
+
+    filename = header.get("filename")
+    digest = header.get("hash")
+
+    if not filename or not isValidDigest(digest):
+        raise TransferError("Error: Command parameters do not match or is not allowed.")
+
+    name = getStoredName(filename)
+    os.makedirs(server_directory, exist_ok=True)
+    linked = content_store.link(digest, os.path.join(server_directory, name))
+
+    if linked:
+        file_index.put(name, digest.lower(), alias)
+        invalidateDirectoryCache()
+        invalidateStoredFile(name)
+
+    return linked
+
+
+def recordDownload(file, start, end, file_size):
+    # Only the range starting a download counts, not the empty probe before
+    # a segmented download nor the rest of a resumed or segmented one
+    if start == 0 and (end > 0 or file_size == 0):
+        file_index.recordDownload(os.path.basename(file))
+
+
+def parseAliasValue(text):
+    """
+    Parses an ALIAS=NUMBER command-line option
+
+    Returns:
+    - A tuple of (alias, positive number)
+    """
+    alias, _, value = text.rpartition("=")
+
+    try:
+        number = float(value)
+    except ValueError:
+        number = 0
+
+    if not alias or number <= 0:
+        raise argparse.ArgumentTypeError(f"expected ALIAS=NUMBER with a positive number, got {text!r}")
+
+    return alias, number
+
+
+def getThrottle(alias, size):
+    """
+    Returns a callable that takes a number of bytes of a size-byte transfer
+    by alias and waits until the rate limits let them through, or None
+    when no limits are set
+    """
+    if bandwidth_shaper is None:
+        return None
+
+    return functools.partial(bandwidth_shaper.throttle, alias, wait=size >= SMALL_TRANSFER)
+
+
+def resolveRange(header, file_size):
+    """
+    Returns the (start, end) byte range a /get asks for, end exclusive
+    """
+    start = header.get("offset", 0)
+    end = header.get("end", file_size)
+
+    if not isValidOffset(start) or not isValidOffset(end) or not start <= end <= file_size:
+        raise TransferError("Error: Requested byte range is not satisfiable.")
+
+    return start, end
+
+
+def receiveFile(client_socket, request_id, header, payload_length, save_dir):
+    file = header["filename"]
+
     if save_dir:
-        client_socket.send("Storing File to Server".encode())
-        
-        file_data = client_socket.recv(os.path.getsize(file) + 1)
-
-        dir_path = os.path.join(save_dir, file)
-        
-        current_file = open(dir_path, "wb")
-
-        print(dir_path)
-        
-        if current_file:
-            current_file.write(file_data)
-            current_file.close()
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-            print(f"Server: File {file} stored successfully.")
-
-            file_message = f"{getClientAlias(client_socket)}<{timestamp}>: Uploaded {file}"
-            client_socket.send(file_message.encode())
-            print(file_message)
-            
+        try:
+            dir_path = os.path.join(save_dir, getStoredName(file))
+            current_file, temp_path, body_length, completes_upload = openUpload(save_dir, header, payload_length)
+        except (TransferError, OSError) as e:
+            discardBody(client_socket, header, payload_length)
+            sendError(client_socket, request_id, str(e))
+            return
+
+        encoding = header.get("encoding")
+        stats = compression.TransferStats(encoding)
+        alias = getClientAlias(client_socket)
+        throttle = getThrottle(alias, max(payload_length, body_length))
+        shaped = 0
+
+        if encoding is None:
+            chunks = protocol.recvChunks(client_socket, payload_length, budget=transfer_budget)
         else:
-            print("Error")
-                
+            chunks = compression.recvCompressed(client_socket, compression.createDecompressor(encoding),
+                                                body_length, stats, transfer_budget)
+
+        # Stream the body to disk one chunk at a time
+        try:
+            with current_file:
+                for chunk in chunks:
+                    writeChunk(current_file, chunk)
+                    if encoding is None:
+                        stats.add(len(chunk), len(chunk))
+
+                    # Waiting here stops reads from the socket, so TCP slows the client down
+                    if throttle is not None:
+                        throttle(stats.wire_bytes - shaped)
+                        shaped = stats.wire_bytes
+        except BaseException:
+            # Give back the budget held for the chunk in hand right away
+            chunks.close()
+
+            # Resumable uploads keep what arrived; the rest are thrown away
+            if header.get("token") is None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            bytes_received.inc(stats.wire_bytes)
+
+        if not completes_upload:
+            sendResponse(client_socket, request_id, f"Received part of {file}.",
+                         offset=os.path.getsize(temp_path))
+            return
+
+        # Move the finished upload into place
+        try:
+            commitUpload(temp_path, dir_path, header, alias)
+        except TransferError as e:
+            sendError(client_socket, request_id, str(e))
+            return
+
+        timestamp = getCurrentDateTime()
+
+        file_message = f"{alias}<{timestamp}>: Uploaded {file}"
+        sendResponse(client_socket, request_id, file_message)
+        log.info("Stored %s", file, extra={"alias": alias, "file": file, **transferFields(stats.finish())})
+
     else:
+        discardBody(client_socket, header, payload_length)
         err_message = f"{save_dir} does not exist."
-        print(f"Server: {err_message}")
-        client_socket.send(err_message)
+        log.error("%s", err_message, extra={"file": file})
+        sendError(client_socket, request_id, err_message)
+
+
+def getFileSignatures(filename):
+    """
+    Returns the block signatures of a stored file for a delta upload
+
+    Returns:
+    - A tuple of (response fields, packed signatures)
+    """
+    with open(os.path.join(server_directory, os.path.basename(filename)), 'rb') as current_file:
+        stat = os.fstat(current_file.fileno())
+        block_size = deltaSync.chooseBlockSize(stat.st_size)
+        signatures = deltaSync.computeSignatures(current_file, block_size)
+
+    # The client sends back the size and time it saw, so a delta is never applied to a replaced file
+    return {"block_size": block_size, "base_size": stat.st_size, "base_mtime_ns": stat.st_mtime_ns}, signatures
+
+
+def receiveDelta(client_socket, request_id, header, payload_length, save_dir):
+    """
+    Stores a new version of a file from delta instructions against the
+    server's copy. The new version is rebuilt in a temporary file, which
+    replaces the old one only if its digest matches the client's.
+    """
+    file = header["filename"]
+    delta = header["delta"] if isinstance(header["delta"], dict) else {}
+    block_size = delta.get("block_size")
+    expected = header.get("hash")
+
+    try:
+        dir_path = os.path.join(save_dir, getStoredName(file))
+    except TransferError as e:
+        discardBody(client_socket, header, payload_length)
+        sendError(client_socket, request_id, str(e))
+        return
+
+    try:
+        base = open(dir_path, 'rb')
+    except OSError:
+        discardBody(client_socket, header, payload_length)
+        sendError(client_socket, request_id, "Error: File not found in the server.")
+        return
+
+    with base:
+        stat = os.fstat(base.fileno())
+
+        if (header.get("encoding") is not None or not isValidDigest(expected)
+                or not isValidOffset(block_size) or block_size == 0 or not isValidOffset(header.get("size"))):
+            discardBody(client_socket, header, payload_length)
+            sendError(client_socket, request_id, "Error: Command parameters do not match or is not allowed.")
+            return
 
+        # The instructions only fit the copy the client's signatures came from
+        if (stat.st_size, stat.st_mtime_ns) != (delta.get("base_size"), delta.get("base_mtime_ns")):
+            discardBody(client_socket, header, payload_length)
+            sendError(client_socket, request_id, "Error: The file changed on the server, send all of it.")
+            return
 
-def fetchFile(client_socket, file):
+        temp_path = getTempPath(save_dir, secrets.token_hex(16))
+
+        try:
+            with open(temp_path, 'wb') as current_file:
+                digest, copied, received = deltaSync.applyDelta(client_socket, payload_length, base, current_file,
+                                                                block_size, header["size"], transfer_budget)
+        except deltaSync.DeltaError as e:
+            os.remove(temp_path)
+            sendError(client_socket, request_id, str(e))
+            return
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        finally:
+            bytes_received.inc(payload_length)
+
+    if digest != expected.lower() or os.path.getsize(temp_path) != header.get("size"):
+        os.remove(temp_path)
+        sendError(client_socket, request_id, "Error: Rebuilt file does not match the declared hash.")
+        return
+
+    alias = getClientAlias(client_socket)
+
+    # Replace the old version in one step, so readers see either version whole
+    try:
+        commitUpload(temp_path, dir_path, header, alias, digest)
+    except TransferError as e:
+        sendError(client_socket, request_id, str(e))
+        return
+
+    delta_bytes_copied.inc(copied)
+
+    file_message = f"{alias}<{getCurrentDateTime()}>: Uploaded {file}"
+    sendResponse(client_socket, request_id, file_message)
+    log.info("Stored %s from a delta", file, extra={"alias": alias, "file": file, "bytes": copied + received,
+                                                    "wire_bytes": payload_length, "codec": "delta"})
+
+
+def openServedFile(file_path):
+    """
+    Opens a file for /get, from the download cache when it holds the
+    current version of the file
+
+    Returns:
+    - A tuple of (file, cached_data), where cached_data is None if the
+      file is served from disk
+    """
+    name = os.path.basename(file_path)
+
+    if file_cache is not None:
+        stat = os.stat(file_path)
+        data = file_cache.get(name, stat.st_mtime_ns, stat.st_size)
+
+        if data is None and file_cache.admits(stat.st_size):
+            with open(file_path, 'rb') as current_file:
+                stat = os.fstat(current_file.fileno())
+                data = current_file.read()
+
+            # A file still being written to is served but not cached
+            if len(data) == stat.st_size:
+                file_cache.put(name, stat.st_mtime_ns, stat.st_size, data)
+
+        if data is not None:
+            return io.BytesIO(data), data
+
+    return open(file_path, 'rb'), None
+
+
+def fetchFile(client_socket, request_id, file, header=None):
     if getClientAlias(client_socket):
-        if (os.path.exists('Server Directory/' + file )):
-            client_socket.send("Sending File to Client".encode())
-            user_dir = getClientAlias(client_socket)
-            time.sleep(0.01)
-            
-            client_socket.send(user_dir.encode())
-            time.sleep(0.01)
-            
-            client_socket.send(file.encode())
-            with open("Server Directory/" + file, 'rb') as current_file:
-                file_data = current_file.read()
-                print(file_data)
-                time.sleep(0.05)
-                client_socket.sendall(file_data)
-        else:
-            client_socket.send("Error: File not found in the server.".encode())
+        file_path = os.path.join(server_directory, os.path.basename(file))
+
+        try:
+            current_file, cached_data = openServedFile(file_path)
+        except OSError:
+            sendError(client_socket, request_id, "Error: File not found in the server.")
+            return
+
+        # The range goes out in the frame prefix, then the kernel copies the file to the socket
+        with current_file:
+            if cached_data is not None:
+                file_size = len(cached_data)
+            else:
+                file_size = os.fstat(current_file.fileno()).st_size
+
+            try:
+                start, end = resolveRange(header or {}, file_size)
+            except TransferError as e:
+                sendError(client_socket, request_id, str(e))
+                return
+
+            recordDownload(file, start, end, file_size)
+            throttle = getThrottle(getClientAlias(client_socket), end - start)
+
+            response = {"status": "ok", "message": "Sending File to Client",
+                        "filename": os.path.basename(file), "size": file_size, "offset": start, "end": end}
+
+            # Compress only for clients that asked for a codec, and only if a sample of the range shrinks
+            codec = compression.chooseCodec((header or {}).get("accept_encoding"))
+
+            # Whole-file requests for hot files are served from a copy compressed ahead of time
+            if codec and variant_store is not None and (start, end) == (0, file_size):
+                stat = os.stat(file_path)
+                variant = variant_store.open(os.path.basename(file_path), codec, stat)
+
+                if variant is not None:
+                    with variant:
+                        response["encoding"] = codec
+                        protocol.sendFrame(client_socket, protocol.FRAME_RESPONSE, request_id, response)
+
+                        stats = compression.TransferStats(codec)
+                        compression.sendPrecompressed(client_socket, request_id, variant, file_size, stats, throttle)
+                        bytes_sent.inc(stats.wire_bytes)
+                        log.info("Sent %s from its %s variant", file, codec,
+                                 extra={"file": file, **transferFields(stats.finish())})
+                    return
+
+                variant_store.recordAccess(os.path.basename(file_path), codec, stat)
+
+            # Bodies read by Python rather than sendfile are sliced from a shared mapping of the file
+            mapping = None
+
+            if cached_data is None and file_size > 0 and (codec or not hasattr(os, "sendfile")):
+                mapping = mapped_files.acquire(current_file)
+
+            try:
+                contents = memoryview(cached_data) if cached_data is not None else mapping and mapping.view
+
+                # Empty files are never mapped, nor worth compressing
+                if codec and (contents is None or
+                              not compression.isCompressible(contents[start:min(start + compression.SAMPLE_SIZE, end)])):
+                    codec = None
+
+                if codec is None and contents is not None and throttle is None:
+                    protocol.sendFrame(client_socket, protocol.FRAME_RESPONSE, request_id, response,
+                                       contents[start:end])
+                    bytes_sent.inc(end - start)
+                elif codec is None:
+                    # Rate-limited bodies go out a step at a time, each waiting its turn
+                    current_file.seek(start)
+                    protocol.sendFileFrame(client_socket, protocol.FRAME_RESPONSE, request_id, response,
+                                           current_file, end - start, progress=throttle, progress_step=SHAPING_STEP)
+                    bytes_sent.inc(end - start)
+                else:
+                    response["encoding"] = codec
+                    protocol.sendFrame(client_socket, protocol.FRAME_RESPONSE, request_id, response)
+
+                    stats = compression.TransferStats(codec)
+                    compressor = compression.createCompressor(codec, header.get("level"))
+                    compression.sendCompressedBlocks(client_socket, request_id,
+                                                     iterHeld(iterSlices(contents, start, end, protocol.CHUNK_SIZE)),
+                                                     compressor, stats, throttle)
+                    bytes_sent.inc(stats.wire_bytes)
+                    log.info("Sent %s", file, extra={"file": file, **transferFields(stats.finish())})
+            finally:
+                contents = None
+
+                if mapping is not None:
+                    mapped_files.release(mapping)
     else:
-        client_socket.send("Error: User not registered!".encode())
-      
+        sendError(client_socket, request_id, "Error: User not registered!")
+
+def iterHeld(blocks):
+    """
+    Yields blocks to be compressed, each held against the buffer budget
+    until the next is requested, as the compressor's output is in memory
+    """
+    for block in blocks:
+        if transfer_budget is None:
+            yield block
+            continue
+
+        with transfer_budget.hold(len(block)):
+            yield block
+
+
 def toString(files):
 
-    dir_list = ''
+    return ''.join([x + '\n' for x in files])
+
+
+def listServerFiles():
+    return file_index.names()
+
+
+def invalidateDirectoryCache():
+    global directory_cache
+    global directory_cache_version
+
+    with directory_cache_lock:
+        directory_cache = None
+        directory_cache_version += 1
+
+
+def getDirectoryResponse():
+    """
+    Returns the encoded header and payload of the /dir response, built
+    from the file index only when nothing has been cached since the last
+    change
+
+    The filenames go in the payload, one per line, so a directory of
+    thousands of files does not run into the header size limit.
+    """
+    global directory_cache
+
+    cached = directory_cache
+    if cached is not None:
+        return cached
+
+    with directory_cache_lock:
+        version = directory_cache_version
+
+    files = listServerFiles()
+    header = protocol.encodeHeader({"status": "ok", "message": server_directory + ": ", "count": len(files)})
+    response = (header, toString(files).encode())
+
+    # Only cache the listing if no file was stored while it was being built
+    with directory_cache_lock:
+        if version == directory_cache_version:
+            directory_cache = response
+
+    return response
+
+
+def queryDirectory(header):
+    """
+    Answers a /dir request with filters, sorting or paging from the file
+    index
+
+    Returns:
+    - A tuple of (encoded response header, JSON array of file entries)
+
+    Raises ValueError if a parameter is not valid.
+    """
+    fields = {field: header.get(field) for field in DIR_QUERY_FIELDS}
+
+    for field in ("pattern", "prefix", "sort", "cursor"):
+        if fields[field] is not None and not isinstance(fields[field], str):
+            raise ValueError(f"Error: {field} must be a string.")
+
+    entries, total, cursor = file_index.query(fields["pattern"], fields["prefix"], fields["sort"] or "name",
+                                              bool(fields["desc"]), MAX_PAGE_SIZE if fields["limit"] is None else fields["limit"],
+                                              fields["cursor"])
+    response = protocol.encodeHeader({"status": "ok", "message": server_directory + ": ", "count": len(entries),
+                                      "total": total, "cursor": cursor})
+
+    return response, json.dumps(entries).encode()
+
+
+def getDirectoryQueryResponse(header):
+    # Plain /dir requests keep the cached list of names
+    if not any(header.get(field) is not None for field in DIR_QUERY_FIELDS):
+        return getDirectoryResponse()
+
+    return queryDirectory(header)
+
+
+def countConnection(counter):
+    connections_total.inc(label=counter)
+
+
+def getConnectionStats():
+    stats = {result: connections_total.get(result) for result in connections_total.label_values}
+
+    # Connections admitted but still waiting for a worker
+    stats["queued"] = connection_queue.qsize() if connection_queue else 0
 
-    for x in files:
-        dir_list += x + '\n'
-    
-    return dir_list
-    
+    return stats
+
+
+def rejectConnection(client_socket, client_address):
+    # The accept thread must never block on a client, so the rejection is best-effort
+    message = f"Error: Server busy, retry after {retry_after_ms} ms."
+    frame = protocol.encodeFrame(protocol.FRAME_ERROR, 0,
+                                 {"status": "error", "message": message, "retry_after_ms": retry_after_ms})
+
+    try:
+        client_socket.setblocking(False)
+        client_socket.send(frame)
+    except OSError:
+        pass
+    finally:
+        client_socket.close()
+
+    countConnection("rejected")
+    log.warning("Rejected a connection, server busy %s", getConnectionStats(), extra={"address": client_address})
+
+
+def serveConnections():
+    while True:
+        client_socket, client_address = connection_queue.get()
+        active_connections.inc()
+
+        try:
+            enableKeepalive(client_socket)
+
+            # Response heads and sendfile payloads are separate writes, which Nagle would hold back (asyncio sets this itself)
+            client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            # If the input is valid, send a success message to the client
+            success_message = "Connection to the File Exchange Server is successful!"
+            sendResponse(client_socket, 0, success_message, features=getServerFeatures(),
+                         codecs=list(compression.CODECS))
+
+            log.info("Connection established", extra={"address": client_address})
+
+            processClientCommands(client_socket, client_address)
+        except OSError as e:
+            log.error("Connection error: %s", e, extra={"address": client_address})
+        finally:
+            client_socket.close()
+            active_connections.dec()
+            connection_queue.task_done()
 
 
 def startServer(IP, PORT):
     global server_socket  # Declare server_socket as a global variable
-    
+    global connection_queue
+
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     server_socket.bind((IP, PORT))
-    server_socket.listen(5)
+    server_socket.listen(listen_backlog)
 
-    print(f"Server: Listening on {IP}:{PORT}")
+    prepareServerDirectory()
+    threading.Thread(target=sweepSessions, daemon=True).start()
 
-    while True:
-        # Accept a new connection
-        client_socket, client_address = server_socket.accept()
+    # Start the worker pool before accepting so admitted clients are served right away
+    connection_queue = queue.Queue(maxsize=queue_size)
 
-        # If the input is valid, send a success message to the client
-        success_message = "Connection to the File Exchange Server is successful!"
-        client_socket.send(success_message.encode())
+    for _ in range(worker_count):
+        threading.Thread(target=serveConnections, daemon=True).start()
 
-        # Print the connection details
-        print(f"Server: Connection from {client_address} has been established!")
+    log.info("Listening on %s:%d (%d workers, queue of %d, backlog %d)", IP, PORT, worker_count, queue_size,
+             listen_backlog)
 
-        # Start the client thread
-        client_thread = threading.Thread(target=processClientCommands, args=(client_socket, client_address))
+    while True:
+        # Accept a new connection and hand it to the worker pool
+        client_socket, client_address = server_socket.accept()
 
-        # Start the thread
-        client_thread.start()
+        try:
+            connection_queue.put_nowait((client_socket, client_address))
+        except queue.Full:
+            rejectConnection(client_socket, client_address)
+        else:
+            countConnection("accepted")
 
 
 def processClientCommands(client_socket, client_address):
     try:
         while True:
-            command = client_socket.recv(BUFFER_SIZE).decode()
-
-            # Leave the server
-            if command == '/leave':
-                current_client = getClientAlias(client_socket)
-
-                if current_client is False:
-                    server_response = "Connection closed. Thank you!"
-                    client_socket.send(server_response.encode())
-                    client_socket.close()
-                    print(f"Server: Client {client_address} has disconnected.")
-                    print(f"Current clients: {clients_alias_list}: {clients_socket_list}")
+            # Every request is one frame, so back-to-back requests are read in order
+            # Only /store has a payload; it is streamed to disk instead of being read here
+            frame_type, request_id, header, payload_length = protocol.recvFrameHead(client_socket)
+            command = header.get("command")
+
+            if frame_type != protocol.FRAME_REQUEST or command != '/store':
+                protocol.discardPayload(client_socket, payload_length)
+
+            if frame_type != protocol.FRAME_REQUEST:
+                sendError(client_socket, request_id, "Error: Expected a request frame.")
+                continue
+
+            started = time.perf_counter()
+
+            try:
+                # Leave the server
+                if command == '/leave':
+                    current_client = getClientAlias(client_socket)
+
+                    if current_client is False:
+                        server_response = "Connection closed. Thank you!"
+                        sendResponse(client_socket, request_id, server_response)
+                        client_socket.close()
+                        log.info("Client disconnected", extra={"address": client_address,
+                                                               "clients": len(client_registry)})
+                    else:
+                        # Remove the client from the registry
+                        client_registry.unregister(client_socket)
+
+                        server_response = "Connection closed. Thank you!"
+                        sendResponse(client_socket, request_id, server_response)
+                        client_socket.close()
+
+                        log.info("Client disconnected", extra={"alias": current_client, "address": client_address,
+                                                               "clients": len(client_registry)})
+
+                    # Break the loop to exit the thread
+                    break
+
+                # Register a unique alias (or handle) for the client
+                elif command == '/register':
+                    alias = header.get("alias")
+
+                    try:
+                        # Check if the client is already registered
+                        if not alias:
+                            sendError(client_socket, request_id, "Error: Registration failed. Please enter a handle or alias!")
+                        elif getClientAlias(client_socket):
+                            sendError(client_socket, request_id, "Error: Registration failed. Client is already registered.")
+                        else:
+                            # A client that reconnected reclaims its alias with the session token
+                            session, resumed = claimAlias(alias, header.get("session"), client_socket, client_address)
+
+                            if session is None:
+                                server_response = "Error: Registration failed. Handle or alias already exists."
+                                sendError(client_socket, request_id, server_response)
+                            else:
+                                log.info("Alias %s", "resumed" if resumed else "registered",
+                                         extra={"alias": alias, "address": client_address,
+                                                "clients": len(client_registry)})
+
+                                # The session token lets the client attach more connections to its alias
+                                server_response = f"Welcome back {alias}!" if resumed else f"Welcome {alias}!"
+                                sendResponse(client_socket, request_id, server_response, session=session.token,
+                                             resumed=resumed)
+                    except Exception as e:
+                        log.error("Registration error: %s", e, extra={"alias": alias, "address": client_address})
+                        sendError(client_socket, request_id, f"Error: {str(e)}")
+
+                # Add this connection to an alias registered on another connection
+                elif command == '/attach':
+                    alias = header.get("alias")
+
+                    if getClientAlias(client_socket):
+                        sendError(client_socket, request_id, "Error: Attach failed. Client is already registered.")
+                    elif client_registry.attach(alias, header.get("session"), client_socket) is None:
+                        sendError(client_socket, request_id, "Error: Attach failed. Unknown alias or session.")
+                    else:
+                        log.info("Connection attached", extra={"alias": alias, "address": client_address})
+                        sendResponse(client_socket, request_id, f"Attached to {alias}.")
+
+
+                # Store a file in the server
+                elif command == '/store':
+                    client = getClientAlias(client_socket)
+
+                    filename = header.get("filename")
+
+                    if client and filename:
+                        try:
+                            # Create Server Directory if it does not exist
+                            os.makedirs(server_directory, exist_ok=True)
+                            save_dir = server_directory
+                        except OSError:
+                            save_dir = None
+
+                        if save_dir and header.get("delta") is not None:
+                            receiveDelta(client_socket, request_id, header, payload_length, save_dir)
+                        else:
+                            receiveFile(client_socket, request_id, header, payload_length, save_dir)
+
+                    elif client:
+                        discardBody(client_socket, header, payload_length)
+                        sendError(client_socket, request_id, "Error: Command parameters do not match or is not allowed.")
+                    else:
+                        discardBody(client_socket, header, payload_length)
+                        sendError(client_socket, request_id, "User not registered")
+
+                elif command == '/dir':
+                    client = getClientAlias(client_socket)
+
+                    if client:
+                        try:
+                            header, listing = getDirectoryQueryResponse(header)
+                        except ValueError as e:
+                            sendError(client_socket, request_id, str(e))
+                            continue
+
+                        protocol.sendFrame(client_socket, protocol.FRAME_RESPONSE, request_id, header, listing)
+                        bytes_sent.inc(len(listing))
+                    else:
+                        sendError(client_socket, request_id, "User not registered")
+
+                elif command == '/get':
+                    if getClientAlias(client_socket):
+                        file = header.get("filename")
+
+                        if file:
+                            fetchFile(client_socket, request_id, file, header)
+                        else:
+                            sendError(client_socket, request_id, "Error: Command parameters do not match or is not allowed.")
+
+                    else:
+                        sendError(client_socket, request_id, "User not registered")
+
+                # Store a file by reference to contents the server already has
+                elif command == '/link':
+                    client = getClientAlias(client_socket)
+
+                    if client:
+                        try:
+                            if linkStoredFile(header, client):
+                                file_message = f"{client}<{getCurrentDateTime()}>: Uploaded {header['filename']}"
+                                log.info("Linked %s", header["filename"],
+                                         extra={"alias": client, "file": header["filename"]})
+                                sendResponse(client_socket, request_id, file_message, linked=True)
+                            else:
+                                sendResponse(client_socket, request_id, "Contents not on the server.", linked=False)
+                        except (TransferError, OSError) as e:
+                            sendError(client_socket, request_id, str(e))
+                    else:
+                        sendError(client_socket, request_id, "User not registered")
+
+                # Report how much of an interrupted upload the server already has
+                elif command == '/resume':
+                    if getClientAlias(client_socket):
+                        try:
+                            offset = getResumeOffset(server_directory, header.get("token"))
+                            sendResponse(client_socket, request_id, f"Resume from byte {offset}.", offset=offset)
+                        except TransferError as e:
+                            sendError(client_socket, request_id, str(e))
+                    else:
+                        sendError(client_socket, request_id, "User not registered")
+
+                # Describe a stored file's blocks so the client can send a new version as a delta
+                elif command == '/signature':
+                    if getClientAlias(client_socket):
+                        try:
+                            fields, signatures = getFileSignatures(header.get("filename") or "")
+                            sendResponse(client_socket, request_id, "Block signatures", signatures, **fields)
+                        except OSError:
+                            sendError(client_socket, request_id, "Error: File not found in the server.")
+                    else:
+                        sendError(client_socket, request_id, "User not registered")
+
+                # Report the server's metrics, to administrators on the server's own host
+                elif command == '/stats':
+                    if isLocalAddress(client_address):
+                        sendResponse(client_socket, request_id, "Server statistics", getStatsPayload())
+                    else:
+                        sendError(client_socket, request_id, "Error: /stats is only available on the server's host.")
+
                 else:
-                    print(f"Server: Command {command} received from {current_client}")
+                    sendError(client_socket, request_id, "Error: Command not found.")
+            finally:
+                recordCommand(command, started, client_socket, client_address)
+
+    # Clients that close their connection without /leave, such as extra segment connections, are not errors
+    except ConnectionError:
+        log.info("Client disconnected", extra={"alias": client_registry.getAlias(client_socket),
+                                               "address": client_address})
+    except Exception as e:
+        log.error("Client error: %s", e, extra={"alias": client_registry.getAlias(client_socket),
+                                                 "address": client_address})
+    finally:
+        # A client that dropped without /leave keeps its alias for a while to resume the session
+        client_registry.detach(client_socket)
 
-                    # Remove the client from the list of clients
-                    indexSocket = clients_socket_list.index(client_socket)
-                    clients_socket_list.pop(indexSocket)
 
-                    indexAlias = clients_alias_list.index(current_client)
-                    clients_alias_list.pop(indexAlias)
 
-                    # Check the list of sockets
-                    print(f"Current clients: {clients_alias_list}: {clients_socket_list}")
+# asyncio Engine
+# Serves the same command set as processClientCommands, but every client is a
+# coroutine on one event loop instead of a thread. Blocking file operations are
+# handed to the loop's default executor so they never stall other clients.
+async def sendResponseAsync(writer, request_id, message, payload=b"", **fields):
+    header = {"status": "ok", "message": message}
+    header.update(fields)
+    writer.write(protocol.encodeFrame(protocol.FRAME_RESPONSE, request_id, header, payload))
+    await writer.drain()
 
-                    server_response = "Connection closed. Thank you!"
-                    client_socket.send(server_response.encode())
-                    client_socket.close()
 
-                    print(f"Server: Client {current_client} has disconnected.")
-                    print(f"Current clients: {clients_alias_list}: {clients_socket_list}")
+async def sendErrorAsync(writer, request_id, message):
+    header = {"status": "error", "message": message}
+    writer.write(protocol.encodeFrame(protocol.FRAME_ERROR, request_id, header))
+    error_responses.inc()
+    await writer.drain()
 
-                # Break the loop to exit the thread
-                break
 
-            # Register a unique alias (or handle) for the client
-            if command == '/register':
-                print(f"Server: Command {command} received from {client_address}")
-                current_client = None
+async def processClientCommandsAsync(reader, writer):
+    loop = asyncio.get_running_loop()
+    client_address = writer.get_extra_info("peername")
 
-                alias = client_socket.recv(BUFFER_SIZE).decode()
+    # The writer stands in for the socket in the client lists
+    success_message = "Connection to the File Exchange Server is successful!"
+    log.info("Connection established", extra={"address": client_address})
+    countConnection("accepted")
+    active_connections.inc()
 
-                try:
-                    # Check if the client is already registered
-                    if alias in clients_alias_list:
-                        server_response = "Error: Registration failed. Handle or alias already exists."
-                        client_socket.send(server_response.encode())
+    try:
+        enableKeepalive(writer.get_extra_info("socket"))
+        await sendResponseAsync(writer, 0, success_message, features=getServerFeatures(delta=False))
+
+        while True:
+            frame_type, request_id, header, payload_length = await protocol.recvFrameHeadAsync(reader)
+            command = header.get("command")
+            current_client = getClientAlias(writer)
+
+            # Only an accepted /store consumes its payload; everything else drops it
+            accepts_payload = (frame_type == protocol.FRAME_REQUEST and command == '/store'
+                               and current_client is not False and header.get("filename"))
+
+            if not accepts_payload:
+                async for _ in protocol.recvChunksAsync(reader, payload_length):
+                    pass
+
+            # This engine advertises no codecs, so stray data frames are dropped silently
+            if frame_type == protocol.FRAME_DATA:
+                continue
+
+            if frame_type != protocol.FRAME_REQUEST:
+                await sendErrorAsync(writer, request_id, "Error: Expected a request frame.")
+                continue
+
+            started = time.perf_counter()
+
+            try:
+                if command == '/leave':
+                    client_registry.unregister(writer)
+
+                    await sendResponseAsync(writer, request_id, "Connection closed. Thank you!")
+                    log.info("Client disconnected", extra={"alias": current_client or None, "address": client_address,
+                                                           "clients": len(client_registry)})
+                    break
+
+                elif command == '/register':
+                    alias = header.get("alias")
+
+                    if not alias:
+                        await sendErrorAsync(writer, request_id, "Error: Registration failed. Please enter a handle or alias!")
+                    elif current_client is not False:
+                        await sendErrorAsync(writer, request_id, "Error: Registration failed. Client is already registered.")
                     else:
-                        print(f"Server: Alias {alias} received from {client_address}")
-
-                        # os.mkdir(alias)
-                        clients_alias_list.append(alias)
-                        clients_socket_list.append(client_socket)
-
-                        # For debugging
-                        print(f"Current clients: {clients_alias_list}: {clients_socket_list}")
-
-                        server_response = f"Welcome {alias}!"
-                        client_socket.send(server_response.encode())
-                except Exception as e:
-                    print(f"Server: Error: {str(e)}")
-                    server_response = f"Error: {str(e)}"
-                    client_socket.send(server_response.encode())
-
-            
-            # Store a file in the server
-            if command == '/store':
-                client = getClientAlias(client_socket)
-                
-                if client:
+                        session, resumed = claimAlias(alias, header.get("session"), writer, client_address)
+
+                        if session is None:
+                            await sendErrorAsync(writer, request_id, "Error: Registration failed. Handle or alias already exists.")
+                        else:
+                            log.info("Alias %s", "resumed" if resumed else "registered",
+                                     extra={"alias": alias, "address": client_address,
+                                            "clients": len(client_registry)})
+                            await sendResponseAsync(writer, request_id,
+                                                    f"Welcome back {alias}!" if resumed else f"Welcome {alias}!",
+                                                    session=session.token, resumed=resumed)
+
+                elif command == '/attach':
+                    alias = header.get("alias")
+
+                    if current_client is not False:
+                        await sendErrorAsync(writer, request_id, "Error: Attach failed. Client is already registered.")
+                    elif client_registry.attach(alias, header.get("session"), writer) is None:
+                        await sendErrorAsync(writer, request_id, "Error: Attach failed. Unknown alias or session.")
+                    else:
+                        log.info("Connection attached", extra={"alias": alias, "address": client_address})
+                        await sendResponseAsync(writer, request_id, f"Attached to {alias}.")
+
+                elif command in ('/store', '/dir', '/get', '/resume', '/link') and current_client is False:
+                    await sendErrorAsync(writer, request_id, "User not registered")
+
+                elif command == '/store':
+                    filename = header.get("filename")
+
+                    if not filename:
+                        await sendErrorAsync(writer, request_id, "Error: Command parameters do not match or is not allowed.")
+                        continue
+
                     try:
-                        filename = client_socket.recv(BUFFER_SIZE).decode()
+                        dir_path = os.path.join(server_directory, getStoredName(filename))
+                        os.makedirs(server_directory, exist_ok=True)
+                        if header.get("encoding") is not None:
+                            raise TransferError("Error: Unsupported encoding.")
+                        if header.get("delta") is not None:
+                            raise TransferError("Error: Delta uploads are not supported.")
 
-                        # Create Server Directory if it does not exist
-                        try:
-                            os.mkdir(server_directory)
-                        except:
+                        current_file, temp_path, _, completes_upload = await loop.run_in_executor(
+                            None, openUpload, server_directory, header, payload_length)
+                    except (TransferError, OSError) as e:
+                        async for _ in protocol.recvChunksAsync(reader, payload_length):
                             pass
+                        await sendErrorAsync(writer, request_id, str(e))
+                        continue
 
-                        save_dir = server_directory
-                        receiveFile(client_socket, filename, save_dir)
+                    # Stream the body to disk one chunk at a time
+                    chunks = protocol.recvChunksAsync(reader, payload_length, budget=transfer_budget)
 
+                    try:
+                        async for chunk in chunks:
+                            await loop.run_in_executor(None, writeChunk, current_file, chunk)
+                            bytes_received.inc(len(chunk))
 
-                    except:
-                        client_socket.send("Error: Command parameters do not match or is not allowed.".encode())
-                else:
-                    client_socket.send("User not registered".encode())
-
-            if command == '/dir':
-                client = getClientAlias(client_socket)
-                
-                if client:
-                    directory = "Server Directory"
-                    isExist = os.path.exists(directory)
-                    
-                    if(isExist):
-                        files = os.listdir(directory)
-                        client_socket.send((directory + ": \n" + toString(files)).encode())
-                else:
-                    client_socket.send("User not registered".encode())
+                            if bandwidth_shaper is not None:
+                                await bandwidth_shaper.throttleAsync(current_client, len(chunk),
+                                                                     payload_length >= SMALL_TRANSFER)
+
+                        await loop.run_in_executor(None, current_file.close)
+                    except BaseException:
+                        await chunks.aclose()
+                        current_file.close()
+                        if header.get("token") is None and os.path.exists(temp_path):
+                            os.remove(temp_path)
+                        raise
+
+                    if not completes_upload:
+                        await sendResponseAsync(writer, request_id, f"Received part of {filename}.",
+                                                offset=os.path.getsize(temp_path))
+                        continue
+
+                    # Move the finished upload into place
+                    try:
+                        await loop.run_in_executor(None, commitUpload, temp_path, dir_path, header, current_client)
+                    except TransferError as e:
+                        await sendErrorAsync(writer, request_id, str(e))
+                        continue
+
+                    file_message = f"{current_client}<{getCurrentDateTime()}>: Uploaded {filename}"
+                    log.info("Stored %s", filename, extra={"alias": current_client, "file": filename,
+                                                           "bytes": payload_length})
+                    await sendResponseAsync(writer, request_id, file_message)
+
+                # Answered from memory, so the loop never waits on the directory
+                elif command == '/dir':
+                    try:
+                        response, listing = getDirectoryQueryResponse(header)
+                    except ValueError as e:
+                        await sendErrorAsync(writer, request_id, str(e))
+                        continue
+
+                    writer.write(protocol.encodeFrameHead(protocol.FRAME_RESPONSE, request_id, response, len(listing)))
+                    writer.write(listing)
+                    bytes_sent.inc(len(listing))
+                    await writer.drain()
+
+                elif command == '/get':
+                    file = header.get("filename")
+
+                    if not file:
+                        await sendErrorAsync(writer, request_id, "Error: Command parameters do not match or is not allowed.")
+                        continue
+
+                    file_path = os.path.join(server_directory, os.path.basename(file))
+
+                    try:
+                        current_file, cached_data = await loop.run_in_executor(None, openServedFile, file_path)
+                    except OSError:
+                        await sendErrorAsync(writer, request_id, "Error: File not found in the server.")
+                        continue
+
+                    # Send the header with the range, then let the loop use sendfile for the body
+                    with current_file:
+                        if cached_data is not None:
+                            file_size = len(cached_data)
+                        else:
+                            file_size = os.fstat(current_file.fileno()).st_size
+
+                        try:
+                            start, end = resolveRange(header, file_size)
+                        except TransferError as e:
+                            await sendErrorAsync(writer, request_id, str(e))
+                            continue
+
+                        recordDownload(file, start, end, file_size)
+
+                        response = {"status": "ok", "message": "Sending File to Client",
+                                    "filename": os.path.basename(file), "size": file_size, "offset": start, "end": end}
+                        writer.write(protocol.encodeFrameHead(protocol.FRAME_RESPONSE, request_id, response, end - start))
+                        await writer.drain()
+
+                        # Without rate limits a file on disk goes out in one step; cached bytes are copied
+                        # into the transport's buffer, so they go a step at a time held against the budget
+                        if bandwidth_shaper is not None or cached_data is not None:
+                            step = SHAPING_STEP
+                        else:
+                            step = max(1, end - start)
+
+                        for offset in range(start, end, step):
+                            count = min(step, end - offset)
+
+                            if bandwidth_shaper is not None:
+                                await bandwidth_shaper.throttleAsync(current_client, count,
+                                                                     end - start >= SMALL_TRANSFER)
+
+                            if cached_data is not None:
+                                if transfer_budget is not None:
+                                    await transfer_budget.acquireAsync(count)
+
+                                try:
+                                    writer.write(memoryview(cached_data)[offset:offset + count])
+                                    await writer.drain()
+                                finally:
+                                    if transfer_budget is not None:
+                                        transfer_budget.release(count)
+                            else:
+                                await loop.sendfile(writer.transport, current_file, offset, count)
+
+                        bytes_sent.inc(end - start)
+
+                elif command == '/link':
+                    try:
+                        if await loop.run_in_executor(None, linkStoredFile, header, current_client):
+                            file_message = f"{current_client}<{getCurrentDateTime()}>: Uploaded {header['filename']}"
+                            log.info("Linked %s", header["filename"],
+                                     extra={"alias": current_client, "file": header["filename"]})
+                            await sendResponseAsync(writer, request_id, file_message, linked=True)
+                        else:
+                            await sendResponseAsync(writer, request_id, "Contents not on the server.", linked=False)
+                    except (TransferError, OSError) as e:
+                        await sendErrorAsync(writer, request_id, str(e))
+
+                elif command == '/resume':
+                    try:
+                        offset = getResumeOffset(server_directory, header.get("token"))
+                        await sendResponseAsync(writer, request_id, f"Resume from byte {offset}.", offset=offset)
+                    except TransferError as e:
+                        await sendErrorAsync(writer, request_id, str(e))
+
+                elif command == '/stats':
+                    if isLocalAddress(client_address):
+                        await sendResponseAsync(writer, request_id, "Server statistics", getStatsPayload())
+                    else:
+                        await sendErrorAsync(writer, request_id, "Error: /stats is only available on the server's host.")
 
-            if command == '/get':
-                if getClientAlias(client_socket):
-                    _, file = command.split()
-                    fetchFile(client_socket, file)
-                
                 else:
-                    client_socket.send("User not registered".encode())
-            
+                    await sendErrorAsync(writer, request_id, "Error: Command not found.")
+            finally:
+                recordCommand(command, started, writer, client_address)
+
+    except (asyncio.IncompleteReadError, ConnectionError):
+        log.info("Client disconnected", extra={"alias": client_registry.getAlias(writer), "address": client_address})
     except Exception as e:
-        print(f"Server: Error: {str(e)}")
+        log.error("Client error: %s", e, extra={"alias": client_registry.getAlias(writer), "address": client_address})
+    finally:
+        active_connections.dec()
+        client_registry.detach(writer)
+        writer.close()
+
 
+async def startAsyncServer(IP, PORT):
+    prepareServerDirectory()
+    threading.Thread(target=sweepSessions, daemon=True).start()
 
+    server = await asyncio.start_server(processClientCommandsAsync, IP, PORT, backlog=listen_backlog)
+
+    log.info("Listening on %s:%d (asyncio engine)", IP, PORT)
+
+    async with server:
+        await server.serve_forever()
 
 
 if __name__ == "__main__":
@@ -271,9 +1539,71 @@ if __name__ == "__main__":
             print("Error: Please provide an IP address and a port number.")
             sys.exit(1)
 
-        # Get the IP address and port number from the command-line arguments
-        IP = sys.argv[1]
-        PORT = int(sys.argv[2])
+        # Get the IP address, port number and options from the command-line arguments
+        parser = argparse.ArgumentParser(description="File Exchange System server")
+        parser.add_argument("ip")
+        parser.add_argument("port")
+        parser.add_argument("--engine", choices=["threaded", "asyncio"], default="threaded",
+                            help="bounded worker pool (default) or a single asyncio event loop")
+        parser.add_argument("--backlog", type=int, default=listen_backlog,
+                            help="listen backlog for pending connections")
+        parser.add_argument("--workers", type=int, default=worker_count,
+                            help="worker threads for the threaded engine")
+        parser.add_argument("--queue-size", type=int, default=queue_size,
+                            help="connections that may wait for a worker before new ones are rejected")
+        parser.add_argument("--retry-after", type=int, default=retry_after_ms,
+                            help="retry hint in milliseconds sent to rejected clients")
+        parser.add_argument("--cache-size", type=int, default=64,
+                            help="MiB of memory for caching frequently downloaded files (0 to disable)")
+        parser.add_argument("--variant-threshold", type=int, default=3,
+                            help="Compressed /get requests before a file's compressed copy is built (0 to disable)")
+        parser.add_argument("--session-ttl", type=int, default=client_registry.session_ttl,
+                            help="seconds a dropped client's alias is kept for it to resume")
+        parser.add_argument("--dedup", action="store_true",
+                            help="store each distinct file body once, with names linked to it")
+        parser.add_argument("--metrics-port", type=int, default=None,
+                            help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+        parser.add_argument("--log-level", choices=LEVELS, default="info",
+                            help="least severe log records written (debug adds one record per request)")
+        parser.add_argument("--log-format", choices=FORMATS, default="text",
+                            help="console lines (default) or one JSON object per line")
+        parser.add_argument("--log-file", default=None,
+                            help="append the log to this file instead of standard output")
+        parser.add_argument("--buffer-budget", type=int, default=64,
+                            help="MiB of transfer buffers held at once before transfers wait (0 for no limit)")
+        parser.add_argument("--rate-limit", type=float, default=0,
+                            help="MiB/s for all transfers together, shared fairly between aliases (0 for none)")
+        parser.add_argument("--client-rate-limit", type=float, default=0,
+                            help="MiB/s for the transfers of each alias (0 for none)")
+        parser.add_argument("--alias-rate", type=parseAliasValue, action="append", default=[], metavar="ALIAS=MIBS",
+                            help="MiB/s for one alias, instead of --client-rate-limit (repeatable)")
+        parser.add_argument("--alias-weight", type=parseAliasValue, action="append", default=[], metavar="ALIAS=WEIGHT",
+                            help="share of --rate-limit for one alias relative to the default of 1 (repeatable)")
+        args = parser.parse_args()
+
+        listen_backlog = args.backlog
+        worker_count = args.workers
+        queue_size = args.queue_size
+        retry_after_ms = args.retry_after
+        client_registry.session_ttl = args.session_ttl
+
+        if args.dedup:
+            content_store = ContentStore(server_directory)
+
+        file_cache = FileCache(args.cache_size * 1024 * 1024) if args.cache_size > 0 else None
+
+        transfer_budget = BufferBudget(args.buffer_budget * 1024 * 1024) if args.buffer_budget > 0 else None
+
+        alias_rates = {alias: rate * 1024 * 1024 for alias, rate in args.alias_rate}
+        if args.rate_limit > 0 or args.client_rate_limit > 0 or alias_rates:
+            bandwidth_shaper = BandwidthShaper(args.rate_limit * 1024 * 1024, args.client_rate_limit * 1024 * 1024,
+                                               alias_rates, dict(args.alias_weight))
+
+        if args.variant_threshold > 0:
+            variant_store = VariantStore(server_directory, args.variant_threshold)
+
+        IP = args.ip
+        PORT = int(args.port)
 
         # Validate IP address
         try:
@@ -289,11 +1619,25 @@ if __name__ == "__main__":
 
         # Display welcome message
         displayWelcomeMessage()
-        startServer(IP, PORT)
-    
+        setupLogging(args.log_level, args.log_format, args.log_file)
+
+        if bandwidth_shaper is not None:
+            log.info("Rate limits: %s overall, %s per alias, %d aliases with their own",
+                     f"{args.rate_limit:g} MiB/s" if args.rate_limit > 0 else "none",
+                     f"{args.client_rate_limit:g} MiB/s" if args.client_rate_limit > 0 else "none", len(alias_rates))
+
+        if args.metrics_port is not None:
+            startHttpServer(metrics, args.metrics_port)
+            log.info("Metrics at http://127.0.0.1:%d/metrics", args.metrics_port)
+
+        if args.engine == "asyncio":
+            asyncio.run(startAsyncServer(IP, PORT))
+        else:
+            startServer(IP, PORT)
+
     except socket.error as se:
-        print(f"Server: Socket error: {se}")
+        log.error("Socket error: %s", se)
     except ValueError as ve:
-        print(f"Server: Invalid port number: {ve}")
+        log.error("Invalid port number: %s", ve)
     except Exception as e:
-        print(f"Server: Error: {str(e)}")
+        log.error("Error: %s", e)
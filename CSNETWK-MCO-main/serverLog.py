@@ -0,0 +1,316 @@
+'''
+    Server Log
+    This module contains the logging of the File Exchange System server.
+    Request threads and coroutines only hand each record to a bounded
+    queue; a background thread formats it, as plain text or as one JSON
+    object per line, and writes it out. A full queue drops records rather
+    than holding up a transfer, and warnings and errors repeated from the
+    same line of code are rate-limited so a flood of failing clients
+    cannot flood the log.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import atexit                       # For flushing the log on exit
+import json                         # For JSON-lines output
+import logging                      # For levels, records and handlers
+import sys                          # For logging to the console
+import threading                    # For the writer thread and the counter locks
+import time                         # For timestamps and rate-limit windows
+from collections import deque       # For the record queue
+
+
+# Global Variables
+LOGGER_NAME         = "fes"
+LEVELS              = ("debug", "info", "warning", "error")
+FORMATS             = ("text", "json")
+QUEUE_SIZE          = 10000     # Records waiting for the writer before new ones are dropped
+ERROR_BURST         = 5         # Warnings and errors with the same message let through in each window
+ERROR_INTERVAL      = 10.0      # Seconds in a rate-limit window
+WRITE_INTERVAL      = 0.05      # Seconds between the writer's passes over the queue
+WRITE_BATCH         = 1000      # Records joined into one write at most
+
+# Structured fields a record may carry through extra=, in output order
+FIELDS = ("alias", "address", "command", "file", "duration_ms", "bytes", "wire_bytes", "codec",
+          "mb_per_s", "clients", "suppressed")
+
+queue_handler = None        # DroppingQueueHandler once setupLogging has run
+rate_limiter = None         # ErrorRateLimiter once setupLogging has run
+
+
+def formatAddress(address):
+    # Socket addresses are tuples; logs show them as host:port
+    if isinstance(address, tuple) and len(address) >= 2:
+        return f"{address[0]}:{address[1]}"
+
+    return address
+
+
+def transferFields(stats):
+    """
+    Returns the structured fields of a finished compression.TransferStats
+    """
+    return {"bytes": stats.raw_bytes, "wire_bytes": stats.wire_bytes, "codec": stats.codec,
+            "mb_per_s": round(stats.throughput() / 1e6, 2)}
+
+
+def getRecordFields(record):
+    fields = {}
+
+    for field in FIELDS:
+        value = getattr(record, field, None)
+
+        if value is not None:
+            fields[field] = formatAddress(value) if field == "address" else value
+
+    return fields
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats each record as one JSON object."""
+
+    def format(self, record):
+        entry = {"ts": round(record.created, 6), "level": record.levelname.lower(), "event": record.getMessage()}
+        entry.update(getRecordFields(record))
+
+        if record.exc_info:
+            entry["traceback"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Formats each record as a console line with its fields appended."""
+
+    def __init__(self):
+        super().__init__()
+        self._second = None
+        self._timestamp = None
+
+    def format(self, record):
+        # Records arrive in order, so the timestamp is only formatted again once the second changes
+        second = int(record.created)
+
+        if second != self._second:
+            self._second = second
+            self._timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(second))
+
+        timestamp = self._timestamp
+        fields = " ".join(f"{key}={value}" for key, value in getRecordFields(record).items())
+        line = f"{timestamp} {record.levelname:<7} Server: {record.getMessage()}"
+
+        if fields:
+            line += f" [{fields}]"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+
+        return line
+
+
+class QueuedRecord(logging.LogRecord):
+    """
+    A log record holding only what the formatters use, which is about
+    half the work of a full LogRecord to create
+    """
+
+    def __init__(self, name, level, msg, args, exc_info):
+        self.name = name
+        self.levelno = level
+        self.levelname = logging.getLevelName(level)
+        self.msg = msg
+        self.args = args
+        self.exc_info = exc_info
+        self.exc_text = None
+        self.stack_info = None
+        self.created = time.time()
+
+
+class ServerLogger(logging.Logger):
+    """
+    A logger whose records are QueuedRecords and that does not look up
+    the file and line of each call, which would walk the stack every time
+    """
+
+    def findCaller(self, stack_info=False, stacklevel=1):
+        return "(unknown file)", 0, "(unknown function)", None
+
+    def makeRecord(self, name, level, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
+        record = QueuedRecord(name, level, msg, args, exc_info)
+
+        if extra:
+            record.__dict__.update(extra)
+
+        return record
+
+
+class ErrorRateLimiter(logging.Filter):
+    """
+    Lets through at most burst warnings and errors with the same message
+    template every interval seconds. The first record let through after a
+    window carries how many were suppressed during it.
+    """
+
+    def __init__(self, burst=ERROR_BURST, interval=ERROR_INTERVAL):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.suppressed = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+
+        # The template is the same for every record logged by one call, whatever its arguments
+        key = (record.levelno, record.msg)
+        now = time.monotonic()
+
+        with self._lock:
+            window = self._windows.get(key)
+
+            # Each window keeps [start, records let through, records suppressed]
+            if window is None or now - window[0] >= self.interval:
+                if window is not None and window[2]:
+                    record.suppressed = window[2]
+
+                self._windows[key] = [now, 1, 0]
+                return True
+
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+
+            window[2] += 1
+            self.suppressed += 1
+
+        return False
+
+
+class DroppingQueueHandler(logging.Handler):
+    """
+    Hands records to the writer thread without ever blocking the caller.
+    Records go on a deque, whose appends need no lock, and records that
+    arrive while it holds queue_size of them are counted and dropped.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        super().__init__()
+        self.records = deque()
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+
+    def handle(self, record):
+        # Unlike Handler.handle, no lock is taken around emit
+        if self.filter(record):
+            self.emit(record)
+
+    def emit(self, record):
+        if len(self.records) < self.queue_size:
+            self.records.append(record)
+        else:
+            with self._drop_lock:
+                self.dropped += 1
+
+
+class LogWriter:
+    """
+    Formats and writes queued records on a background thread. Every
+    interval seconds it takes all the records waiting and writes them
+    with one flush, so request threads are not interrupted for each record.
+    """
+
+    def __init__(self, records, stream, formatter, interval=WRITE_INTERVAL):
+        self.records = records
+        self.stream = stream
+        self.formatter = formatter
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        # Everything queued before the stop is still written
+        self._stopping.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self._writeWaiting()
+
+        self._writeWaiting()
+
+    def _writeWaiting(self):
+        while self.records:
+            lines = []
+
+            while self.records and len(lines) < WRITE_BATCH:
+                lines.append(self._format(self.records.popleft()))
+
+            self.stream.write("\n".join(lines) + "\n")
+
+        self.stream.flush()
+
+    def _format(self, record):
+        try:
+            return self.formatter.format(record)
+        except Exception as e:
+            return f"Unformattable log record {record.msg!r}: {e}"
+
+
+log = ServerLogger(LOGGER_NAME)
+
+
+def setupLogging(level="info", output_format="text", path=None, queue_size=QUEUE_SIZE,
+                 burst=ERROR_BURST, interval=ERROR_INTERVAL):
+    """
+    Sends the server's log records through a background writer
+
+    Parameters:
+    - level: One of LEVELS
+    - output_format: "text" for console lines or "json" for one JSON object per line
+    - path: File to append the log to, or None for standard output
+    - queue_size: Records that may wait for the writer before new ones are dropped
+    - burst, interval: Warnings and errors with the same message let through in each window
+
+    Returns:
+    - The DroppingQueueHandler records are handed to
+    """
+    global queue_handler
+    global rate_limiter
+
+    stream = open(path, "a", encoding="utf-8") if path else sys.stdout
+    formatter = JsonLinesFormatter() if output_format == "json" else TextFormatter()
+
+    rate_limiter = ErrorRateLimiter(burst, interval)
+    queue_handler = DroppingQueueHandler(queue_size)
+    queue_handler.addFilter(rate_limiter)
+
+    writer = LogWriter(queue_handler.records, stream, formatter)
+    writer.start()
+    atexit.register(writer.stop)
+
+    log.handlers = [queue_handler]
+    log.setLevel(level.upper())
+
+    return queue_handler
+
+
+def getStats():
+    """
+    Returns a dictionary of records dropped, records suppressed and
+    records waiting for the writer
+    """
+    if queue_handler is None:
+        return {"dropped": 0, "suppressed": 0, "queued": 0}
+
+    return {"dropped": queue_handler.dropped, "suppressed": rate_limiter.suppressed,
+            "queued": len(queue_handler.records)}
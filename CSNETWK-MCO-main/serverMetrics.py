@@ -0,0 +1,286 @@
+'''
+    Server Metrics
+    This module contains the counters, gauges and histograms the File
+    Exchange System server keeps about itself. Every metric is created at
+    startup with its full set of label values and, for histograms, its
+    bucket bounds, so recording a request only updates numbers in lists
+    that already exist. The registry renders the metrics in the Prometheus
+    text format, for the optional HTTP endpoint, or as a dictionary for the
+    /stats command.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import bisect                       # For finding a histogram bucket
+import threading                    # For the metric locks and the HTTP thread
+import time                         # For the uptime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # For the metrics endpoint
+
+
+# Global Variables
+LATENCY_BUCKETS     = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DISK_WRITE_BUCKETS  = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUANTILES           = (0.5, 0.9, 0.99)
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metric:
+    """
+    A metric with one value per label value (or a single value without a label)
+
+    Parameters:
+    - name: Metric name, e.g. fes_commands_total
+    - help: One-line description
+    - label: Label name, or None for a metric without labels
+    - label_values: Every value the label may take
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name, help, label=None, label_values=()):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.label_values = tuple(label_values) if label else (None,)
+        self._index = {value: index for index, value in enumerate(self.label_values)}
+        self._lock = threading.Lock()
+
+    def formatLabels(self, value, extra=""):
+        pairs = []
+
+        if self.label:
+            pairs.append(f'{self.label}="{value}"')
+        if extra:
+            pairs.append(extra)
+
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+    """A value that only goes up."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, label=None, label_values=()):
+        super().__init__(name, help, label, label_values)
+        self.values = [0] * len(self.label_values)
+
+    def inc(self, amount=1, label=None):
+        index = self._index[label]
+
+        with self._lock:
+            self.values[index] += amount
+
+    def get(self, label=None):
+        return self.values[self._index[label]]
+
+    def render(self):
+        return [f"{self.name}{self.formatLabels(value)} {self.values[index]}"
+                for index, value in enumerate(self.label_values)]
+
+    def snapshot(self):
+        if not self.label:
+            return self.values[0]
+
+        return dict(zip(self.label_values, self.values))
+
+
+class Gauge(Counter):
+    """A value that goes up and down."""
+
+    kind = "gauge"
+
+    def dec(self, amount=1, label=None):
+        self.inc(-amount, label)
+
+    def set(self, value, label=None):
+        self.values[self._index[label]] = value
+
+
+class Histogram(Metric):
+    """
+    Observations counted into fixed buckets, with their sum and count
+
+    Parameters:
+    - buckets: Upper bounds of the buckets in ascending order; a last
+      bucket for everything larger is added
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets, label=None, label_values=()):
+        super().__init__(name, help, label, label_values)
+        self.buckets = tuple(buckets)
+        self.counts = [[0] * (len(self.buckets) + 1) for _ in self.label_values]
+        self.sums = [0.0] * len(self.label_values)
+        self.totals = [0] * len(self.label_values)
+
+    def observe(self, value, label=None):
+        index = self._index[label]
+        bucket = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[index][bucket] += 1
+            self.sums[index] += value
+            self.totals[index] += 1
+
+    def quantile(self, q, label=None):
+        """
+        Estimates a quantile as the upper bound of the bucket it falls in,
+        or None without observations (or if it falls past the last bound)
+        """
+        index = self._index[label]
+        total = self.totals[index]
+
+        if total == 0:
+            return None
+
+        rank = q * total
+        seen = 0
+
+        for bucket, count in enumerate(self.counts[index]):
+            seen += count
+            if seen >= rank:
+                return self.buckets[bucket] if bucket < len(self.buckets) else None
+
+        return None
+
+    def render(self):
+        lines = []
+
+        for index, value in enumerate(self.label_values):
+            cumulative = 0
+
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts[index]):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{self.formatLabels(value, le)} {cumulative}")
+
+            lines.append(f"{self.name}_sum{self.formatLabels(value)} {self.sums[index]}")
+            lines.append(f"{self.name}_count{self.formatLabels(value)} {self.totals[index]}")
+
+        return lines
+
+    def snapshot(self):
+        values = {}
+
+        for index, value in enumerate(self.label_values):
+            if self.label and self.totals[index] == 0:
+                continue
+
+            summary = {"count": self.totals[index], "sum": self.sums[index]}
+            for q in QUANTILES:
+                summary[f"p{int(q * 100)}"] = self.quantile(q, value)
+
+            values[value] = summary
+
+        return values if self.label else values[None]
+
+
+class MetricsRegistry:
+    """
+    The metrics of one server, plus collectors that report values other
+    components already keep (such as cache statistics) when the metrics
+    are read rather than on every request
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, label=None, label_values=()):
+        return self._add(Counter(name, help, label, label_values))
+
+    def gauge(self, name, help, label=None, label_values=()):
+        return self._add(Gauge(name, help, label, label_values))
+
+    def histogram(self, name, help, buckets, label=None, label_values=()):
+        return self._add(Histogram(name, help, buckets, label, label_values))
+
+    def addCollector(self, collect):
+        """
+        Adds a callable returning a list of (name, kind, help, value)
+        tuples, where kind is "counter" or "gauge"
+        """
+        self._collectors.append(collect)
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def _collect(self):
+        collected = [("fes_uptime_seconds", "gauge", "Seconds since the server started.",
+                      time.time() - self.started)]
+
+        for collect in self._collectors:
+            collected.extend(collect())
+
+        return collected
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format
+        """
+        lines = []
+
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+
+        for name, kind, help, value in self._collect():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """
+        Returns every metric as a dictionary of plain values, with
+        histograms summarized as count, sum and estimated quantiles
+        """
+        values = {metric.name: metric.snapshot() for metric in self._metrics}
+
+        for name, _, _, value in self._collect():
+            values[name] = value
+
+        return values
+
+
+def startHttpServer(registry, port, host="127.0.0.1"):
+    """
+    Serves the registry's metrics at http://host:port/metrics on a
+    background thread
+
+    Returns:
+    - The ThreadingHTTPServer
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes would otherwise be printed to the console every few seconds
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
@@ -0,0 +1,264 @@
+'''
+    Variant Store
+    This module keeps pre-compressed copies of the files the File Exchange
+    System server is asked for most often. Once a file has been requested
+    with the same codec enough times, a background thread compresses it
+    once into a hidden variants directory, and later requests for the
+    whole file with that codec are served from the copy instead of being
+    compressed again. A variant carries the modification time of the file
+    it was built from, so a variant of a replaced file is never served.
+
+    CSNETWK S16 Group
+    Name:
+        - ABENOJA, Amelia Joyce L.
+        - HALLAR, Francine Marie F.
+        - SANG, Nathan Immanuel C.
+'''
+
+# Imports
+import hashlib                      # For checking variants against their originals
+import lzma                         # For the lzma decompression error
+import os                           # For file-related operations
+import queue                        # For the build queue
+import secrets                      # For unique temporary file names
+import threading                    # For the builder thread and the store lock
+import zlib                         # For the zlib decompression error
+
+import compression                  # For the codecs
+from serverLog import log
+
+
+# Global Variables
+VARIANT_LEVELS      = {"zlib": 9, "lzma": 6, "bz2": 9}   # Built once, so favour size over speed
+MIN_VARIANT_SIZE    = 1024 * 1024   # Smaller files are cheap enough to compress per request
+READ_SIZE           = 1024 * 1024
+
+
+class VariantStore:
+    """
+    Pre-compressed copies of frequently requested files, one per codec
+
+    Parameters:
+    - save_dir: Directory holding the original files
+    - threshold: Requests for a file with a codec before its variant is built
+    - variants_dir_name: Hidden subdirectory of save_dir holding the variants
+    """
+
+    def __init__(self, save_dir, threshold=3, variants_dir_name=".variants"):
+        self.save_dir = save_dir
+        self.threshold = threshold
+        self.variants_dir = os.path.join(save_dir, variants_dir_name)
+        self._lock = threading.Lock()
+        self._counts = {}           # (name, codec) to (mtime_ns, requests)
+        self._skipped = set()       # (name, codec, mtime_ns) found not worth compressing
+        self._pending = set()       # (name, codec) queued or being built
+        self._builds = queue.Queue()
+        self.built = 0
+        self.served = 0
+
+        threading.Thread(target=self._buildVariants, daemon=True).start()
+
+    def getVariantPath(self, name, codec):
+        return os.path.join(self.variants_dir, codec, name)
+
+    def open(self, name, codec, stat):
+        """
+        Opens the variant of a file if it was built from this version of it
+
+        Parameters:
+        - stat: os.stat result of the original file
+
+        Returns:
+        - A binary file object, or None if there is no current variant
+        """
+        try:
+            variant = open(self.getVariantPath(name, codec), "rb")
+        except OSError:
+            return None
+
+        if os.fstat(variant.fileno()).st_mtime_ns != stat.st_mtime_ns:
+            variant.close()
+            return None
+
+        with self._lock:
+            self.served += 1
+
+        return variant
+
+    def recordAccess(self, name, codec, stat):
+        """
+        Counts a request for a file with a codec, queueing a build of its
+        variant once the file crosses the threshold
+        """
+        if stat.st_size < MIN_VARIANT_SIZE or codec not in VARIANT_LEVELS:
+            return
+
+        key = (name, codec)
+
+        with self._lock:
+            if key in self._pending or (name, codec, stat.st_mtime_ns) in self._skipped:
+                return
+
+            mtime_ns, requests = self._counts.get(key, (stat.st_mtime_ns, 0))
+
+            # Requests for an older version of the file do not count
+            if mtime_ns != stat.st_mtime_ns:
+                requests = 0
+
+            requests += 1
+
+            if requests < self.threshold:
+                self._counts[key] = (stat.st_mtime_ns, requests)
+                return
+
+            self._counts.pop(key, None)
+            self._pending.add(key)
+
+        self._builds.put(key)
+
+    def invalidate(self, name):
+        """
+        Removes the variants of a file that was replaced
+        """
+        with self._lock:
+            for key in [key for key in self._counts if key[0] == name]:
+                del self._counts[key]
+
+            self._skipped = {key for key in self._skipped if key[0] != name}
+
+        for codec in VARIANT_LEVELS:
+            try:
+                os.remove(self.getVariantPath(name, codec))
+            except FileNotFoundError:
+                pass
+
+    def _buildVariants(self):
+        while True:
+            name, codec = self._builds.get()
+
+            try:
+                self._build(name, codec)
+            except OSError as e:
+                log.error("Could not build the %s variant of %s: %s", codec, name, e, extra={"file": name})
+            finally:
+                with self._lock:
+                    self._pending.discard((name, codec))
+
+    def _build(self, name, codec):
+        source_path = os.path.join(self.save_dir, name)
+        codec_dir = os.path.join(self.variants_dir, codec)
+        os.makedirs(codec_dir, exist_ok=True)
+
+        temp_path = os.path.join(codec_dir, "." + secrets.token_hex(16) + ".tmp")
+
+        try:
+            with open(source_path, "rb") as source, open(temp_path, "wb") as variant:
+                stat = os.fstat(source.fileno())
+
+                if not compression.isCompressible(source.read(compression.SAMPLE_SIZE)):
+                    with self._lock:
+                        self._skipped.add((name, codec, stat.st_mtime_ns))
+                    return
+
+                source.seek(0)
+                compressor = compression.createCompressor(codec, VARIANT_LEVELS[codec])
+                digest = hashlib.sha256()
+
+                for block in iter(lambda: source.read(READ_SIZE), b""):
+                    digest.update(block)
+                    variant.write(compressor.compress(block))
+
+                variant.write(compressor.flush())
+
+            if not checkVariant(temp_path, codec, stat.st_size, digest.digest()):
+                log.error("The %s variant of %s does not decompress to the original", codec, name,
+                          extra={"file": name, "codec": codec})
+                with self._lock:
+                    self._skipped.add((name, codec, stat.st_mtime_ns))
+                return
+
+            # A file replaced while it was being compressed leaves its variant unused
+            current = os.stat(source_path)
+
+            if (current.st_mtime_ns, current.st_size) != (stat.st_mtime_ns, stat.st_size):
+                return
+
+            os.utime(temp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(temp_path, self.getVariantPath(name, codec))
+
+            with self._lock:
+                self.built += 1
+
+            log.info("Built the %s variant of %s", codec, name,
+                     extra={"file": name, "codec": codec, "bytes": stat.st_size,
+                            "wire_bytes": os.path.getsize(self.getVariantPath(name, codec))})
+        finally:
+            if os.path.lexists(temp_path):
+                os.remove(temp_path)
+
+    def collectGarbage(self):
+        """
+        Removes variants whose original file was deleted or replaced
+
+        Returns:
+        - The number of variants removed
+        """
+        removed = 0
+
+        for codec in VARIANT_LEVELS:
+            codec_dir = os.path.join(self.variants_dir, codec)
+
+            if not os.path.isdir(codec_dir):
+                continue
+
+            for name in os.listdir(codec_dir):
+                variant_path = os.path.join(codec_dir, name)
+
+                try:
+                    current = os.stat(os.path.join(self.save_dir, name)).st_mtime_ns
+                except FileNotFoundError:
+                    current = None
+
+                if name.startswith(".") or current != os.stat(variant_path).st_mtime_ns:
+                    os.remove(variant_path)
+                    removed += 1
+
+        return removed
+
+    def getStats(self):
+        with self._lock:
+            return {"built": self.built, "served": self.served, "pending": len(self._pending)}
+
+
+# Function Definitions
+def checkVariant(path, codec, size, digest):
+    """
+    Decompresses a variant the way a client receives it, one data frame at
+    a time followed by the empty end of the body, and compares the result
+    with the original
+
+    Parameters:
+    - size: Size of the original file
+    - digest: SHA-256 digest of the original file
+
+    Returns:
+    - True if the variant decompresses to the original
+    """
+    decompressor = compression.createDecompressor(codec)
+    produced = 0
+    check = hashlib.sha256()
+
+    try:
+        with open(path, "rb") as variant:
+            for frame in iter(lambda: variant.read(compression.MAX_DATA_FRAME), b""):
+                for piece in compression.iterDecompress(decompressor, frame):
+                    produced += len(piece)
+                    check.update(piece)
+
+            for piece in compression.iterDecompress(decompressor, b""):
+                produced += len(piece)
+                check.update(piece)
+    except (EOFError, ValueError, zlib.error, lzma.LZMAError):
+        return False
+
+    return decompressor.eof and produced == size and check.digest() == digest